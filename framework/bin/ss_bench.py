@@ -0,0 +1,191 @@
+import os
+import csv
+import glob
+import time
+import shutil
+import filecmp
+import subprocess
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from ss_sweep import build_variant
+from ss_convert import count_trace_rows
+
+# Build profiles of the generated Makefile, the first one is the reference of the gains
+PROFILES = ["debug", "release", "native", "pgo"]
+
+# Columns of <output_folder>/bench_results.csv
+RESULT_COLUMNS = ["algorithm", "profile", "built", "seconds", "rows", "rows_per_sec", "gain", "same_output"]
+
+
+def load_algorithms(workspaces_file):
+    """
+    Read the ready workspaces of a workspaces.csv written by ss_prepare.py.
+    :return: List of (name, keyword, workspace) tuples.
+    """
+    with open(workspaces_file, 'r', newline='') as infile:
+        rows = [row for row in csv.DictReader(infile) if row["ready"] == "1"]
+    index_dir = os.path.dirname(os.path.abspath(workspaces_file))
+    return [(os.path.relpath(row["workspace"], index_dir), row["keyword"], row["workspace"]) for row in rows]
+
+
+def time_replay(executable, input_files, output_dir, repeat=3, output_format="text"):
+    """
+    Replay the traces in one batch process of the test binary, repeat times.
+    :param output_format: Output format of the harness, text or npy.
+    :return: Best wall-clock time in seconds, or None if the binary failed.
+    """
+    best = None
+    for _ in range(repeat):
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+        start = time.perf_counter()
+        process = subprocess.run([executable, "-F", output_format, "-o", output_dir, *input_files],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def same_outputs(output_dir, reference_dir):
+    """True if both directories hold the same files with the same content."""
+    names = sorted(os.listdir(reference_dir))
+    if names != sorted(os.listdir(output_dir)):
+        return False
+    _, mismatch, errors = filecmp.cmpfiles(reference_dir, output_dir, names, shallow=False)
+    return not mismatch and not errors
+
+
+def bench_algorithm(name, keyword, test_dir, input_files, train, output_folder, profiles, repeat=3,
+                    output_format="text"):
+    """
+    Build the test binary of one algorithm with every profile and time its replay of the traces.
+    The outputs of each profile are compared with the ones of the first profile.
+    :param train: Traces replayed to train the pgo profile.
+    :return: List of result rows, one per profile (see RESULT_COLUMNS).
+    """
+    algorithm_dir = os.path.join(output_folder, name)
+    rows = sum(count_trace_rows(input_file) for input_file in input_files)
+    train_args = [f"TRAIN={' '.join(os.path.abspath(trace) for trace in train)}"]
+
+    # Step 1: Build the profiles in parallel; the timings below run one at a time
+    with ThreadPoolExecutor(max_workers=len(profiles)) as pool:
+        builds = list(pool.map(
+            lambda profile: build_variant(keyword, test_dir, os.path.join(algorithm_dir, profile), [],
+                                          [f"PROFILE={profile}"] + train_args),
+            profiles))
+
+    # Step 2: Time each profile and check that it gives the outputs of the reference profile
+    results = []
+    reference = None
+    base_rate = None
+    for profile, (built, executable) in zip(profiles, builds):
+        if not built:
+            print(f"Error building {name} ({profile}): {executable}")
+            results.append([name, profile, 0, None, rows, None, None, None])
+            continue
+
+        output_dir = os.path.join(algorithm_dir, profile, "out")
+        seconds = time_replay(executable, input_files, output_dir, repeat, output_format)
+        if seconds is None:
+            print(f"Error: {name} ({profile}) failed to replay the traces")
+            results.append([name, profile, 1, None, rows, None, None, None])
+            continue
+
+        rate = rows / seconds if seconds > 0 else None
+        if reference is None:
+            reference, base_rate = output_dir, rate
+        same = int(same_outputs(output_dir, reference))
+        gain = rate / base_rate if rate and base_rate else None
+        results.append([name, profile, 1, seconds, rows, rate, gain, same])
+    return results
+
+
+def print_table(results):
+    """Print the rows/sec of every algorithm and profile, with the gain over the reference profile."""
+    width = max([len("algorithm")] + [len(row[0]) for row in results])
+    print(f"\n{'algorithm':<{width}}  {'profile':<8} {'seconds':>9} {'rows/sec':>12} {'gain':>7}  output")
+    for name, profile, built, seconds, rows, rate, gain, same in results:
+        if seconds is None:
+            print(f"{name:<{width}}  {profile:<8} {'failed' if built else 'not built':>9}")
+            continue
+        print(f"{name:<{width}}  {profile:<8} {seconds:>9.3f} {rate or 0:>12,.0f} {gain or 0:>6.2f}x  "
+              f"{'same' if same else 'DIFFERENT'}")
+
+
+def run_bench(algorithms, input_folder, output_folder, train=None, profiles=PROFILES, repeat=3, output_format="text"):
+    """
+    Benchmark the build profiles of each algorithm over the .csv traces of the input folder
+    and write the results to <output_folder>/bench_results.csv.
+    :param algorithms: List of (name, keyword, test directory) tuples.
+    :param train: Traces replayed to train the pgo profile (default: the benchmark traces).
+    :param output_format: Output format of the harness; npy leaves out most of the cost of printing text.
+    :return: True if every profile was built, replayed the traces and gave the same outputs.
+    """
+    try:
+        input_files = sorted(glob.glob(os.path.join(input_folder, "*.csv")))
+        if not input_files:
+            print(f"Error: no .csv file in {input_folder}")
+            return False
+        train = train or input_files
+        os.makedirs(output_folder, exist_ok=True)
+        print(f"Benchmarking {len(algorithms)} algorithms ({', '.join(profiles)}) on {len(input_files)} traces, "
+              f"pgo trained on {len(train)} traces")
+
+        results = []
+        for name, keyword, test_dir in algorithms:
+            print(f"Building and timing {name}")
+            results.extend(bench_algorithm(name, keyword, test_dir, input_files, train,
+                                           output_folder, profiles, repeat, output_format))
+        print_table(results)
+
+        table_file = os.path.join(output_folder, "bench_results.csv")
+        with open(table_file, 'w', newline='') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(RESULT_COLUMNS)
+            writer.writerows([["" if value is None else value for value in row] for row in results])
+        print(f"\nBenchmark results written to {table_file}")
+        return all(row[3] is not None and row[7] for row in results)
+
+    except Exception as e:
+        print(f"Error running the benchmark: {e}")
+        return False
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Compare the replay speed (rows/sec) of the build profiles of each algorithm.")
+
+    parser.add_argument("-w", "--workspaces", help="The workspaces.csv of ss_prepare.py; benchmarks every ready workspace.")
+    parser.add_argument("-k", "--keyword", help="The keyword used for the test (e.g., 'search'), without -w.")
+    parser.add_argument("-d", "--test_dir", default="test_dir", help="The directory with the generated sources and Makefile, without -w.")
+    parser.add_argument("-i", "--input_folder", required=True, help="The folder containing the .csv traces to replay.")
+    parser.add_argument("-o", "--output_folder", required=True, help="The folder receiving the builds and bench_results.csv.")
+    parser.add_argument("-t", "--train", nargs="+", metavar="TRACE",
+                        help="Traces replayed to train the pgo profile (default: the traces of the input folder).")
+    parser.add_argument("-p", "--profile", action="append", choices=PROFILES, dest="profiles",
+                        help="Profile to benchmark; repeat for several (default: debug, release, native and pgo).")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Replays per profile, the best time is kept (default: 3).")
+    parser.add_argument("-F", "--format", choices=["text", "npy"], default="text",
+                        help="Output format of the harness during the replay (default: text).")
+
+    args = parser.parse_args()
+
+    if args.workspaces:
+        algorithms = load_algorithms(args.workspaces)
+    elif args.keyword:
+        algorithms = [(args.keyword, args.keyword, args.test_dir)]
+    else:
+        parser.error("give either -w or -k")
+
+    train = sorted(trace for pattern in args.train for trace in glob.glob(pattern)) if args.train else None
+    if args.train and not train:
+        parser.error("no trace matches --train")
+    if not run_bench(algorithms, args.input_folder, args.output_folder, train, args.profiles or PROFILES, args.repeat,
+                     args.format):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+# Name of the sidecar index stored at the root of the cache directory
+INDEX_FILE = "index.json"
+
+# Serializes index updates between the worker threads of ss_run.py
+_index_lock = threading.Lock()
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 digest of a file without loading it in memory.
+    :param path: The file to hash.
+    :return: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(input_hash, binary_hash, harness_args, input_path=None):
+    """
+    Build the content-addressed key of one test run.
+    :param input_hash: Hash of the input trace.
+    :param binary_hash: Hash of the compiled test binary.
+    :param harness_args: Extra arguments passed to the binary.
+    :param input_path: Path of the input when the output embeds it (the text output prints it),
+                       otherwise None so that copies of a trace share their output.
+    :return: The hex key identifying the run output.
+    """
+    material = json.dumps([input_hash, binary_hash, list(harness_args)] + ([input_path] if input_path else []))
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _object_path(cache_dir, key):
+    """Return the path of the stored output for a key."""
+    return os.path.join(cache_dir, "objects", key[:2], key)
+
+
+def _scan_objects(cache_dir):
+    """Return the stat of every stored object, keyed by its key (partial .tmp copies are skipped)."""
+    objects = {}
+    objects_dir = os.path.join(cache_dir, "objects")
+    if not os.path.isdir(objects_dir):
+        return objects
+    for prefix in os.scandir(objects_dir):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                objects[entry.name] = entry.stat()
+    return objects
+
+
+def load_index(cache_dir):
+    """
+    Load the sidecar index of the cache and reconcile it with the stored objects: entries
+    whose object disappeared are dropped, and objects missing from the index (stored by a
+    run that was killed, or whose index was replaced by a concurrent run) are added back.
+    :param cache_dir: The cache directory.
+    :return: Dictionary mapping keys to their metadata.
+    """
+    index = {}
+    index_file = os.path.join(cache_dir, INDEX_FILE)
+    if os.path.isfile(index_file):
+        try:
+            with open(index_file, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable cache index {index_file}: {e}")
+    objects = _scan_objects(cache_dir)
+    for key, status in objects.items():
+        if key not in index:
+            # Unknown input and arguments, but the size and age are all the eviction needs
+            index[key] = {"input": None, "args": None, "size": status.st_size, "created": status.st_mtime,
+                          "last_used": status.st_mtime}
+    return {key: entry for key, entry in index.items() if key in objects}
+
+
+def save_index(cache_dir, index):
+    """Atomically write the sidecar index of the cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    index_file = os.path.join(cache_dir, INDEX_FILE)
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    with _index_lock:
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, index_file)
+
+
+def cache_lookup(cache_dir, index, key, output_file):
+    """
+    Reuse a cached output for a key by linking (or copying) it into place.
+    :return: True on a cache hit, False otherwise.
+    """
+    object_file = _object_path(cache_dir, key)
+    with _index_lock:
+        if key not in index or not os.path.isfile(object_file):
+            return False
+        index[key]["last_used"] = time.time()
+
+    if os.path.lexists(output_file):
+        os.remove(output_file)
+    try:
+        os.link(object_file, output_file)
+    except OSError:
+        # Hard links fail across filesystems; fall back to a plain copy
+        shutil.copyfile(object_file, output_file)
+    return True
+
+
+def cache_store(cache_dir, index, key, output_file, input_file, harness_args):
+    """Store a freshly produced output under its key and record it in the index."""
+    object_file = _object_path(cache_dir, key)
+    os.makedirs(os.path.dirname(object_file), exist_ok=True)
+
+    # Copy through a temporary name so readers never observe a partial object
+    tmp_file = f"{object_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(output_file, tmp_file)
+    os.replace(tmp_file, object_file)
+
+    now = time.time()
+    with _index_lock:
+        index[key] = {
+            "input": input_file,
+            "args": list(harness_args),
+            "size": os.path.getsize(object_file),
+            "created": now,
+            "last_used": now,
+        }
+
+
+def cache_evict(cache_dir, index, max_size_mb=None, max_age_days=None):
+    """
+    Evict cache entries by age and then by size, least recently used first.
+    :param max_size_mb: Maximum total size of the stored outputs in MB (None = unlimited).
+    :param max_age_days: Maximum days since an entry was last used (None = unlimited).
+    :return: Number of evicted entries.
+    """
+    now = time.time()
+    evicted = set()
+    with _index_lock:
+        entries = sorted(index.items(), key=lambda item: item[1]["last_used"])
+
+        if max_age_days is not None:
+            max_age = max_age_days * 86400
+            evicted.update(key for key, entry in entries if now - entry["last_used"] > max_age)
+
+        if max_size_mb is not None:
+            max_size = max_size_mb * 1024 * 1024
+            total_size = sum(entry["size"] for key, entry in entries if key not in evicted)
+            for key, entry in entries:
+                if total_size <= max_size:
+                    break
+                if key not in evicted:
+                    evicted.add(key)
+                    total_size -= entry["size"]
+
+        for key in evicted:
+            del index[key]
+            object_file = _object_path(cache_dir, key)
+            if os.path.isfile(object_file):
+                os.remove(object_file)
+
+    return len(evicted)
@@ -0,0 +1,230 @@
+import os
+import re
+import shutil
+import struct
+import subprocess
+import argparse
+from contextlib import contextmanager
+from ss_cache import hash_file
+
+# Binary trace layout, mirrored by the reader in support/test_harness.h:
+#   header  (64 bytes): magic "CCTRACE1", u32 version, u32 header_size, u32 record_size,
+#                       u32 max_columns, u64 record_count, 32 reserved bytes
+#   records (112 bytes): u32 line_number, u32 columns, u64 values[13]
+# All integers are little-endian.
+TRACE_MAGIC = b"CCTRACE1"
+TRACE_VERSION = 1
+TRACE_COLUMNS = [
+    "now_us", "bytes_acked", "mss", "rtt_us", "tp_deliver_rate", "tp_interval", "tp_delivered",
+    "lost_pkt", "total_retrans_pkt", "app_limited", "snd_nxt", "sk_pacing_rate", "snd_una",
+]
+HEADER_STRUCT = struct.Struct("<8sIIIIQ32x")
+RECORD_STRUCT = struct.Struct(f"<II{len(TRACE_COLUMNS)}Q")
+BINARY_EXTENSION = ".cctrace"
+
+# Compressed CSV traces and the command that streams each of them back to CSV text on stdout
+DECOMPRESSORS = {".gz": ["gzip", "-dc"], ".xz": ["xz", "-dc"], ".zst": ["zstd", "-dc"]}
+TRACE_EXTENSIONS = (".csv",) + tuple(f".csv{extension}" for extension in DECOMPRESSORS)
+
+# Leading unsigned integer of a CSV field, as read by the harness ("%llu")
+_field_pattern = re.compile(r"\s*([+-]?\d+)")
+
+# Largest value of a column; larger ones saturate to it, as in harness_parse_value (strtoull)
+MAX_VALUE = (1 << 64) - 1
+
+
+def parse_value(text):
+    """
+    Convert an integer column the way harness_parse_value (and strtoull) does: a magnitude
+    past MAX_VALUE saturates to it, whatever the sign, and a negative value wraps around.
+    """
+    value = int(text)
+    if abs(value) > MAX_VALUE:
+        return MAX_VALUE
+    return value % (1 << 64)
+
+
+def parse_csv_line(line):
+    """
+    Parse the leading integer columns of a CSV line the same way the harness does.
+    :return: List of column values (parsing stops at the first non-integer column).
+    """
+    values = []
+    for field in line.split(",")[:len(TRACE_COLUMNS)]:
+        match = _field_pattern.match(field)
+        if not match:
+            break
+        values.append(parse_value(match.group(1)))
+        if field[match.end():]:
+            break
+    return values
+
+
+def check_header(header_line, input_file):
+    """Warn when the CSV header does not follow the column order expected by the harness."""
+    names = [name.strip() for name in header_line.strip().split(",")]
+    expected = TRACE_COLUMNS[:len(names)]
+    if names != expected:
+        print(f"Warning: unexpected header in {input_file}; columns are mapped by position.")
+        print(f"  found:    {','.join(names)}")
+        print(f"  expected: {','.join(expected)}")
+
+
+def is_trace_file(filename):
+    """True for a .csv trace, compressed or not."""
+    return filename.endswith(TRACE_EXTENSIONS)
+
+
+def trace_stem(filename):
+    """Name of a trace without its directory and its .csv (and compression) extension."""
+    name = os.path.basename(filename)
+    for extension in sorted(TRACE_EXTENSIONS, key=len, reverse=True):
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+def decompress_command(input_file):
+    """
+    Command writing the CSV text of a compressed trace on stdout.
+    :return: The command as a list, or None for a trace that is not compressed.
+    """
+    command = DECOMPRESSORS.get(os.path.splitext(input_file)[1])
+    if command is None or not input_file.endswith(TRACE_EXTENSIONS):
+        return None
+    if shutil.which(command[0]) is None:
+        raise ValueError(f"{command[0]} is needed to read {input_file} but is not installed")
+    return command + [input_file]
+
+
+@contextmanager
+def open_trace(input_file):
+    """
+    Open the CSV text of a trace, streaming it through the decompressor when it is compressed.
+    :return: Context manager giving a text file object.
+    """
+    command = decompress_command(input_file)
+    if command is None:
+        with open(input_file, 'r') as infile:
+            yield infile
+        return
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        yield process.stdout
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0:
+        raise ValueError(f"{command[0]} failed on {input_file} with status {process.returncode}")
+
+
+def count_trace_rows(input_file):
+    """Number of rows a harness replays from a .csv trace, compressed or not: every line but the header and '#' lines."""
+    with open_trace(input_file) as infile:
+        next(infile, None)
+        return sum(1 for line in infile if line.strip() and not line.startswith("#"))
+
+
+def convert_csv(input_file, output_file):
+    """
+    Stream a CSV trace, compressed or not, into the binary trace format.
+    Like the harness, the first line is the header and lines starting with '#' are skipped.
+    :return: Number of records written.
+    """
+    record_count = 0
+    with open_trace(input_file) as infile, open(output_file, 'wb') as outfile:
+        outfile.write(HEADER_STRUCT.pack(TRACE_MAGIC, TRACE_VERSION, HEADER_STRUCT.size,
+                                         RECORD_STRUCT.size, len(TRACE_COLUMNS), 0))
+        padding = [0] * len(TRACE_COLUMNS)
+        records = []
+
+        for line_number, line in enumerate(infile, start=1):
+            if line_number == 1:
+                check_header(line, input_file)
+                continue
+            if line.startswith("#"):
+                continue
+
+            values = parse_csv_line(line)
+            records.append(RECORD_STRUCT.pack(line_number, len(values), *values, *padding[len(values):]))
+            if len(records) == 4096:
+                outfile.write(b"".join(records))
+                record_count += len(records)
+                records = []
+
+        outfile.write(b"".join(records))
+        record_count += len(records)
+
+        # Patch the record count now that it is known
+        outfile.seek(0)
+        outfile.write(HEADER_STRUCT.pack(TRACE_MAGIC, TRACE_VERSION, HEADER_STRUCT.size,
+                                         RECORD_STRUCT.size, len(TRACE_COLUMNS), record_count))
+    return record_count
+
+
+def convert_cached(input_file, cache_dir, source_hash=None):
+    """
+    Return the binary trace of a CSV file, converting it only if the cache has no
+    trace for the same content. Traces are stored as <cache_dir>/<sha256 of the CSV>.cctrace
+    (of the compressed file for a compressed trace).
+    :param source_hash: Hash of the CSV file, if the caller already computed it.
+    :return: Path of the binary trace.
+    """
+    source_hash = source_hash or hash_file(input_file)
+    output_file = os.path.join(cache_dir, f"{source_hash}{BINARY_EXTENSION}")
+    if os.path.isfile(output_file):
+        return output_file
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{output_file}.{os.getpid()}.{id(output_file)}.tmp"
+    try:
+        convert_csv(input_file, tmp_file)
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return output_file
+
+
+def find_csv_files(path):
+    """Yield the .csv files, compressed or not, under a file or directory path."""
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if is_trace_file(filename):
+                yield os.path.join(root, filename)
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Convert CSV traces into the binary trace format of the test harness.")
+
+    parser.add_argument("-i", "--input", required=True, help="A .csv file or a folder searched recursively for .csv files (.csv.gz, .csv.xz and .csv.zst too).")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-o", "--output_folder", help="Write <name>.cctrace next to each other in this folder.")
+    group.add_argument("-c", "--cache", help="Store the traces in this cache folder, keyed by the hash of each CSV.")
+
+    args = parser.parse_args()
+
+    try:
+        for input_file in find_csv_files(args.input):
+            if args.cache:
+                output_file = convert_cached(input_file, args.cache)
+            else:
+                os.makedirs(args.output_folder, exist_ok=True)
+                output_file = os.path.join(args.output_folder, f"{trace_stem(input_file)}{BINARY_EXTENSION}")
+                convert_csv(input_file, output_file)
+            print(f"Converted: {input_file} -> {output_file}")
+    except Exception as e:
+        print(f"Error converting traces: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
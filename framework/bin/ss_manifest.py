@@ -0,0 +1,357 @@
+import os
+import re
+import json
+import time
+import fnmatch
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from ss_cache import hash_file
+
+# Name of the manifest written by ss_run.py in its output folder
+MANIFEST_FILE = "manifest.jsonl"
+
+# Version of the layout of the manifest entries
+MANIFEST_VERSION = 1
+
+# Reducers giving the results of a manifest entry (see ss_reduce.REDUCERS)
+MANIFEST_REDUCERS = ["exit", "loss"]
+
+# Results of the trace kept in a manifest entry
+RESULT_FIELDS = ["exit_us", "exit_cwnd", "first_loss_us"]
+
+# Statuses of a trace that did not pass besides "failed": the message of such a trace starts
+# with its status (e.g. "timeout: killed after the wall clock limit of 60s", see ss_run.limit_message)
+STOPPED_STATUSES = ["timeout", "crashed", "cancelled"]
+
+# Fields printed by a query, unless others are asked for
+DEFAULT_FIELDS = ["trace", "keyword", "status", "exit_us", "exit_cwnd", "first_loss_us", "binary_hash", "run_at"]
+
+# Text output of the harnesses: start of a row block, the fields used here, exit and loss events
+_line_pattern = re.compile(r"^Line (\d+):")
+_field_pattern = re.compile(r"^  (now_us|cwnd|snd_cwnd|loss happen|loss_happen): (\d+)")
+_exit_pattern = re.compile(r"Exits? .*? at (\d+)")
+_loss_pattern = re.compile(r"First Loss is happened at (\d+)")
+
+# Summary line ending a text output of a harness run with -s (see test_harness.h), and how
+# much of the end of the output is read to find it
+_summary_pattern = re.compile(r"^Summary: exit_us=(\w+) exit_cwnd=(\w+) first_loss_us=(\w+)$", re.M)
+SUMMARY_TAIL_BYTES = 4096
+
+# A filter of a query: <field><operator><value>
+_filter_pattern = re.compile(r"^(\w+)\s*(<=|>=|!=|=|<|>|~)\s*(.*)$")
+
+
+def read_summary_line(output_file):
+    """
+    Read the summary line at the end of a text output of a harness run with -s.
+    :return: Dictionary of the RESULT_FIELDS (None when unknown), or None without a summary line.
+    """
+    with open(output_file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - SUMMARY_TAIL_BYTES))
+        tail = f.read().decode(errors='replace')
+    matches = list(_summary_pattern.finditer(tail))
+    if not matches:
+        return None
+    return {name: int(value) if value.isdigit() else None for name, value in zip(RESULT_FIELDS, matches[-1].groups())}
+
+
+def summarize_text(output_file):
+    """
+    Read the slow start exit and the first loss of the text output of a harness.
+    An output of a harness run with -s ends with them, so only its end is read. Otherwise
+    the exit time is the one of the first "... Exits ... at" line and its cwnd the one printed
+    for the row at that time (by the harnesses that print cwnd); the first loss is the
+    "First Loss ... at" line or the first row whose loss flag is set. Reading stops once
+    both are known, so the whole output is only read when the trace has no exit or loss.
+    :return: Dictionary of the RESULT_FIELDS (None when unknown).
+    """
+    summary = read_summary_line(output_file)
+    if summary is not None:
+        return summary
+
+    summary = dict.fromkeys(RESULT_FIELDS)
+    now_us = cwnd = None
+    with open(output_file, 'r', errors='replace') as f:
+        for text in f:
+            if _line_pattern.match(text):
+                # The exit row is over once the next row starts
+                if summary["exit_us"] is not None and summary["first_loss_us"] is not None and now_us is not None \
+                        and now_us >= summary["exit_us"]:
+                    break
+                now_us = cwnd = None
+                continue
+
+            match = _field_pattern.match(text)
+            if match:
+                name, value = match.group(1), int(match.group(2))
+                if name == "now_us":
+                    now_us = value
+                elif name in ("cwnd", "snd_cwnd"):
+                    cwnd = value
+                elif value and summary["first_loss_us"] is None:
+                    summary["first_loss_us"] = now_us
+            else:
+                match = _exit_pattern.search(text)
+                if match and summary["exit_us"] is None:
+                    summary["exit_us"] = int(match.group(1))
+                match = _loss_pattern.search(text)
+                if match and summary["first_loss_us"] is None:
+                    summary["first_loss_us"] = int(match.group(1))
+
+            # The exit line comes before or inside the block of its row, depending on the harness
+            if summary["exit_cwnd"] is None and cwnd is not None and now_us == summary["exit_us"]:
+                summary["exit_cwnd"] = cwnd
+    return summary
+
+
+def summarize_output(output_file):
+    """Read the RESULT_FIELDS of an output of the test binary, .npy records or text."""
+    if output_file.endswith(".npy"):
+        # NumPy is only imported for .npy outputs, so that text runs work without it
+        from ss_reduce import reduce_file
+        metrics = reduce_file(output_file, MANIFEST_REDUCERS)
+        return {name: metrics[name] for name in RESULT_FIELDS}
+    return summarize_text(output_file)
+
+
+def result_status(passed, message):
+    """Status of a trace from its (passed, message) outcome: passed, failed, or one of STOPPED_STATUSES."""
+    if passed:
+        return "passed"
+    status = str(message).split(":", 1)[0]
+    return status if status in STOPPED_STATUSES else "failed"
+
+
+def describe_trace(input_file, output_file):
+    """
+    Hash a trace and read the results of its output, if given.
+    :return: Tuple (input hash or None, results dictionary, error message or None).
+    """
+    input_hash = hash_file(input_file) if os.path.isfile(input_file) else None
+    if not output_file:
+        return input_hash, dict.fromkeys(RESULT_FIELDS), None
+    try:
+        return input_hash, summarize_output(output_file), None
+    except (OSError, ValueError, ImportError) as e:
+        return input_hash, dict.fromkeys(RESULT_FIELDS), f"cannot read {output_file}: {e}"
+
+
+def trace_name(input_file, output_file, output_folder):
+    """
+    Name of a trace in the manifest: its path relative to the input folder, e.g.
+    viasat/cubic_all_off/log.csv. The output mirrors the folders of the input, so the
+    folders are read from the output, which works as well for the traces of a queue.
+    """
+    relative_folder = os.path.dirname(os.path.relpath(output_file, output_folder))
+    return os.path.join(relative_folder, os.path.basename(input_file)).replace(os.sep, "/")
+
+
+def build_manifest(tasks, results, keyword, executable, harness_args, output_folder, metrics=None, jobs=1):
+    """
+    Build the manifest entries of a run of ss_run.py, one per trace.
+    :param tasks: The (input_file, output_file) pairs of the run.
+    :param output_folder: The output folder of the run, relative to which the traces are named.
+    :param results: Dictionary mapping each input file to its (passed, message) outcome.
+    :param harness_args: Arguments of the test binary, part of the identity of a result.
+    :param metrics: Metrics of a streaming reduction, keyed by input file (with the
+                    MANIFEST_REDUCERS); the outputs of the traces are read otherwise.
+    :param jobs: Number of traces hashed and read in parallel (0 uses every CPU).
+    :return: List of entries, sorted by trace.
+    """
+    run_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    binary_hash = hash_file(executable)
+
+    # Only the outputs of passed traces are read; a streaming reduction already gave its metrics
+    reads = [(input_file, output_file if results[input_file][0] and metrics is None and os.path.isfile(output_file)
+              else None) for input_file, output_file in tasks]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(reads) > 1:
+        # Hashing and reading the outputs is CPU-bound, so the traces are spread over processes
+        with ProcessPoolExecutor(max_workers=min(jobs, len(reads))) as pool:
+            described = list(pool.map(describe_trace, *zip(*reads)))
+    else:
+        described = [describe_trace(input_file, output_file) for input_file, output_file in reads]
+
+    entries = []
+    for (input_file, output_file), (input_hash, summary, error) in zip(tasks, described):
+        passed, message = results[input_file]
+        if metrics is not None:
+            summary = {name: (metrics.get(input_file) or {}).get(name) for name in RESULT_FIELDS}
+        if error:
+            print(f"Warning: {error}")
+        entries.append({
+            "version": MANIFEST_VERSION,
+            "trace": trace_name(input_file, output_file, output_folder),
+            "keyword": keyword,
+            "status": result_status(passed, message),
+            **summary,
+            "input_hash": input_hash,
+            "binary_hash": binary_hash,
+            "args": list(harness_args),
+            "input": os.path.abspath(input_file),
+            "output": os.path.abspath(output_file) if os.path.isfile(output_file) else None,
+            "message": None if passed else message,
+            "run_at": run_at,
+        })
+    return sorted(entries, key=lambda entry: entry["trace"])
+
+
+def write_manifest(manifest_file, entries):
+    """Write manifest entries as JSON lines."""
+    with open(manifest_file, 'w') as outfile:
+        for entry in entries:
+            outfile.write(json.dumps(entry) + "\n")
+
+
+def read_manifest(path):
+    """
+    Read the entries of a manifest.
+    :param path: A manifest file, or an output folder of ss_run.py holding one, or the
+                 manifest.<worker>.jsonl of the workers of a queue (ss_run.py --queue).
+    :return: List of entries.
+    """
+    if os.path.isdir(path):
+        stem, extension = os.path.splitext(MANIFEST_FILE)
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if name.startswith(f"{stem}.") and name.endswith(extension))
+        return [entry for worker_path in paths or [os.path.join(path, MANIFEST_FILE)]
+                for entry in read_manifest(worker_path)]
+    with open(path, 'r') as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+def result_key(entry):
+    """Identity of a result: the same trace replayed by the same binary with the same arguments."""
+    return (entry["keyword"], entry["binary_hash"], entry["input_hash"] or entry["input"], tuple(entry["args"]))
+
+
+def merge_manifests(manifests, history=False):
+    """
+    Merge the entries of several manifests, e.g. of runs over parts of a corpus or of reruns.
+    :param manifests: Lists of entries, from read_manifest().
+    :param history: Keep every entry instead of only the latest one of each result_key().
+    :return: List of entries, sorted by trace, keyword and run time.
+    """
+    entries = [entry for manifest in manifests for entry in manifest]
+    if not history:
+        latest = {}
+        for entry in entries:
+            key = result_key(entry)
+            if key not in latest or entry["run_at"] >= latest[key]["run_at"]:
+                latest[key] = entry
+        entries = list(latest.values())
+    return sorted(entries, key=lambda entry: (entry["trace"], entry["keyword"], entry["run_at"]))
+
+
+def parse_filter(text):
+    """
+    Parse a query filter: <field><op><value>, where op is =, !=, <, <=, >, >= or ~ (glob match).
+    :return: Tuple (field, operator, value).
+    """
+    match = _filter_pattern.match(text)
+    if not match:
+        raise ValueError(f"invalid filter: {text} (expected <field><op><value>, e.g. exit_us<5000000)")
+    return match.groups()
+
+
+def _matches(entry, field, op, value):
+    actual = entry.get(field)
+    if op == "~":
+        return actual is not None and fnmatch.fnmatch(str(actual), value)
+    if value in ("", "null", "none"):
+        # Compare with a missing value, e.g. exit_us=null for the traces that never exit
+        return (actual is None) == (op == "=") if op in ("=", "!=") else False
+    if actual is None:
+        return op == "!="
+    if isinstance(actual, (int, float)) and not isinstance(actual, bool):
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+    else:
+        actual = str(actual)
+    return {"=": actual == value, "!=": actual != value, "<": actual < value, "<=": actual <= value,
+            ">": actual > value, ">=": actual >= value}[op]
+
+
+def query(entries, filters=(), sort=None, limit=None, reverse=False):
+    """
+    Select manifest entries.
+    :param filters: (field, operator, value) tuples of parse_filter(), all of which must match.
+    :param sort: Field to sort on; missing values come last.
+    :param limit: Keep at most this many entries.
+    :param reverse: Sort in descending order.
+    :return: List of the selected entries.
+    """
+    selected = [entry for entry in entries if all(_matches(entry, *condition) for condition in filters)]
+    if sort:
+        present = [entry for entry in selected if entry.get(sort) is not None]
+        missing = [entry for entry in selected if entry.get(sort) is None]
+        selected = sorted(present, key=lambda entry: entry[sort], reverse=reverse) + missing
+    return selected[:limit] if limit is not None else selected
+
+
+def print_entries(entries, fields):
+    """Print entries as an aligned table of the given fields; hashes are shortened."""
+    def cell(entry, field):
+        value = entry.get(field)
+        if value is None:
+            return "-"
+        if field.endswith("_hash"):
+            return value[:12]
+        return " ".join(value) if isinstance(value, list) else str(value)
+
+    rows = [[cell(entry, field) for field in fields] for entry in entries]
+    widths = [max([len(field)] + [len(row[i]) for row in rows]) for i, field in enumerate(fields)]
+    print("  ".join(field.ljust(width) for field, width in zip(fields, widths)).rstrip())
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Query and merge the manifests of the runs of ss_run.py.")
+
+    parser.add_argument("-m", "--manifest", action="append", required=True,
+                        help="A manifest.jsonl, or an output folder of ss_run.py; repeat to query several runs together.")
+    parser.add_argument("-w", "--where", action="append", default=[], metavar="FILTER",
+                        help="Keep the traces matching <field><op><value> (op: = != < <= > >= ~), e.g. exit_us<5000000, "
+                             "status=failed, trace~*viasat/*, exit_us=null; repeat for several.")
+    parser.add_argument("-s", "--sort", metavar="FIELD", help="Sort on a field, e.g. exit_us for the earliest exits first.")
+    parser.add_argument("-r", "--reverse", action="store_true", help="Sort in descending order.")
+    parser.add_argument("-n", "--limit", type=int, help="Print at most this many traces.")
+    parser.add_argument("-f", "--fields", default=",".join(DEFAULT_FIELDS),
+                        help=f"Comma-separated fields to print (default: {','.join(DEFAULT_FIELDS)}).")
+    parser.add_argument("--json", action="store_true", help="Print the selected entries as JSON lines.")
+    parser.add_argument("--history", action="store_true",
+                        help="Keep every entry instead of the latest one of each trace, binary and arguments.")
+    parser.add_argument("--merge", metavar="FILE", help="Write the selected entries to a merged manifest instead of printing them.")
+
+    args = parser.parse_args()
+
+    try:
+        filters = [parse_filter(text) for text in args.where]
+    except ValueError as e:
+        parser.error(str(e))
+
+    manifests = []
+    for path in args.manifest:
+        try:
+            manifests.append(read_manifest(path))
+        except (OSError, ValueError) as e:
+            print(f"Error reading the manifest {path}: {e}")
+            raise SystemExit(1)
+
+    entries = query(merge_manifests(manifests, args.history), filters, args.sort, args.limit, args.reverse)
+    if args.merge:
+        write_manifest(args.merge, entries)
+        print(f"Merged manifest of {len(entries)} traces written to {args.merge}")
+    elif args.json:
+        for entry in entries:
+            print(json.dumps(entry))
+    else:
+        print_entries(entries, [field.strip() for field in args.fields.split(",") if field.strip()])
+
+if __name__ == "__main__":
+    main()
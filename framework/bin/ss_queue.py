@@ -0,0 +1,459 @@
+import os
+import re
+import json
+import time
+import socket
+import argparse
+import threading
+from ss_manifest import STOPPED_STATUSES, result_status
+
+# Description of a queue, written by the first worker: see init_queue()
+QUEUE_FILE = "queue.json"
+
+# Version of the layout of a queue directory
+QUEUE_VERSION = 1
+
+# Folders of a queue: the traces waiting to run, the ones a worker claimed, the finished
+# ones, the heartbeat of every worker, and the files being written before they are renamed
+PENDING_DIR = "pending"
+CLAIMED_DIR = "claimed"
+DONE_DIR = "done"
+WORKERS_DIR = "workers"
+TMP_DIR = "tmp"
+
+# A claim is named <pending name>@<worker>.json, a heartbeat <worker>.json
+CLAIM_SEPARATOR = "@"
+
+# Default seconds between two heartbeats of a worker, and without one after which its claims are reclaimed
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+
+_unsafe_characters = re.compile(r"[^\w.+-]")
+
+
+def worker_name():
+    """Name of this worker process, unique across the hosts sharing the queue: <host>-<pid>."""
+    return _unsafe_characters.sub("_", f"{socket.gethostname()}-{os.getpid()}")
+
+
+def task_id(output_file, output_folder):
+    """Identity of a trace in the queue: the path of its output file in the output folder."""
+    return _unsafe_characters.sub("_", os.path.relpath(output_file, output_folder).replace(os.sep, "+"))
+
+
+def worker_output(output_file, worker):
+    """
+    File a worker writes the output of a trace to before renaming it into place, so that a
+    trace run twice (reclaimed from a worker that was only slow) never mixes both outputs.
+    """
+    return f"{output_file}.{worker}.tmp"
+
+
+def _pending_name(task):
+    """
+    Name of the pending file of a task. It starts with the size of the trace so that
+    the traces are claimed largest first, as in an ss_run.py run without a queue.
+    """
+    return f"{task['size']:016d}.{task['id']}"
+
+
+def _id_of(name):
+    """Task identity of a pending, claimed or done file name."""
+    name = os.path.splitext(name)[0].rpartition(CLAIM_SEPARATOR)[0] or os.path.splitext(name)[0]
+    return name.split(".", 1)[1] if re.match(r"^\d{16}\.", name) else name
+
+
+def _write_json(queue_dir, path, data, replace=True):
+    """
+    Write a JSON file of the queue through a temporary file, so that no worker ever reads it
+    half written. Without replace, the file is only created if it does not exist yet.
+    :return: True if the file was written.
+    """
+    tmp_file = os.path.join(queue_dir, TMP_DIR, f"{os.path.basename(path)}.{worker_name()}.{threading.get_ident()}")
+    with open(tmp_file, 'w') as outfile:
+        json.dump(data, outfile)
+    try:
+        if replace:
+            os.replace(tmp_file, path)
+            return True
+        # A hard link fails if the file exists, which makes the creation atomic
+        os.link(tmp_file, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        if os.path.lexists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _read_json(path):
+    """Read a JSON file of the queue, or None if another worker moved it away."""
+    try:
+        with open(path, 'r') as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return None
+
+
+def init_queue(queue_dir, tasks, settings):
+    """
+    Create the queue, or join it, and add the traces it does not hold yet. Every worker
+    may call it with the same traces: a trace that is pending, claimed or done is skipped.
+    :param tasks: The (input_file, output_file) pairs of the corpus.
+    :param settings: What every worker must agree on (keyword, arguments of the test
+                     binary, output folder); a queue created with other settings is refused.
+    :return: Number of traces added.
+    """
+    for folder in (PENDING_DIR, CLAIMED_DIR, DONE_DIR, WORKERS_DIR, TMP_DIR):
+        os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    # Step 1: Create queue.json, or check that the queue was created for the same run
+    queue_file = os.path.join(queue_dir, QUEUE_FILE)
+    _write_json(queue_dir, queue_file, {"version": QUEUE_VERSION, "created": time.time(), **settings}, replace=False)
+    queue = _read_json(queue_file)
+    differing = sorted(key for key, value in settings.items() if queue.get(key) != value)
+    if differing:
+        raise ValueError(f"the queue {queue_dir} was created with another {', '.join(differing)}: "
+                         f"{', '.join(f'{key}={queue.get(key)}' for key in differing)}")
+
+    # Step 2: Add the traces that are not in the queue yet
+    known = set()
+    for folder in (PENDING_DIR, CLAIMED_DIR, DONE_DIR):
+        known.update(_id_of(name) for name in os.listdir(os.path.join(queue_dir, folder)))
+    added = 0
+    for input_file, output_file in tasks:
+        task = {"id": task_id(output_file, settings["output_folder"]), "input": os.path.abspath(input_file),
+                "output": os.path.abspath(output_file), "size": os.path.getsize(input_file)}
+        if task["id"] in known:
+            continue
+        known.add(task["id"])
+        added += _write_json(queue_dir, os.path.join(queue_dir, PENDING_DIR, f"{_pending_name(task)}.json"), task,
+                             replace=False)
+    return added
+
+
+def read_queue(queue_dir):
+    """Read the description of a queue (see init_queue)."""
+    queue = _read_json(os.path.join(queue_dir, QUEUE_FILE))
+    if queue is None:
+        raise ValueError(f"{queue_dir} is not a queue, it has no {QUEUE_FILE}")
+    return queue
+
+
+def start_heartbeat(queue_dir, worker, interval=HEARTBEAT_SECONDS):
+    """
+    Announce a worker and touch its heartbeat file every interval seconds from a thread.
+    :return: The event that stops the heartbeat once set.
+    """
+    heartbeat_file = os.path.join(queue_dir, WORKERS_DIR, f"{worker}.json")
+    _write_json(queue_dir, heartbeat_file, {"worker": worker, "host": socket.gethostname(), "pid": os.getpid(),
+                                            "started": time.time()})
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                os.utime(heartbeat_file)
+            except FileNotFoundError:
+                # Another worker took this one for dead and removed its file
+                _write_json(queue_dir, heartbeat_file, {"worker": worker, "host": socket.gethostname(),
+                                                        "pid": os.getpid(), "started": time.time()})
+            except OSError as e:
+                print(f"Error updating the heartbeat of {worker}: {e}")
+
+    threading.Thread(target=beat, name=f"heartbeat-{worker}", daemon=True).start()
+    return stop
+
+
+def stop_heartbeat(queue_dir, worker, stop):
+    """Stop the heartbeat of a worker that has no claim left and remove its file."""
+    stop.set()
+    heartbeat_file = os.path.join(queue_dir, WORKERS_DIR, f"{worker}.json")
+    if os.path.lexists(heartbeat_file):
+        os.remove(heartbeat_file)
+
+
+def claim_task(queue_dir, worker, candidates):
+    """
+    Claim the next pending trace by renaming its file into claimed/: the rename is atomic,
+    so exactly one worker gets each trace.
+    :param candidates: List of pending names kept by the worker between calls, refilled
+                       from the pending folder when it runs out.
+    :return: The task dictionary with its "claim" file, or None if nothing is pending.
+    """
+    for _ in range(2):
+        if not candidates:
+            candidates.extend(sorted(os.listdir(os.path.join(queue_dir, PENDING_DIR)), reverse=True))
+        while candidates:
+            name = candidates.pop(0)
+            claim = os.path.join(queue_dir, CLAIMED_DIR,
+                                 f"{os.path.splitext(name)[0]}{CLAIM_SEPARATOR}{worker}.json")
+            try:
+                os.rename(os.path.join(queue_dir, PENDING_DIR, name), claim)
+            except FileNotFoundError:
+                continue
+            task = _read_json(claim)
+            if task is not None:
+                return {**task, "claim": claim}
+    return None
+
+
+def complete_task(queue_dir, worker, task, passed, message):
+    """
+    Record the result of a claimed trace in done/ and release the claim. Writing the same
+    result twice (a trace reclaimed from a worker that was only slow) replaces it.
+    """
+    result = {"id": task["id"], "input": task["input"], "output": task["output"], "passed": passed,
+              "message": message, "worker": worker, "finished": time.time()}
+    _write_json(queue_dir, os.path.join(queue_dir, DONE_DIR, f"{task['id']}.json"), result)
+    for path in (task["claim"], os.path.join(queue_dir, PENDING_DIR, f"{_pending_name(task)}.json")):
+        # The claim may have been reclaimed meanwhile, and put back in pending/
+        if os.path.lexists(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def release_task(queue_dir, task):
+    """Put a claimed trace back in pending/ without a result, for another worker to run it."""
+    try:
+        os.rename(task["claim"], os.path.join(queue_dir, PENDING_DIR, f"{_pending_name(task)}.json"))
+    except FileNotFoundError:
+        # Already reclaimed by another worker
+        pass
+
+
+def _heartbeat_ages(queue_dir, worker):
+    """
+    Seconds since the last heartbeat of every worker. The ages are measured against the
+    heartbeat of this worker, touched now, so that the clocks of the hosts do not matter.
+    """
+    workers_dir = os.path.join(queue_dir, WORKERS_DIR)
+    if worker is not None:
+        reference = os.path.join(workers_dir, f"{worker}.json")
+        os.utime(reference)
+    else:
+        # A reader that is not a worker gets the time of the shared filesystem from a file of its own
+        reference = os.path.join(queue_dir, TMP_DIR, f"now.{worker_name()}")
+        with open(reference, 'w'):
+            pass
+    now = os.stat(reference).st_mtime
+    if worker is None:
+        os.remove(reference)
+    mtimes = {}
+    for name in os.listdir(workers_dir):
+        try:
+            mtimes[os.path.splitext(name)[0]] = os.stat(os.path.join(workers_dir, name)).st_mtime
+        except FileNotFoundError:
+            continue
+    return {name: now - mtime for name, mtime in mtimes.items()}
+
+
+def _claims(queue_dir):
+    """List the claims of the queue as (file name, pending name, worker) tuples."""
+    claims = []
+    for name in os.listdir(os.path.join(queue_dir, CLAIMED_DIR)):
+        pending_name, _, claimer = os.path.splitext(name)[0].rpartition(CLAIM_SEPARATOR)
+        claims.append((name, pending_name, claimer))
+    return claims
+
+
+def reclaim_stale(queue_dir, worker, stale_seconds=STALE_SECONDS):
+    """
+    Put back in pending/ the claims of the workers without a heartbeat for stale_seconds,
+    or without a heartbeat file at all, and remove their partial outputs. A claim whose
+    trace is already done is dropped. The heartbeat files of stale workers without claims
+    are removed.
+    :return: Tuple (number of traces reclaimed, number of claims still held by live workers).
+    """
+    ages = _heartbeat_ages(queue_dir, worker)
+    done = set(_id_of(name) for name in os.listdir(os.path.join(queue_dir, DONE_DIR)))
+    reclaimed = held = 0
+    claimers = set()
+    for name, pending_name, claimer in _claims(queue_dir):
+        claimers.add(claimer)
+        claim = os.path.join(queue_dir, CLAIMED_DIR, name)
+        if claimer in ages and ages[claimer] <= stale_seconds:
+            held += 1
+            continue
+        task = _read_json(claim)
+        try:
+            if _id_of(name) in done:
+                os.remove(claim)
+            else:
+                os.rename(claim, os.path.join(queue_dir, PENDING_DIR, f"{pending_name}.json"))
+                print(f"Reclaimed {_id_of(name)} from {claimer}")
+                reclaimed += 1
+            if task is not None and os.path.lexists(worker_output(task["output"], claimer)):
+                os.remove(worker_output(task["output"], claimer))
+        except FileNotFoundError:
+            # Another worker reclaimed it first
+            continue
+
+    for claimer, age in ages.items():
+        if age > stale_seconds and claimer not in claimers:
+            try:
+                os.remove(os.path.join(queue_dir, WORKERS_DIR, f"{claimer}.json"))
+            except FileNotFoundError:
+                pass
+    return reclaimed, held
+
+
+def run_queue(queue_dir, run_task, jobs=1, heartbeat=HEARTBEAT_SECONDS, stale_seconds=STALE_SECONDS, cancel=None):
+    """
+    Work on a queue until every trace is done: claim a trace, run it, record its result,
+    and once nothing is pending, reclaim the traces of dead workers or wait for the live ones.
+    On Ctrl-C, the worker stops claiming traces and puts the ones it was running back in pending/.
+    :param run_task: Function (input_file, output_file) -> (passed, message) running one trace.
+    :param jobs: Number of traces this worker runs at a time.
+    :param cancel: Optional function called on Ctrl-C to stop the traces being run.
+    :return: Dictionary mapping each input file run by this worker to its (passed, message) outcome.
+    """
+    worker = worker_name()
+    stop = start_heartbeat(queue_dir, worker, heartbeat)
+    results = {}
+    candidates = []
+    lock = threading.Lock()
+
+    interrupted = threading.Event()
+
+    def work():
+        while not interrupted.is_set():
+            with lock:
+                task = claim_task(queue_dir, worker, candidates)
+            if task is None:
+                reclaimed, held = reclaim_stale(queue_dir, worker, stale_seconds)
+                if reclaimed:
+                    continue
+                if not held:
+                    return
+                # The traces left are running on live workers, which may still die
+                interrupted.wait(heartbeat)
+                continue
+            try:
+                passed, message = run_task(task["input"], task["output"])
+                if interrupted.is_set():
+                    release_task(queue_dir, task)
+                else:
+                    complete_task(queue_dir, worker, task, passed, message)
+            except Exception as e:
+                # The trace is recorded as failed, or else put back in pending/: a claim left held
+                # by a live worker would keep every worker waiting for it
+                print(f"Error running {task['input']} from the queue: {e}")
+                passed, message = False, str(e)
+                try:
+                    complete_task(queue_dir, worker, task, passed, message)
+                except OSError as e:
+                    print(f"Error recording {task['input']} in the queue: {e}")
+                    release_task(queue_dir, task)
+            with lock:
+                results[task["input"]] = (passed, message)
+
+    try:
+        print(f"Worker {worker} joined the queue {queue_dir}")
+        threads = [threading.Thread(target=work, name=f"{worker}-{i}") for i in range(jobs)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            print(f"\nInterrupted: worker {worker} puts its traces back in the queue.")
+            interrupted.set()
+            if cancel is not None:
+                cancel()
+            for thread in threads:
+                thread.join()
+    finally:
+        stop_heartbeat(queue_dir, worker, stop)
+    return results
+
+
+def queue_progress(queue_dir, stale_seconds=STALE_SECONDS):
+    """
+    Count the traces of a queue by state. It only reads the queue, so it can be called at
+    any time, from any host.
+    :return: Dictionary of the counts, and of the live and stale workers with their claims.
+    """
+    ages = _heartbeat_ages(queue_dir, None)
+    claims = _claims(queue_dir)
+    done = [_read_json(os.path.join(queue_dir, DONE_DIR, name)) for name in os.listdir(os.path.join(queue_dir, DONE_DIR))]
+    done = [result for result in done if result is not None]
+
+    workers = {name: {"age_s": age, "claims": 0} for name, age in ages.items()}
+    for _, _, claimer in claims:
+        workers.setdefault(claimer, {"age_s": None, "claims": 0})["claims"] += 1
+    live = {name for name, state in workers.items() if state["age_s"] is not None and state["age_s"] <= stale_seconds}
+
+    progress = {
+        "pending": len(os.listdir(os.path.join(queue_dir, PENDING_DIR))),
+        "running": sum(claimer in live for _, _, claimer in claims),
+        "stale": sum(claimer not in live for _, _, claimer in claims),
+        **{status: sum(result_status(result["passed"], result["message"]) == status for result in done)
+           for status in ["passed", "failed"] + STOPPED_STATUSES},
+        "workers": workers,
+        "live_workers": sorted(live),
+    }
+    progress["total"] = progress["pending"] + progress["running"] + progress["stale"] + len(done)
+    return progress
+
+
+def print_progress(progress):
+    """Print the counts of queue_progress() and the state of every worker."""
+    finished = progress["passed"] + progress["failed"] + sum(progress[status] for status in STOPPED_STATUSES)
+    percent = 100.0 * finished / progress["total"] if progress["total"] else 100.0
+    stopped = "".join(f", {progress[status]} {status}" for status in STOPPED_STATUSES if progress[status])
+    print(f"{finished}/{progress['total']} traces done ({percent:.1f}%): {progress['passed']} passed, "
+          f"{progress['failed']} failed{stopped}, {progress['running']} running, {progress['pending']} pending, "
+          f"{progress['stale']} claimed by stale workers")
+    for name, state in sorted(progress["workers"].items()):
+        status = "live" if name in progress["live_workers"] else "stale"
+        age = "no heartbeat" if state["age_s"] is None else f"last heartbeat {state['age_s']:.0f}s ago"
+        print(f"  {name}: {status}, {state['claims']} claimed, {age}")
+
+
+def list_failed(queue_dir):
+    """List the (input file, message) of the traces that did not pass, sorted by input."""
+    failed = []
+    for name in os.listdir(os.path.join(queue_dir, DONE_DIR)):
+        result = _read_json(os.path.join(queue_dir, DONE_DIR, name))
+        if result is not None and not result["passed"]:
+            failed.append((result["input"], result["message"]))
+    return sorted(failed)
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Report the progress of a work queue of ss_run.py --queue.")
+
+    parser.add_argument("-q", "--queue", required=True, help="The queue directory shared by the workers.")
+    parser.add_argument("--stale", type=float, default=STALE_SECONDS, metavar="SECONDS",
+                        help=f"Seconds without heartbeat after which a worker is stale (default: {STALE_SECONDS}).")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="Print the progress again every SECONDS until every trace is done.")
+    parser.add_argument("--failed", action="store_true", help="Also list the traces that failed, with their error.")
+    parser.add_argument("--json", action="store_true", help="Print the progress as JSON.")
+
+    args = parser.parse_args()
+
+    try:
+        queue = read_queue(args.queue)
+        while True:
+            progress = queue_progress(args.queue, args.stale)
+            if args.json:
+                print(json.dumps({"keyword": queue.get("keyword"), **progress}))
+            else:
+                print_progress(progress)
+            if not args.watch or progress["pending"] + progress["running"] + progress["stale"] == 0:
+                break
+            time.sleep(args.watch)
+        if args.failed:
+            for input_file, message in list_failed(args.queue):
+                print(f"  FAILED {input_file}: {message}")
+    except (OSError, ValueError) as e:
+        print(f"Error reading the queue {args.queue}: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
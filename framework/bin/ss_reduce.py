@@ -0,0 +1,244 @@
+import os
+import re
+import ast
+import csv
+import glob
+import argparse
+import numpy as np
+from ss_verify import INFINITE_SSTHRESH
+
+# Flags set by the harnesses when the algorithm leaves slow start, used when there is no ssthresh field
+EXIT_FLAG_FIELDS = ("exit_slow_start", "hystart_found", "full_bw_reached")
+
+# Rows read from the output of the harness at a time; the memory used is about this many records
+CHUNK_ROWS = 65536
+
+# Record count of the .npy header written by the harness (padded so that 20 digits fit in place)
+_shape_pattern = re.compile(rb"'shape': \((\d+),\)")
+
+
+def _field(names, *candidates):
+    """Return the first of the candidate fields the records have, or None."""
+    return next((name for name in candidates if name in names), None)
+
+
+def _first(mask):
+    """Return the index of the first True of a mask, or None."""
+    hits = np.flatnonzero(mask)
+    return int(hits[0]) if len(hits) else None
+
+
+def _rows_start(names):
+    return {"cwnd": _field(names, "cwnd", "snd_cwnd"), "rows": 0, "last_us": None, "final_cwnd": None}
+
+
+def _rows_update(acc, chunk):
+    acc["rows"] += len(chunk)
+    if "now_us" in chunk.dtype.names:
+        acc["last_us"] = int(chunk["now_us"][-1])
+    if acc["cwnd"]:
+        acc["final_cwnd"] = int(chunk[acc["cwnd"]][-1])
+
+
+def _exit_start(names):
+    # The exit is the first row whose ssthresh is set, or else the first one raising the exit flag
+    flag = "ssthresh" if "ssthresh" in names else _field(names, *EXIT_FLAG_FIELDS)
+    return {"cwnd": _field(names, "cwnd", "snd_cwnd"), "flag": flag, "exit_us": None, "exit_cwnd": None,
+            "found": False}
+
+
+def _exit_update(acc, chunk):
+    if acc["found"] or not acc["flag"]:
+        return
+    values = chunk[acc["flag"]]
+    row = _first(values != INFINITE_SSTHRESH if acc["flag"] == "ssthresh" else values != 0)
+    if row is None:
+        return
+    acc["found"] = True
+    if "now_us" in chunk.dtype.names:
+        acc["exit_us"] = int(chunk["now_us"][row])
+    if acc["cwnd"]:
+        acc["exit_cwnd"] = int(chunk[acc["cwnd"]][row])
+
+
+def _max_cwnd_start(names):
+    return {"cwnd": _field(names, "cwnd", "snd_cwnd"), "max_cwnd": None, "max_cwnd_us": None}
+
+
+def _max_cwnd_update(acc, chunk):
+    if not acc["cwnd"]:
+        return
+    values = chunk[acc["cwnd"]]
+    row = int(np.argmax(values))
+    if acc["max_cwnd"] is None or values[row] > acc["max_cwnd"]:
+        acc["max_cwnd"] = int(values[row])
+        if "now_us" in chunk.dtype.names:
+            acc["max_cwnd_us"] = int(chunk["now_us"][row])
+
+
+def _loss_start(names):
+    return {"cwnd": _field(names, "cwnd", "snd_cwnd"), "has_loss": "loss" in names,
+            "first_loss_us": None, "loss_cwnd": None}
+
+
+def _loss_update(acc, chunk):
+    if not acc["has_loss"] or acc["first_loss_us"] is not None:
+        return
+    row = _first(chunk["loss"] != 0)
+    if row is None:
+        return
+    acc["first_loss_us"] = int(chunk["now_us"][row]) if "now_us" in chunk.dtype.names else None
+    if acc["cwnd"]:
+        acc["loss_cwnd"] = int(chunk[acc["cwnd"]][row])
+
+
+def _search_start(names):
+    return {"has_bins": "bin" in names and "curr_idx" in names,
+            "max_curr_idx": None, "max_bin": None, "max_scale_factor": None}
+
+
+def _search_update(acc, chunk):
+    if not acc["has_bins"]:
+        return
+    for key, values in (("max_curr_idx", chunk["curr_idx"]), ("max_bin", chunk["bin"]),
+                        ("max_scale_factor", chunk["scale_factor"] if "scale_factor" in chunk.dtype.names else None)):
+        if values is None:
+            continue
+        value = int(values.max())
+        acc[key] = value if acc[key] is None else max(acc[key], value)
+
+
+# Online reducers of the records of a trace; each keeps a small accumulator that is
+# updated chunk by chunk, so a trace of any length is reduced in bounded memory.
+#   columns  Metrics the reducer reports, in the order of the metrics table
+#   start    Build the accumulator from the field names of the records
+#   update   Fold a chunk of records (a structured array) into the accumulator
+REDUCERS = {
+    "rows": {"columns": ["rows", "last_us", "final_cwnd"], "start": _rows_start, "update": _rows_update},
+    "exit": {"columns": ["exit_us", "exit_cwnd"], "start": _exit_start, "update": _exit_update},
+    "max_cwnd": {"columns": ["max_cwnd", "max_cwnd_us"], "start": _max_cwnd_start, "update": _max_cwnd_update},
+    "loss": {"columns": ["first_loss_us", "loss_cwnd"], "start": _loss_start, "update": _loss_update},
+    "search": {"columns": ["max_curr_idx", "max_bin", "max_scale_factor"], "start": _search_start,
+               "update": _search_update},
+}
+
+
+def metric_columns(reducers):
+    """Return the metric columns reported by a list of reducer names."""
+    return [column for name in reducers for column in REDUCERS[name]["columns"]]
+
+
+def read_header(stream):
+    """
+    Read the .npy header of a record stream.
+    :return: Tuple (header bytes, record dtype).
+    """
+    magic = stream.read(10)
+    if len(magic) != 10 or not magic.startswith(b"\x93NUMPY\x01\x00"):
+        raise ValueError("the output does not start with a version 1.0 .npy header")
+    length = int.from_bytes(magic[8:10], "little")
+    text = stream.read(length)
+    if len(text) != length:
+        raise ValueError("the .npy header is truncated")
+    header = ast.literal_eval(text.decode("latin1"))
+    return magic + text, np.dtype(header["descr"])
+
+
+def set_header_count(header, count):
+    """Return a .npy header of the harness with its record count set, keeping its length."""
+    match = _shape_pattern.search(header)
+    if not match:
+        raise ValueError("the .npy header has no record count")
+    text = (header[:match.start(1)] + str(count).encode() + header[match.end(1):]).rstrip(b" \n")
+    if len(text) + 1 > len(header):
+        raise ValueError("the .npy header has no room for the record count")
+    return text + b" " * (len(header) - len(text) - 1) + b"\n"
+
+
+def reduce_stream(stream, reducers, output_file=None, chunk_rows=CHUNK_ROWS):
+    """
+    Reduce the records of a trace (-F npy or -F stream output of the harness) as they are read.
+    The stream is read chunk_rows records at a time, so memory does not grow with the trace.
+    :param stream: Binary file object, e.g. the stdout pipe of the test binary.
+    :param reducers: Names of the reducers to apply (see REDUCERS).
+    :param output_file: Optional .npy file receiving the records as well.
+    :return: Dictionary of the metrics of the reducers (None when unknown).
+    """
+    header, dtype = read_header(stream)
+    accumulators = [(REDUCERS[name], REDUCERS[name]["start"](dtype.names or ())) for name in reducers]
+
+    out = open(output_file, 'wb') if output_file else None
+    try:
+        if out:
+            out.write(header)
+        count = 0
+        while True:
+            data = stream.read(chunk_rows * dtype.itemsize)
+            if not data:
+                break
+            if len(data) % dtype.itemsize:
+                raise ValueError("the output ends in the middle of a record")
+            chunk = np.frombuffer(data, dtype=dtype)
+            count += len(chunk)
+            if out:
+                out.write(data)
+            for reducer, acc in accumulators:
+                reducer["update"](acc, chunk)
+
+        # The header of a streamed output has a count of 0; write the actual one in place
+        if out:
+            out.seek(0)
+            out.write(set_header_count(header, count))
+    finally:
+        if out:
+            out.close()
+
+    return {column: acc[column] for reducer, acc in accumulators for column in reducer["columns"]}
+
+
+def reduce_file(output_file, reducers):
+    """Reduce the records of a .npy output file (see reduce_stream)."""
+    with open(output_file, 'rb') as infile:
+        return reduce_stream(infile, reducers)
+
+
+def write_metrics(metrics_file, reducers, rows):
+    """
+    Write the metrics table of a run.
+    :param rows: List of (trace, passed, metrics dictionary or None) tuples.
+    """
+    columns = metric_columns(reducers)
+    with open(metrics_file, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["trace", "passed"] + columns)
+        for trace, passed, metrics in rows:
+            metrics = metrics or {}
+            writer.writerow([trace, int(passed)] + ["" if metrics.get(column) is None else metrics[column]
+                                                    for column in columns])
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Reduce .npy outputs of the test binaries to a table of per-trace metrics.")
+
+    parser.add_argument("-i", "--input_folder", required=True, help="The folder containing the .npy outputs.")
+    parser.add_argument("-o", "--output", required=True, help="The metrics .csv file to write.")
+    parser.add_argument("-r", "--reducer", action="append", choices=sorted(REDUCERS), dest="reducers",
+                        help="Reducer to apply; repeat for several (default: all of them).")
+
+    args = parser.parse_args()
+    reducers = args.reducers or list(REDUCERS)
+
+    rows = []
+    for output_file in sorted(glob.glob(os.path.join(args.input_folder, "*.npy"))):
+        try:
+            rows.append((os.path.basename(output_file), True, reduce_file(output_file, reducers)))
+        except (OSError, ValueError) as e:
+            print(f"Error reducing {output_file}: {e}")
+            rows.append((os.path.basename(output_file), False, None))
+
+    write_metrics(args.output, reducers, rows)
+    print(f"Metrics of {len(rows)} outputs written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,348 @@
 import os
+import re
+import json
 import shutil
+import filecmp
+import tempfile
 import argparse
+from ss_manifest import RESULT_FIELDS, summarize_text
+
+# Keys of a harness spec (see load_spec) and whether each is required
+SPEC_KEYS = {"description": False, "includes": True, "globals": False, "objects": False, "state": False,
+             "locals": False, "reset": False, "init": False, "columns": True, "before": False,
+             "update": True, "exit": False, "after": False, "fields": True}
+
+_identifier = re.compile(r"^[A-Za-z_]\w*$")
 
 def copy_file_if_exists(src, dest):
-    """Copy the file from src to dest if it exists."""
+    """Copy the file from src to dest if it exists and differs, so that make only rebuilds what changed."""
     if os.path.isfile(src):
+        if os.path.isfile(dest) and filecmp.cmp(src, dest, shallow=False):
+            print(f"Unchanged: {dest}")
+            return
         shutil.copy(src, dest)
         print(f"Copied: {src} to {dest}")
     else:
         print(f"Warning: {src} does not exist.")
 
-def generate_test_files(keyword):
-    """Generate the test files by extracting the necessary files."""
+def _statements(value):
+    """A spec entry holding C code: a string or a list of strings."""
+    return [value] if isinstance(value, str) else list(value or [])
+
+
+def _declaration(type_name, name):
+    """Declare a variable of a C type, e.g. "struct tcp_sock *tp"."""
+    return f"{type_name}{'' if type_name.endswith('*') else ' '}{name}"
+
+
+def load_spec(spec_file):
+    """
+    Load and check a harness spec, a JSON object with the keys:
+      description  Optional text for the header comment of the test file.
+      includes     Headers of the module, e.g. ["tcp.h", "search_defs.h"].
+      globals      Optional declarations at file scope, e.g. "uint64_t mock_now_us = 0;".
+      objects      Structures allocated (zeroed) before every trace and freed after it:
+                   [{"name": "sk", "type": "struct sock"},
+                    {"name": "ca", "type": "struct bictcp", "attach": "sk->bictcp"}]
+                   "attach" is where the pointer is also stored.
+      state        Other variables of the trace, read as st-><name>: [{"name": "EXIT_FLAG", "type": "int"}].
+      locals       Pointers derived from the objects: [{"name": "tp", "type": "struct tcp_sock *", "value": "tcp_sk(sk)"}].
+      reset        Reset call of the module, e.g. "bictcp_search_reset(ca)".
+      init         Statements run after the reset, e.g. "tp->snd_cwnd = TCP_INIT_CWND;".
+      columns      CSV header names bound to the fields they set, in order:
+                   {"now_us": {"type": "u32", "set": "tp->tcp_mstamp"}, "rtt_us": {"type": "u32"}}
+                   Each column is also a local variable of the row (u64 unless "type" says otherwise).
+      before       Statements run once the columns are set.
+      update       Update call(s) of the module, e.g. "search_update(sk, rtt_us)".
+      exit         Optional condition of the row exiting slow start, checked after the update,
+                   e.g. "tp->snd_ssthresh == tp->snd_cwnd && st->EXIT_FLAG == 0". The text output
+                   then has an "Exit Slow Start at <now_us>" line, read by ss_verify.py and
+                   ss_manifest.py; it needs a now_us column.
+      after        Statements run after the update and the exit check.
+      fields       Values recorded for each row: [{"name": "cwnd", "value": "tp->snd_cwnd"},
+                   {"name": "bin", "value": "ca->search.bin[i]", "count": "SEARCH_TOTAL_BINS"}]
+                   "label" is the name printed in the text output when it differs, e.g.
+                   {"name": "loss", "value": "st->LOSS_FLAG", "label": "loss happen"}.
+    :return: The spec dictionary.
+    """
+    with open(spec_file, 'r') as infile:
+        spec = json.load(infile)
+
+    if not isinstance(spec, dict):
+        raise ValueError(f"{spec_file}: a spec is a JSON object")
+    unknown = sorted(set(spec) - set(SPEC_KEYS))
+    missing = sorted(key for key, required in SPEC_KEYS.items() if required and key not in spec)
+    if unknown or missing:
+        raise ValueError(f"{spec_file}: unknown keys {unknown}, missing keys {missing}")
+
+    for key, attributes in (("objects", ("name", "type")), ("state", ("name", "type")),
+                            ("locals", ("name", "type", "value")), ("fields", ("name", "value"))):
+        for entry in spec.get(key, []):
+            if not isinstance(entry, dict) or any(attribute not in entry for attribute in attributes):
+                raise ValueError(f"{spec_file}: every entry of {key} needs {', '.join(attributes)}")
+            if key != "fields" and not _identifier.match(entry["name"]):
+                raise ValueError(f"{spec_file}: {entry['name']} is not a C identifier")
+
+    if not isinstance(spec["columns"], dict) or not spec["columns"]:
+        raise ValueError(f"{spec_file}: columns maps the CSV header names to their fields")
+    for name, column in spec["columns"].items():
+        if not _identifier.match(name):
+            raise ValueError(f"{spec_file}: column {name} is not a C identifier")
+        if not isinstance(column, dict):
+            raise ValueError(f"{spec_file}: column {name} is an object with an optional type and set")
+    if len(spec["columns"]) > 13:
+        raise ValueError(f"{spec_file}: at most 13 columns can be bound")
+    if spec.get("exit") and "now_us" not in spec["columns"]:
+        raise ValueError(f"{spec_file}: exit prints the now_us column of the row, which is not bound")
+    return spec
+
+
+def generate_harness(spec, keyword):
+    """
+    Generate the test file of a spec (see load_spec): its columns are read by header
+    name with HARNESS_MAIN_COLUMNS, so a trace missing one fails instead of being misparsed.
+    :return: The C source of test_<keyword>.c.
+    """
+    columns = list(spec["columns"].items())
+    objects = spec.get("objects", [])
+    state = spec.get("state", [])
+    local_pointers = spec.get("locals", [])
+    lines = []
+    add = lines.append
+
+    # Step 1: Header comment, includes and declarations
+    add("/*")
+    add(" *****************************************************************************")
+    add(f" *  test_{keyword}.c")
+    add(" *  ----------------------------------------------------------------------------")
+    add(f" *  Generated by `ss_setup.py` from a harness spec. {spec.get('description', '')}".rstrip())
+    add(" *  The columns are read by their name in the CSV header.")
+    add(" *")
+    add(" *  ⚠ WARNING: ")
+    add(" *  If you modify this file directly, rerunning `ss_setup.py` will overwrite your changes.")
+    add(" *****************************************************************************")
+    add(" */")
+    add("")
+    add("")
+    for header in ["stdio.h", "stdlib.h", "stdint.h", "string.h"]:
+        add(f"#include <{header}>")
+    for header in spec["includes"]:
+        add(f'#include "{header}"')
+    add('#include "cc_helper_function.h"')
+    add('#include "test_harness.h"')
+    add("")
+    for declaration in _statements(spec.get("globals")):
+        add(declaration)
+    if spec.get("globals"):
+        add("")
+
+    add("// State of one trace; it is rebuilt by trace_open() before every trace")
+    add("struct trace_state {")
+    for entry in objects:
+        add(f"    {entry['type']} *{entry['name']};")
+    for entry in state:
+        add(f"    {_declaration(entry['type'], entry['name'])};")
+    if not objects and not state:
+        add("    int unused;")
+    add("};")
+    add("")
+
+    add("// Fields of the record written for each row in the columnar output format (-F npy)")
+    add("static const struct harness_field trace_fields[] = {")
+    for field in spec["fields"]:
+        add(f'    {{"{field["name"]}", {field.get("count", 1)}}},')
+    add("};")
+    add("")
+
+    add("// CSV header names of the columns read from each row, in the order of row->v")
+    add("static const char *const trace_columns[] = {")
+    for name, _ in columns:
+        add(f'    "{name}",')
+    add("};")
+    add("")
+
+    # Step 2: trace_open() allocates the objects, resets the module and sets the initial values
+    def add_locals(attach=False):
+        for entry in objects:
+            add(f"    {entry['type']} *{entry['name']} = st->{entry['name']};")
+        for entry in objects if attach else []:
+            if entry.get("attach"):
+                add(f"    {entry['attach']} = {entry['name']};")
+        for entry in local_pointers:
+            add(f"    {_declaration(entry['type'], entry['name'])} = {entry['value']};")
+        for entry in objects + local_pointers:
+            add(f"    (void){entry['name']};")
+
+    add("static int trace_open(struct trace_state *st) {")
+    for index, entry in enumerate(objects):
+        add(f"    st->{entry['name']} = calloc(1, sizeof({entry['type']}));")
+        add(f"    if (!st->{entry['name']}) {{")
+        add(f'        fprintf(stderr, "Failed to allocate memory for {entry["name"]}.\\n");')
+        for allocated in reversed(objects[:index]):
+            add(f"        free(st->{allocated['name']});")
+        add("        return 1;")
+        add("    }")
+    add_locals(attach=True)
+    add("")
+    if spec.get("reset"):
+        add(f"    {spec['reset'].rstrip(';')};")
+    for statement in _statements(spec.get("init")):
+        add(f"    {statement}")
+    add("")
+    add("    return 0;")
+    add("}")
+    add("")
+
+    # Step 3: trace_row() binds the columns, runs the update and writes the row
+    add("static int trace_row(struct trace_state *st, const struct harness_row *row) {")
+    add("    int line_number = row->line_number;")
+    add_locals()
+    add("")
+    add("    // Check that the row holds every column, by name")
+    add(f"    if (row->columns < {len(columns)}) {{")
+    add('        fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));')
+    add("        return HARNESS_CONTINUE;")
+    add("    }")
+    add("")
+    for index, (name, column) in enumerate(columns):
+        add(f"    {column.get('type', 'u64')} {name} = row->v[{index}];")
+    for name, column in columns:
+        for target in _statements(column.get("set")):
+            add(f"    {target} = {name};")
+    for statement in _statements(spec.get("before")):
+        add(f"    {statement}")
+    add("")
+    for call in _statements(spec["update"]):
+        add(f"    {call.rstrip(';')};")
+    if spec.get("exit"):
+        add(f"    if ({spec['exit']}) {{")
+        add('        trace_printf("Exit Slow Start at %llu\\n", (unsigned long long)now_us);')
+        add("    }")
+    for statement in _statements(spec.get("after")):
+        add(f"    {statement}")
+    add("")
+
+    add('    trace_printf("Line %d:\\n", line_number);')
+    for field in spec["fields"]:
+        label = field.get("label", field["name"])
+        if "count" in field:
+            add(f"    for (int i = 0; i < {field['count']}; i++) {{")
+            add(f'        trace_printf("  {label}[%d]: %lld\\n", i, (long long)({field["value"]}));')
+            add("    }")
+        else:
+            add(f'    trace_printf("  {label}: %lld\\n", (long long)({field["value"]}));')
+    add('    trace_printf("\\n");')
+    add("")
+    add("    if (trace_records()) {")
+    for field in spec["fields"]:
+        if "count" in field:
+            add(f"        for (int i = 0; i < {field['count']}; i++) {{")
+            add(f"            trace_record({field['value']});")
+            add("        }")
+        else:
+            add(f"        trace_record({field['value']});")
+    add("        trace_record_end();")
+    add("    }")
+    add("")
+    add("    return HARNESS_CONTINUE;")
+    add("}")
+    add("")
+
+    # Step 4: trace_close() frees the objects, the last allocated first
+    add("static void trace_close(struct trace_state *st) {")
+    for entry in reversed(objects):
+        add(f"    free(st->{entry['name']});")
+    if not objects:
+        add("    (void)st;")
+    add("}")
+    add("")
+    add("HARNESS_MAIN_COLUMNS(struct trace_state, trace_open, trace_row, trace_close, trace_fields, trace_columns)")
+    return "\n".join(lines) + "\n"
+
+
+def check_text_output(spec, keyword):
+    """
+    Check that ss_manifest.py reads the results back from the text output of the generated
+    test file: a row exiting slow start with every field set to 1 is written the way
+    generate_harness prints it and read with summarize_text.
+    :return: The RESULT_FIELDS it could not read.
+    """
+    lines = ["Exit Slow Start at 1"] if spec.get("exit") else []
+    lines.append("Line 1:")
+    for field in spec["fields"]:
+        label = field.get("label", field["name"])
+        lines.append(f"  {label}[0]: 1" if "count" in field else f"  {label}: 1")
+
+    with tempfile.NamedTemporaryFile('w', suffix=f'_{keyword}.txt', delete=False) as outfile:
+        outfile.write("\n".join(lines) + "\n\nFinished processing.\n")
     try:
-        # Define the directory paths
-        support_dir = 'support'  # Directory containing the source files
-        test_dir = 'test_dir'  # Directory where we want to copy the test files
+        summary = summarize_text(outfile.name)
+    finally:
+        os.remove(outfile.name)
+    return [name for name in RESULT_FIELDS if summary[name] is None]
+
+
+def write_harness(spec_file, keyword, test_dir):
+    """Generate test_<keyword>.c of a spec in the test directory, leaving it alone when unchanged."""
+    spec = load_spec(spec_file)
+    content = generate_harness(spec, keyword)
+    unread = check_text_output(spec, keyword)
+    if unread:
+        print(f"Warning: ss_manifest.py cannot read {', '.join(unread)} from the text output of test_{keyword}.c "
+              f"(see \"exit\" and the field labels in load_spec)")
+    dest = os.path.join(test_dir, f'test_{keyword}.c')
+    if os.path.isfile(dest):
+        with open(dest, 'r') as infile:
+            if infile.read() == content:
+                print(f"Unchanged: {dest}")
+                return
+    with open(dest, 'w') as outfile:
+        outfile.write(content)
+    print(f"Generated: {dest} from {spec_file}")
+
 
+def generate_test_files(keyword, test_dir='test_dir', support_dir='support', spec_file=None):
+    """
+    Generate the test files by extracting the necessary files.
+    :param test_dir: Directory where we want to copy the test files.
+    :param support_dir: Directory containing the source files.
+    :param spec_file: Optional harness spec (see load_spec) the test file is generated from.
+    """
+    try:
         # Ensure the test directory exists
         os.makedirs(test_dir, exist_ok=True)
 
         # Define the paths for the necessary files
         cc_helper_file = os.path.join(support_dir, 'cc_helper_function.h')
+        test_harness_file = os.path.join(support_dir, 'test_harness.h')
+        cc_profile_file = os.path.join(support_dir, 'cc_profile.h')
         test_file_keyword = os.path.join(support_dir, f'test_{keyword}.c')
         test_file_base = os.path.join(support_dir, 'test_base.c')
+        spec_file_keyword = os.path.join(support_dir, f'{keyword}.spec.json')
 
         # Copy cc_helper_function.h to the test_dir
         copy_file_if_exists(cc_helper_file, os.path.join(test_dir, 'cc_helper_function.h'))
 
-        # Check if the test file with the keyword exists
-        if os.path.isfile(test_file_keyword):
+        # Copy test_harness.h (the main() shared by every test file) to the test_dir
+        copy_file_if_exists(test_harness_file, os.path.join(test_dir, 'test_harness.h'))
+
+        # Copy cc_profile.h (the runtime of the instrumented builds, see ss_extract.py -I) to the test_dir
+        copy_file_if_exists(cc_profile_file, os.path.join(test_dir, 'cc_profile.h'))
+
+        # Generate the test file from a spec given on the command line, else use the hand-written one,
+        # else the spec of the support folder, else test_base.c
+        if spec_file:
+            write_harness(spec_file, keyword, test_dir)
+        elif os.path.isfile(test_file_keyword):
             # If the test file with the keyword exists, copy it
             copy_file_if_exists(test_file_keyword, os.path.join(test_dir, f'test_{keyword}.c'))
+        elif os.path.isfile(spec_file_keyword):
+            write_harness(spec_file_keyword, keyword, test_dir)
         else:
             # If the test file with the keyword does not exist, copy test_base.c
             copy_file_if_exists(test_file_base, os.path.join(test_dir, 'test_base.c'))
-            print(f"Note: The test file test_{keyword}.c was not found. Please generate it manually based on test_base.c.")
+            print(f"Note: The test file test_{keyword}.c was not found. Please generate it manually based on test_base.c, "
+                  f"or write a harness spec (see load_spec) and pass it with -S.")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -46,12 +353,16 @@ def main():
     parser = argparse.ArgumentParser(description="Generate test files from the support folder.")
     
     parser.add_argument("-k", "--keyword", required=True, help="The keyword used for generating test file (e.g., 'SEARCH').")
+    parser.add_argument("-d", "--test_dir", default="test_dir", help="The directory receiving the test files (default: test_dir).")
+    parser.add_argument("-s", "--support_dir", default="support", help="The folder containing the support files (default: support).")
+    parser.add_argument("-S", "--spec", help="Generate test_<keyword>.c from this harness spec (.json) instead of copying it "
+                                             "(default: <support_dir>/<keyword>.spec.json when there is no test_<keyword>.c).")
 
     # Parse arguments
     args = parser.parse_args()
 
     # Generate the necessary test files
-    generate_test_files(args.keyword)
+    generate_test_files(args.keyword, args.test_dir, args.support_dir, args.spec)
 
 if __name__ == "__main__":
     main()
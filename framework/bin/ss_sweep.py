@@ -0,0 +1,190 @@
+import os
+import re
+import csv
+import shutil
+import itertools
+import subprocess
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from ss_run import collect_input_files, run_tasks, print_summary
+from ss_reduce import reduce_file
+
+# Columns of the sweep table after the parameter columns
+RESULT_COLUMNS = ["trace", "passed", "rows", "exit_us", "exit_cwnd", "final_cwnd"]
+
+# Files of the test directory needed to build a variant
+SOURCE_EXTENSIONS = (".c", ".h")
+
+
+def parse_grid(definitions):
+    """
+    Parse the -D NAME=v1,v2,... options into the parameter grid.
+    :param definitions: List of "NAME=v1,v2,..." strings.
+    :return: List of (name, [values]) pairs, in command-line order.
+    """
+    grid = []
+    for definition in definitions:
+        name, sep, values = definition.partition("=")
+        name = name.strip()
+        values = [value.strip() for value in values.split(",") if value.strip()]
+        if not sep or not re.fullmatch(r"[A-Za-z_]\w*", name) or not values:
+            raise ValueError(f"invalid override '{definition}', expected NAME=value[,value...]")
+        if name in [existing for existing, _ in grid]:
+            raise ValueError(f"{name} is given more than once")
+        grid.append((name, values))
+    return grid
+
+
+def expand_grid(grid):
+    """
+    Expand the grid into every combination of its values.
+    :return: List of parameter tuples, each a list of (name, value) pairs.
+    """
+    names = [name for name, _ in grid]
+    return [list(zip(names, values)) for values in itertools.product(*(values for _, values in grid))]
+
+
+# Characters of a parameter value that are replaced in a directory name
+_unsafe_characters = re.compile(r"[^\w.+-]")
+
+
+def variant_name(params):
+    """Directory name of a parameter tuple, e.g. SEARCH_THRESH-40_SEARCH_BINS-12."""
+    if not params:
+        return "default"
+    return "_".join(f"{name}-{_unsafe_characters.sub('_', value)}" for name, value in params)
+
+
+def build_variant(keyword, test_dir, variant_dir, params, make_args=()):
+    """
+    Copy the sources of the test directory into <variant_dir>/build and compile them
+    with the parameter tuple passed to the Makefile as DEFINES.
+    :param make_args: Other variables given to make, e.g. ["PROFILE=release"].
+    :return: Tuple (built, executable or error message).
+    """
+    try:
+        makefile = os.path.join(test_dir, "Makefile")
+        with open(makefile, 'r') as infile:
+            if "$(DEFINES)" not in infile.read():
+                return False, f"{makefile} has no DEFINES variable; regenerate it with ss_extract.py"
+
+        # Start from a clean copy so that no object of another variant is reused
+        build_dir = os.path.join(variant_dir, "build")
+        if os.path.isdir(build_dir):
+            shutil.rmtree(build_dir)
+        os.makedirs(build_dir)
+        for filename in os.listdir(test_dir):
+            if filename == "Makefile" or filename.endswith(SOURCE_EXTENSIONS):
+                shutil.copy(os.path.join(test_dir, filename), build_dir)
+
+        defines = " ".join(f"-D{name}={value}" for name, value in params)
+        process = subprocess.run(["make", "-C", build_dir, f"DEFINES={defines}", *make_args],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        executable = os.path.join(build_dir, f"test_{keyword}")
+        if process.returncode != 0 or not os.path.isfile(executable):
+            return False, process.stdout.strip().splitlines()[-1] if process.stdout.strip() else "make failed"
+        return True, executable
+
+    except Exception as e:
+        return False, str(e)
+
+
+def summarize_output(output_file):
+    """
+    Reduce the records of one trace (-F npy output) to the metrics of the sweep table.
+    The exit from slow start is the first row whose ssthresh is set, or else the
+    first row where the exit flag of the harness is raised.
+    :return: Dictionary with rows, exit_us, exit_cwnd and final_cwnd (None when unknown).
+    """
+    return reduce_file(output_file, ["rows", "exit"])
+
+
+def run_sweep(keyword, test_dir, input_folder, output_folder, grid, jobs=1, batch_size=1):
+    """
+    Build one test binary per parameter tuple of the grid, run each of them over the
+    .csv files of the input folder and gather the results in <output_folder>/sweep_results.csv.
+    :param grid: List of (name, [values]) pairs, see parse_grid().
+    :param jobs: Number of builds, then traces, run in parallel (0 uses every CPU).
+    :param batch_size: Number of traces replayed by one process of a test binary.
+    :return: True if every variant was built and passed on every trace.
+    """
+    try:
+        jobs = jobs or os.cpu_count() or 1
+        variants = expand_grid(grid)
+        names = [name for name, _ in grid]
+        os.makedirs(output_folder, exist_ok=True)
+        print(f"Sweeping {len(variants)} variants of test_{keyword} over {input_folder}")
+
+        # Step 1: Build every variant in its own directory, in parallel
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            builds = list(pool.map(
+                lambda params: build_variant(keyword, test_dir, os.path.join(output_folder, variant_name(params)), params),
+                variants))
+
+        # Step 2: Run every variant over the corpus and reduce its outputs to one row per trace
+        table = []
+        ok = True
+        for params, (built, executable) in zip(variants, builds):
+            name = variant_name(params)
+            if not built:
+                print(f"Error building {name}: {executable}")
+                ok = False
+                continue
+
+            print(f"\nVariant {name}:")
+            variant_output = os.path.join(output_folder, name, "out")
+            os.makedirs(variant_output, exist_ok=True)
+            tasks = collect_input_files(input_folder, variant_output, ".npy")
+            results = run_tasks(executable, tasks, jobs, batch_size, harness_args=["-F", "npy"])
+            print_summary(results)
+
+            for input_file, output_file in sorted(tasks):
+                passed, _ = results[input_file]
+                summary = summarize_output(output_file) if passed else {}
+                ok = ok and passed
+                table.append([value for _, value in params]
+                             + [os.path.basename(input_file), int(passed)]
+                             + [summary.get(column) for column in RESULT_COLUMNS[2:]])
+
+        # Step 3: Write the table keyed by parameter tuple and trace
+        table_file = os.path.join(output_folder, "sweep_results.csv")
+        with open(table_file, 'w', newline='') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(names + RESULT_COLUMNS)
+            writer.writerows([["" if value is None else value for value in row] for row in table])
+        print(f"\nSweep results written to {table_file}")
+        return ok
+
+    except Exception as e:
+        print(f"Error running the sweep: {e}")
+        return False
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Build and run the test binary for every combination of compile-time overrides.")
+
+    parser.add_argument("-k", "--keyword", required=True, help="The keyword used for the test (e.g., 'search').")
+    parser.add_argument("-d", "--test_dir", required=True, help="The directory with the generated sources and Makefile.")
+    parser.add_argument("-i", "--input_folder", required=True, help="The folder containing the input .csv files.")
+    parser.add_argument("-o", "--output_folder", required=True, help="The folder receiving the variants and sweep_results.csv.")
+    parser.add_argument("-D", dest="defines", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Values of a macro to sweep; repeat for each macro (e.g., -D SEARCH_THRESH=25,35,45).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of builds and traces run in parallel (0 = all CPUs, default: 1).")
+    parser.add_argument("-b", "--batch", type=int, default=1, metavar="N",
+                        help="Replay up to N traces per process of a test binary (default: 1).")
+
+    args = parser.parse_args()
+
+    try:
+        grid = parse_grid(args.defines)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not run_sweep(args.keyword, args.test_dir, args.input_folder, args.output_folder,
+                     grid, args.jobs, args.batch):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
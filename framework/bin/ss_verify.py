@@ -0,0 +1,426 @@
+import os
+import re
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# Value of ssthresh before the first exit from slow start (TCP_INFINITE_SSTHRESH)
+INFINITE_SSTHRESH = 0x7fffffff
+
+# Kernel ss_status of a flow in slow start
+SS_STATUS_SLOW_START = 1
+
+# Text output of the harnesses: start of a row block, the fields used here, and exit events
+_line_pattern = re.compile(r"^Line (\d+):")
+_field_pattern = re.compile(r"^  (now_us|cwnd|snd_cwnd|ssthresh): (\d+)")
+_exit_pattern = re.compile(r"Exits? .*? at (\d+)")
+
+
+def _empty_chunk(names):
+    """Return a chunk without rows holding the given int64 columns."""
+    return {name: np.empty(0, dtype=np.int64) for name in names}
+
+
+def _chunk_rows(chunk):
+    """Return the number of rows of a chunk."""
+    return len(chunk["now_us"])
+
+
+def read_kernel_log(path, chunk_rows, info, mss=None):
+    """
+    Stream a kernel log of verification_csv in chunks of columns.
+    :param info: Dictionary receiving the kernel exit time from slow start ("exit_us").
+    :param mss: Segment size used to derive cwnd_pkt from cwnd_MB when the log has no cwnd_pkt.
+    :return: Generator of {"now_us", "cwnd", "ssthresh"} chunks of int64 arrays.
+    """
+    info["exit_us"] = None
+    with open(path, 'r') as f:
+        header = [name.strip() for name in f.readline().strip().split(",")]
+        if "cwnd_pkt" in header:
+            columns = ["now_us", "cwnd_pkt", "ssthresh_pkt", "ss_status"]
+        elif "cwnd_MB" in header and mss:
+            columns = ["now_us", "cwnd_MB", "ssthresh_pkt", "ss_status"]
+        else:
+            raise ValueError(f"{path} has no cwnd_pkt column; pass --mss to derive it from cwnd_MB")
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(missing)} column")
+        usecols = [header.index(name) for name in columns]
+
+        while True:
+            lines = [line for line in islice(f, chunk_rows) if line.strip()]
+            if not lines:
+                return
+            data = np.loadtxt(lines, delimiter=",", usecols=usecols, ndmin=2)
+            if columns[1] == "cwnd_MB":
+                cwnd = np.rint(data[:, 1] * 1e6 / mss)
+            else:
+                cwnd = data[:, 1]
+
+            # The flow leaves slow start at the first row with another ss_status
+            if info["exit_us"] is None:
+                exited = np.flatnonzero(data[:, 3] != SS_STATUS_SLOW_START)
+                if len(exited):
+                    info["exit_us"] = int(data[exited[0], 0])
+
+            yield {
+                "now_us": data[:, 0].astype(np.int64),
+                "cwnd": cwnd.astype(np.int64),
+                "ssthresh": data[:, 2].astype(np.int64),
+            }
+
+
+def read_harness_text(path, chunk_rows, info):
+    """
+    Stream the text output of a harness in chunks of columns.
+    Rows are the "Line N:" blocks; cwnd is read from "cwnd" or "snd_cwnd".
+    :param info: Dictionary receiving the exit time from the first "... Exits ... at" line ("exit_us").
+    :return: Generator of {"line", "now_us", "cwnd"[, "ssthresh"]} chunks of int64 arrays.
+    """
+    info["exit_us"] = None
+    rows = {"line": [], "now_us": [], "cwnd": [], "ssthresh": []}
+    current = None
+
+    def flush():
+        names = [name for name in rows if len(rows[name]) == len(rows["line"])]
+        chunk = {name: np.array(rows[name], dtype=np.int64) for name in names}
+        for values in rows.values():
+            values.clear()
+        return chunk
+
+    with open(path, 'r') as f:
+        for text in f:
+            match = _line_pattern.match(text)
+            if match:
+                if current is not None:
+                    for name in rows:
+                        if name in current:
+                            rows[name].append(current[name])
+                    if len(rows["line"]) >= chunk_rows:
+                        yield flush()
+                current = {"line": int(match.group(1))}
+                continue
+
+            match = _field_pattern.match(text)
+            if match and current is not None:
+                name = "cwnd" if match.group(1) == "snd_cwnd" else match.group(1)
+                current.setdefault(name, int(match.group(2)))
+                continue
+
+            if info["exit_us"] is None:
+                match = _exit_pattern.search(text)
+                if match:
+                    info["exit_us"] = int(match.group(1))
+
+    if current is not None:
+        for name in rows:
+            if name in current:
+                rows[name].append(current[name])
+    if rows["line"]:
+        yield flush()
+
+
+def read_harness_npy(path, chunk_rows, info):
+    """
+    Stream the .npy records of a harness (-F npy) in chunks of columns, through a memory map.
+    :param info: Dictionary receiving the exit time, the first row whose ssthresh is set ("exit_us").
+    :return: Generator of {"line", "now_us", "cwnd"[, "ssthresh"]} chunks of int64 arrays.
+    """
+    info["exit_us"] = None
+    records = np.load(path, mmap_mode='r')
+    names = records.dtype.names or ()
+    cwnd_name = "cwnd" if "cwnd" in names else "snd_cwnd"
+    if "now_us" not in names or cwnd_name not in names:
+        raise ValueError(f"{path} has no now_us and cwnd fields")
+
+    for start in range(0, len(records), chunk_rows):
+        part = records[start:start + chunk_rows]
+        chunk = {
+            "line": np.asarray(part["line"] if "line" in names else np.arange(start, start + len(part)), dtype=np.int64),
+            "now_us": np.asarray(part["now_us"], dtype=np.int64),
+            "cwnd": np.asarray(part[cwnd_name], dtype=np.int64),
+        }
+        if "ssthresh" in names:
+            chunk["ssthresh"] = np.asarray(part["ssthresh"], dtype=np.int64)
+            if info["exit_us"] is None:
+                exited = np.flatnonzero(chunk["ssthresh"] != INFINITE_SSTHRESH)
+                if len(exited):
+                    info["exit_us"] = int(chunk["now_us"][exited[0]])
+        yield chunk
+
+
+def _join_complete(left, right):
+    """
+    Join two chunks holding only complete timestamp groups on now_us.
+    Rows sharing a timestamp are paired in order of appearance.
+    :return: Indices of the matched rows in the left and in the right chunk.
+    """
+    def keys(ts):
+        occurrence = np.arange(len(ts)) - np.searchsorted(ts, ts, side='left')
+        return ts * (1 << 20) + occurrence
+
+    _, left_index, right_index = np.intersect1d(keys(left["now_us"]), keys(right["now_us"]),
+                                                assume_unique=True, return_indices=True)
+    return left_index, right_index
+
+
+def merge_join(left_chunks, right_chunks):
+    """
+    Merge-join two streams of chunks sorted by now_us with bounded memory.
+    Only rows older than the last timestamp read from both streams are joined,
+    so a group of equal timestamps is never split across two calls of the join.
+    :return: Generator of (left part, right part, left rows, right rows) tuples, where the
+             parts are the matched rows and the counts are the rows consumed from each stream.
+    """
+    left_chunks, right_chunks = iter(left_chunks), iter(right_chunks)
+    left = right = None
+    left_done = right_done = False
+
+    while True:
+        # Read from the stream that is behind, so both buffers stay about one chunk long
+        pull_left = not left_done and (right_done or left is None or _chunk_rows(left) == 0 or
+                                       (right is not None and _chunk_rows(right) > 0 and
+                                        left["now_us"][-1] <= right["now_us"][-1]))
+        if pull_left or (not right_done):
+            stream = left_chunks if pull_left else right_chunks
+            chunk = next(stream, None)
+            if chunk is not None:
+                if np.any(np.diff(chunk["now_us"]) < 0):
+                    raise ValueError("rows are not sorted by now_us")
+                buffer = left if pull_left else right
+                if buffer is not None:
+                    if _chunk_rows(buffer) and _chunk_rows(chunk) and chunk["now_us"][0] < buffer["now_us"][-1]:
+                        raise ValueError("rows are not sorted by now_us")
+                    chunk = {name: np.concatenate([buffer[name], chunk[name]]) for name in chunk}
+                if pull_left:
+                    left = chunk
+                else:
+                    right = chunk
+            elif pull_left:
+                left_done = True
+            else:
+                right_done = True
+
+        if left is None and left_done:
+            left = _empty_chunk(["now_us"])
+        if right is None and right_done:
+            right = _empty_chunk(["now_us"])
+        if left is None or right is None:
+            continue
+
+        # Rows before the boundary can no longer be matched by rows still to be read
+        boundary = None
+        if not left_done and _chunk_rows(left):
+            boundary = left["now_us"][-1]
+        if not right_done and _chunk_rows(right):
+            boundary = right["now_us"][-1] if boundary is None else min(boundary, right["now_us"][-1])
+        if boundary is None and not (left_done and right_done):
+            continue
+
+        left_end = _chunk_rows(left) if boundary is None else np.searchsorted(left["now_us"], boundary, side='left')
+        right_end = _chunk_rows(right) if boundary is None else np.searchsorted(right["now_us"], boundary, side='left')
+        left_part = {name: values[:left_end] for name, values in left.items()}
+        right_part = {name: values[:right_end] for name, values in right.items()}
+        left = {name: values[left_end:] for name, values in left.items()}
+        right = {name: values[right_end:] for name, values in right.items()}
+
+        left_index, right_index = _join_complete(left_part, right_part)
+        yield ({name: values[left_index] for name, values in left_part.items()},
+               {name: values[right_index] for name, values in right_part.items()},
+               left_end, right_end)
+
+        if left_done and right_done and not _chunk_rows(left) and not _chunk_rows(right):
+            return
+
+
+def verify_file(harness_file, kernel_file, chunk_rows=65536, cwnd_tolerance=0, mss=None, all_rows=False):
+    """
+    Compare one harness output with its kernel log.
+    :param cwnd_tolerance: Largest cwnd difference (in packets) not counted as a divergence.
+    :param all_rows: Compare cwnd on every row instead of only the rows before the kernel
+                     exits slow start (the harnesses do not model congestion avoidance).
+    :return: Dictionary of the statistics of the comparison.
+    """
+    harness_info, kernel_info = {}, {}
+    if harness_file.endswith(".npy"):
+        harness_chunks = read_harness_npy(harness_file, chunk_rows, harness_info)
+    else:
+        harness_chunks = read_harness_text(harness_file, chunk_rows, harness_info)
+    kernel_chunks = read_kernel_log(kernel_file, chunk_rows, kernel_info, mss)
+
+    stats = {
+        "harness": harness_file,
+        "kernel": kernel_file,
+        "harness_rows": 0,
+        "kernel_rows": 0,
+        "matched_rows": 0,
+        "compared_rows": 0,
+        "cwnd_divergent_rows": 0,
+        "cwnd_max_abs_diff": 0,
+        "cwnd_mean_abs_diff": 0.0,
+        "ssthresh_divergent_rows": None,
+        "first_divergence": None,
+    }
+    abs_diff_sum = 0
+
+    for harness, kernel, harness_rows, kernel_rows in merge_join(harness_chunks, kernel_chunks):
+        stats["harness_rows"] += int(harness_rows)
+        stats["kernel_rows"] += int(kernel_rows)
+        if not len(harness["now_us"]):
+            continue
+        stats["matched_rows"] += len(harness["now_us"])
+
+        # The kernel log was read up to these rows, so its exit time is already known if it happened
+        if not all_rows and kernel_info["exit_us"] is not None:
+            in_slow_start = kernel["now_us"] < kernel_info["exit_us"]
+            harness = {name: values[in_slow_start] for name, values in harness.items()}
+            kernel = {name: values[in_slow_start] for name, values in kernel.items()}
+            if not len(harness["now_us"]):
+                continue
+        stats["compared_rows"] += len(harness["now_us"])
+
+        abs_diff = np.abs(harness["cwnd"] - kernel["cwnd"])
+        divergent = np.flatnonzero(abs_diff > cwnd_tolerance)
+        abs_diff_sum += int(abs_diff.sum())
+        stats["cwnd_max_abs_diff"] = max(stats["cwnd_max_abs_diff"], int(abs_diff.max()))
+        stats["cwnd_divergent_rows"] += len(divergent)
+        if len(divergent) and stats["first_divergence"] is None:
+            i = divergent[0]
+            stats["first_divergence"] = {
+                "line": int(harness["line"][i]),
+                "now_us": int(harness["now_us"][i]),
+                "harness_cwnd": int(harness["cwnd"][i]),
+                "kernel_cwnd": int(kernel["cwnd"][i]),
+            }
+
+        if "ssthresh" in harness:
+            mismatches = int(np.count_nonzero(harness["ssthresh"] != kernel["ssthresh"]))
+            stats["ssthresh_divergent_rows"] = (stats["ssthresh_divergent_rows"] or 0) + mismatches
+
+    if stats["compared_rows"]:
+        stats["cwnd_mean_abs_diff"] = abs_diff_sum / stats["compared_rows"]
+    stats["harness_exit_us"] = harness_info["exit_us"]
+    stats["kernel_exit_us"] = kernel_info["exit_us"]
+    if harness_info["exit_us"] is not None and kernel_info["exit_us"] is not None:
+        stats["exit_delta_us"] = harness_info["exit_us"] - kernel_info["exit_us"]
+    else:
+        stats["exit_delta_us"] = None
+    return stats
+
+
+def trace_number(path):
+    """Return the trailing number of a file name (log_data_testframework3.txt -> 3), or None."""
+    match = re.search(r"(\d+)$", os.path.splitext(os.path.basename(path))[0])
+    return int(match.group(1)) if match else None
+
+
+def pair_files(output_folder, verification_folder):
+    """
+    Pair each harness output (.txt or .npy) with the kernel log carrying the same trace
+    number, e.g. log_data_testframework3.txt with log_data3.csv.
+    :return: List of (harness file, kernel file) pairs, and the list of unpaired outputs.
+    """
+    kernel_logs = {}
+    for filename in os.listdir(verification_folder):
+        if filename.endswith(".csv") and not filename.startswith("."):
+            kernel_logs[trace_number(filename)] = os.path.join(verification_folder, filename)
+
+    pairs, unpaired = [], []
+    for filename in sorted(os.listdir(output_folder)):
+        if not filename.endswith((".txt", ".npy")):
+            continue
+        harness_file = os.path.join(output_folder, filename)
+        number = trace_number(filename)
+        if number is not None and number in kernel_logs:
+            pairs.append((harness_file, kernel_logs[number]))
+        else:
+            unpaired.append(harness_file)
+    return pairs, unpaired
+
+
+def print_report(stats, cwnd_tolerance):
+    """Print the verification result of one file."""
+    status = "OK" if stats["cwnd_divergent_rows"] == 0 and stats["compared_rows"] else "DIVERGED"
+    print(f"{status} {stats['harness']} vs {stats['kernel']}")
+    print(f"  rows: {stats['matched_rows']} matched on now_us "
+          f"({stats['harness_rows']} harness, {stats['kernel_rows']} kernel), {stats['compared_rows']} compared")
+    print(f"  cwnd: {stats['cwnd_divergent_rows']} rows differ by more than {cwnd_tolerance} pkt, "
+          f"max |diff| {stats['cwnd_max_abs_diff']}, mean |diff| {stats['cwnd_mean_abs_diff']:.3f}")
+    if stats["ssthresh_divergent_rows"] is not None:
+        print(f"  ssthresh: {stats['ssthresh_divergent_rows']} rows differ")
+    if stats["exit_delta_us"] is not None:
+        print(f"  exit: harness {stats['harness_exit_us']} us, kernel {stats['kernel_exit_us']} us, "
+              f"delta {stats['exit_delta_us']} us")
+    else:
+        print(f"  exit: harness {stats['harness_exit_us']}, kernel {stats['kernel_exit_us']}")
+    first = stats["first_divergence"]
+    if first:
+        print(f"  first divergence: line {first['line']} at {first['now_us']} us, "
+              f"cwnd {first['harness_cwnd']} (harness) vs {first['kernel_cwnd']} (kernel)")
+    return status == "OK"
+
+
+def verify_corpus(output_folder, verification_folder, jobs=1, chunk_rows=65536, cwnd_tolerance=0, mss=None,
+                  all_rows=False):
+    """
+    Verify every harness output of a folder against the matching kernel logs.
+    :param jobs: Number of files verified in parallel (0 uses every CPU).
+    :param all_rows: Compare cwnd after the kernel exits slow start as well.
+    :return: True if every paired file matched the kernel log, False otherwise.
+    """
+    pairs, unpaired = pair_files(output_folder, verification_folder)
+    for harness_file in unpaired:
+        print(f"Warning: no kernel log for {harness_file}")
+    if not pairs:
+        print(f"Error: no harness output of {output_folder} matches a log of {verification_folder}.")
+        return False
+
+    # Parsing is CPU-bound, so the files are spread over processes
+    results = {}
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(jobs, len(pairs))) as pool:
+        futures = {pool.submit(verify_file, harness_file, kernel_file, chunk_rows, cwnd_tolerance, mss, all_rows): harness_file
+                   for harness_file, kernel_file in pairs}
+        for future in as_completed(futures):
+            harness_file = futures[future]
+            try:
+                results[harness_file] = future.result()
+            except (OSError, ValueError) as e:
+                print(f"Error verifying {harness_file}: {e}")
+                results[harness_file] = None
+
+    passed = 0
+    for harness_file in sorted(results):
+        if results[harness_file] is not None and print_report(results[harness_file], cwnd_tolerance):
+            passed += 1
+
+    print(f"\nSummary: {passed} matched, {len(results) - passed} diverged or failed, {len(results)} total.")
+    return passed == len(results)
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Verify harness outputs against the kernel logs of verification_csv.")
+
+    parser.add_argument("-o", "--output_folder", required=True, help="The folder with the harness outputs (.txt or .npy).")
+    parser.add_argument("-v", "--verification_folder", required=True, help="The folder with the kernel logs (log_dataN.csv).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of files verified in parallel (0 = all CPUs, default: 1).")
+    parser.add_argument("--chunk-rows", type=int, default=65536,
+                        help="Rows read at a time from each file (default: 65536).")
+    parser.add_argument("--cwnd-tolerance", type=int, default=0, metavar="PKT",
+                        help="Largest cwnd difference in packets not reported as a divergence (default: 0).")
+    parser.add_argument("--mss", type=int,
+                        help="Segment size in bytes, to derive cwnd in packets from cwnd_MB for logs without cwnd_pkt.")
+    parser.add_argument("--all-rows", action="store_true",
+                        help="Compare cwnd on every row, not only before the kernel exits slow start.")
+
+    args = parser.parse_args()
+
+    if not verify_corpus(args.output_folder, args.verification_folder, args.jobs,
+                         args.chunk_rows, args.cwnd_tolerance, args.mss, args.all_rows):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
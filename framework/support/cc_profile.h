@@ -0,0 +1,163 @@
+/*
+ *****************************************************************************
+ * Function Profile of the CC Module
+ * ----------------------------------------
+ * Runtime of the instrumentation shims generated by `ss_extract.py -I` in
+ * `<keyword>_module.c`, the only file that includes this header. When the test
+ * binary is built with `make INSTRUMENT=1` (-DCC_PROFILE), every function of
+ * the module is called through a shim that counts its calls and times them:
+ *
+ *   cc_profile_enter()       Start the timer of a call, on a stack of open calls.
+ *   cc_profile_exit(entry)   Stop it and add the call to the entry of the function.
+ *
+ * The clock is the time-stamp counter on x86 (rdtsc, a few cycles per read) and
+ * CLOCK_MONOTONIC elsewhere; ticks are converted to ns with the ticks counted
+ * between the start and the end of the process. Each function gets its total
+ * time and its self time (the total minus the calls it made to other functions
+ * of the module), so nested calls are not counted twice.
+ *
+ * At exit the profile of the whole process (all the traces of a batch run) is
+ * written as CSV, sorted by self time, on stderr or to the file named by the
+ * CC_PROFILE_FILE environment variable:
+ *   # CC function profile: <n> functions, clock <tsc|monotonic>, <ticks per ns> ticks/ns
+ *   function,calls,total_ns,self_ns,ns_per_call
+ *
+ * Without -DCC_PROFILE the shims and this runtime compile to nothing, and the
+ * module functions keep their names.
+ *****************************************************************************
+ */
+
+#ifndef CC_PROFILE_H
+#define CC_PROFILE_H
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define CC_PROFILE_CLOCK "tsc"
+static inline unsigned long long cc_profile_ticks(void) { return __rdtsc(); }
+#else
+#define CC_PROFILE_CLOCK "monotonic"
+static inline unsigned long long cc_profile_ticks(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (unsigned long long)ts.tv_sec * 1000000000ULL + (unsigned long long)ts.tv_nsec;
+}
+#endif
+
+/* Deepest nesting of module calls that is timed; deeper calls are only counted */
+#define CC_PROFILE_MAX_DEPTH 64
+
+/* Profile of one module function (one per shim, in <keyword>_module.c) */
+struct cc_profile_entry {
+    const char *name;
+    unsigned long long calls;
+    unsigned long long total;   /* ticks, including the calls to other module functions */
+    unsigned long long self;    /* ticks, without them */
+};
+
+/* An open call: when it started and the ticks spent in the calls it made */
+struct cc_profile_frame {
+    unsigned long long start;
+    unsigned long long children;
+};
+
+static struct cc_profile_frame cc_profile_stack[CC_PROFILE_MAX_DEPTH];
+static int cc_profile_depth;
+
+/* Reference points of the tick to ns conversion */
+static unsigned long long cc_profile_start_ticks;
+static struct timespec cc_profile_start_time;
+
+__attribute__((constructor))
+static void cc_profile_start(void)
+{
+    clock_gettime(CLOCK_MONOTONIC, &cc_profile_start_time);
+    cc_profile_start_ticks = cc_profile_ticks();
+}
+
+static inline void cc_profile_enter(void)
+{
+    if (cc_profile_depth < CC_PROFILE_MAX_DEPTH) {
+        cc_profile_stack[cc_profile_depth].children = 0;
+        cc_profile_stack[cc_profile_depth].start = cc_profile_ticks();
+    }
+    cc_profile_depth++;
+}
+
+static inline void cc_profile_exit(struct cc_profile_entry *entry)
+{
+    unsigned long long end = cc_profile_ticks();
+
+    cc_profile_depth--;
+    entry->calls++;
+    if (cc_profile_depth >= CC_PROFILE_MAX_DEPTH)
+        return;
+
+    struct cc_profile_frame *frame = &cc_profile_stack[cc_profile_depth];
+    unsigned long long elapsed = end - frame->start;
+    entry->total += elapsed;
+    entry->self += elapsed - frame->children;
+    if (cc_profile_depth > 0)
+        frame[-1].children += elapsed;
+}
+
+static int cc_profile_compare(const void *a, const void *b)
+{
+    const struct cc_profile_entry *x = *(const struct cc_profile_entry *const *)a;
+    const struct cc_profile_entry *y = *(const struct cc_profile_entry *const *)b;
+
+    if (x->self != y->self)
+        return x->self < y->self ? 1 : -1;
+    return x->calls < y->calls ? 1 : (x->calls > y->calls ? -1 : 0);
+}
+
+/* Write the profile of the entries (see the format above); called once, at exit */
+static void cc_profile_dump(struct cc_profile_entry *entries, int count)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    unsigned long long ticks = cc_profile_ticks() - cc_profile_start_ticks;
+    double ns = (double)(now.tv_sec - cc_profile_start_time.tv_sec) * 1e9
+              + (double)(now.tv_nsec - cc_profile_start_time.tv_nsec);
+    double ns_per_tick = ticks > 0 && ns > 0 ? ns / (double)ticks : 1.0;
+
+    const char *path = getenv("CC_PROFILE_FILE");
+    FILE *out = path && path[0] ? fopen(path, "w") : stderr;
+    if (!out) {
+        perror("Error opening CC_PROFILE_FILE");
+        out = stderr;
+    }
+
+    struct cc_profile_entry **sorted = malloc(sizeof(*sorted) * (count > 0 ? count : 1));
+    if (!sorted) {
+        fprintf(stderr, "Error: out of memory writing the CC function profile\n");
+        if (out != stderr)
+            fclose(out);
+        return;
+    }
+    for (int i = 0; i < count; i++)
+        sorted[i] = &entries[i];
+    qsort(sorted, count, sizeof(*sorted), cc_profile_compare);
+
+    fprintf(out, "# CC function profile: %d functions, clock %s, %.4f ticks/ns\n",
+            count, CC_PROFILE_CLOCK, 1.0 / ns_per_tick);
+    fprintf(out, "function,calls,total_ns,self_ns,ns_per_call\n");
+    for (int i = 0; i < count; i++) {
+        const struct cc_profile_entry *entry = sorted[i];
+        if (!entry->calls)
+            continue;
+        double total = (double)entry->total * ns_per_tick;
+        fprintf(out, "%s,%llu,%.0f,%.0f,%.1f\n", entry->name, entry->calls, total,
+                (double)entry->self * ns_per_tick, total / (double)entry->calls);
+    }
+
+    free(sorted);
+    if (out != stderr)
+        fclose(out);
+}
+
+#endif /* CC_PROFILE_H */
@@ -0,0 +1,291 @@
+/*
+ *****************************************************************************
+ * Differential Harness
+ * ----------------------------------------
+ * Replays a trace through several CC algorithms in one process: each row is
+ * parsed once and handed to every algorithm, and their records are written
+ * side by side, one CSV line per row.
+ *
+ * The algorithms are the objects built by `make diff` in their test directories
+ * (see bin/ss_diff.py): the library build of the test file and module (see the
+ * HARNESS_LIBRARY section of test_harness.h), linked into one relocatable object
+ * whose cc_* entry points are renamed <namespace>_cc_* and whose other symbols
+ * are local. Each algorithm keeps its own headers, harness globals and record
+ * buffer, so algorithms with the same function names link together. The
+ * namespaces are listed by the generated diff_algorithms.h:
+ *   #define DIFF_ALGORITHMS(X) X(hystart_5_10) X(hystart_6_13)
+ *
+ * Output (stdout):
+ *   line,now_us,<ns>.<field>,...    One column per value of each record, <ns>.<field>[i]
+ *                                   for the values of an array field.
+ * An algorithm that wrote no record for a row (an invalid line, or a trace it
+ * stopped early) has empty cells on that line. The replay ends when every
+ * algorithm has stopped.
+ *
+ * Summary (-s <file>): the scalar fields that every algorithm records, compared
+ * on the rows where all of them wrote a record:
+ *   field,compared_rows,diff_rows,first_diff_line
+ *
+ * Usage:
+ *   test_diff [-s summary.csv] <input.csv | trace.bin | ->
+ *****************************************************************************
+ */
+
+/* Only the trace reader of test_harness.h is used here */
+#pragma GCC diagnostic ignored "-Wunused-function"
+#pragma GCC diagnostic ignored "-Wunused-variable"
+#include "test_harness.h"
+#include "diff_algorithms.h"
+
+#define DIFF_API_VERSION 1
+
+/* The entry points of one algorithm */
+struct diff_algorithm {
+    const char *name;
+    int (*api_version)(void);
+    int (*field_count)(void);
+    const char *(*field_name)(int i);
+    int (*field_size)(int i);
+    void *(*open)(void);
+    long long (*step)(void *h, const unsigned long long *const *columns, int column_count, long long rows,
+                      const unsigned int *lines, long long *records, long long *written);
+    void (*close)(void *h);
+};
+
+#define DIFF_DECLARE(ns)                                                                        \
+    int ns##_cc_api_version(void);                                                              \
+    int ns##_cc_field_count(void);                                                              \
+    const char *ns##_cc_field_name(int i);                                                      \
+    int ns##_cc_field_size(int i);                                                              \
+    void *ns##_cc_open(void);                                                                   \
+    long long ns##_cc_step(void *h, const unsigned long long *const *columns, int column_count, \
+                           long long rows, const unsigned int *lines, long long *records,       \
+                           long long *written);                                                 \
+    void ns##_cc_close(void *h);
+
+#define DIFF_ENTRY(ns)                                                                          \
+    {#ns, ns##_cc_api_version, ns##_cc_field_count, ns##_cc_field_name, ns##_cc_field_size,      \
+     ns##_cc_open, ns##_cc_step, ns##_cc_close},
+
+DIFF_ALGORITHMS(DIFF_DECLARE)
+
+static const struct diff_algorithm diff_algorithms[] = {DIFF_ALGORITHMS(DIFF_ENTRY)};
+
+#define DIFF_ALGORITHM_COUNT ((int)(sizeof(diff_algorithms) / sizeof(diff_algorithms[0])))
+
+/* Replay state of one algorithm */
+struct diff_run {
+    void *handle;
+    long long *record;
+    int width;          // Values per record
+    int written;        // Set when the current row wrote a record
+    int stopped;
+};
+
+/* A scalar field recorded by every algorithm, with its offset in each record */
+struct diff_common {
+    const char *name;
+    int offset[DIFF_ALGORITHM_COUNT];
+    unsigned long long compared;
+    unsigned long long differing;
+    int first_line;     // -1 until the first difference
+};
+
+/* Offset of a scalar field in the record of an algorithm, or -1 */
+static int diff_field_offset(const struct diff_algorithm *algorithm, const char *name)
+{
+    int offset = 0;
+    for (int i = 0; i < algorithm->field_count(); i++) {
+        if (strcmp(algorithm->field_name(i), name) == 0) {
+            return algorithm->field_size(i) == 1 ? offset : -1;
+        }
+        offset += algorithm->field_size(i);
+    }
+    return -1;
+}
+
+/* Write the header line: the row, then every value of the record of each algorithm */
+static void diff_write_header(void)
+{
+    printf("line,now_us");
+    for (int a = 0; a < DIFF_ALGORITHM_COUNT; a++) {
+        const struct diff_algorithm *algorithm = &diff_algorithms[a];
+        for (int i = 0; i < algorithm->field_count(); i++) {
+            int size = algorithm->field_size(i);
+            for (int j = 0; j < size; j++) {
+                if (size == 1) {
+                    printf(",%s.%s", algorithm->name, algorithm->field_name(i));
+                } else {
+                    printf(",%s.%s[%d]", algorithm->name, algorithm->field_name(i), j);
+                }
+            }
+        }
+    }
+    printf("\n");
+}
+
+/* Collect the scalar fields that every algorithm records, in the order of the first one */
+static int diff_common_fields(struct diff_common **common)
+{
+    const struct diff_algorithm *first = &diff_algorithms[0];
+    int count = 0;
+
+    *common = calloc(first->field_count() ? first->field_count() : 1, sizeof(**common));
+    if (!*common) {
+        return -1;
+    }
+    for (int i = 0; i < first->field_count(); i++) {
+        struct diff_common *field = &(*common)[count];
+        field->name = first->field_name(i);
+        field->first_line = -1;
+
+        int shared = 1;
+        for (int a = 0; a < DIFF_ALGORITHM_COUNT && shared; a++) {
+            field->offset[a] = diff_field_offset(&diff_algorithms[a], field->name);
+            shared = field->offset[a] >= 0;
+        }
+        count += shared;
+    }
+    return count;
+}
+
+static int diff_write_summary(const char *summary_file, const struct diff_common *common, int count)
+{
+    FILE *out = fopen(summary_file, "w");
+    if (!out) {
+        perror("Failed to open the summary file");
+        return 1;
+    }
+    fprintf(out, "field,compared_rows,diff_rows,first_diff_line\n");
+    for (int i = 0; i < count; i++) {
+        fprintf(out, "%s,%llu,%llu,", common[i].name, common[i].compared, common[i].differing);
+        if (common[i].first_line >= 0) {
+            fprintf(out, "%d", common[i].first_line);
+        }
+        fprintf(out, "\n");
+    }
+    return fclose(out) != 0;
+}
+
+int main(int argc, char *argv[])
+{
+    const char *summary_file = NULL;
+    int opt;
+
+    while ((opt = getopt(argc, argv, "s:")) != -1) {
+        if (opt == 's') {
+            summary_file = optarg;
+        } else {
+            fprintf(stderr, "Usage: %s [-s summary.csv] <input.csv | trace.bin | ->\n", argv[0]);
+            return 1;
+        }
+    }
+    if (optind != argc - 1) {
+        fprintf(stderr, "Usage: %s [-s summary.csv] <input.csv | trace.bin | ->\n", argv[0]);
+        return 1;
+    }
+
+    // Step 1: Open every algorithm
+    struct diff_run runs[DIFF_ALGORITHM_COUNT];
+    memset(runs, 0, sizeof(runs));
+    for (int a = 0; a < DIFF_ALGORITHM_COUNT; a++) {
+        const struct diff_algorithm *algorithm = &diff_algorithms[a];
+        if (algorithm->api_version() != DIFF_API_VERSION) {
+            fprintf(stderr, "%s: unsupported library API version %d\n", algorithm->name, algorithm->api_version());
+            return 1;
+        }
+        for (int i = 0; i < algorithm->field_count(); i++) {
+            runs[a].width += algorithm->field_size(i);
+        }
+        runs[a].record = calloc(runs[a].width ? runs[a].width : 1, sizeof(long long));
+        runs[a].handle = algorithm->open();
+        if (!runs[a].record || !runs[a].handle) {
+            fprintf(stderr, "%s: failed to initialize the test state\n", algorithm->name);
+            return 1;
+        }
+    }
+
+    struct diff_common *common;
+    int common_count = diff_common_fields(&common);
+    if (common_count < 0) {
+        perror("Failed to allocate the summary");
+        return 1;
+    }
+
+    // Step 2: Open the trace
+    struct harness_reader reader;
+    if (harness_reader_open(&reader, argv[optind]) != 0) {
+        perror("Failed to open file");
+        return 1;
+    }
+
+    // Step 3: Parse each row once and step every algorithm that is still running on it
+    diff_write_header();
+    struct harness_row row;
+    const unsigned long long *columns[TRACE_MAX_COLUMNS];
+    for (int c = 0; c < TRACE_MAX_COLUMNS; c++) {
+        columns[c] = &row.v[c];
+    }
+
+    int running = DIFF_ALGORITHM_COUNT;
+    while (running > 0 && harness_reader_next(&reader, &row)) {
+        unsigned int line = (unsigned int)row.line_number;
+        int all_written = 1;
+
+        for (int a = 0; a < DIFF_ALGORITHM_COUNT; a++) {
+            struct diff_run *run = &runs[a];
+            long long written = 0;
+            if (!run->stopped && diff_algorithms[a].step(run->handle, columns, row.columns, 1, &line,
+                                                         run->record, &written) != 1) {
+                run->stopped = 1;
+                running--;
+            }
+            run->written = written == 1;
+            all_written &= run->written;
+        }
+
+        printf("%d,%llu", row.line_number, row.v[TRACE_NOW_US]);
+        for (int a = 0; a < DIFF_ALGORITHM_COUNT; a++) {
+            for (int i = 0; i < runs[a].width; i++) {
+                if (runs[a].written) {
+                    printf(",%lld", runs[a].record[i]);
+                } else {
+                    printf(",");
+                }
+            }
+        }
+        printf("\n");
+
+        // Compare the common fields on the rows that every algorithm recorded
+        for (int i = 0; i < common_count && all_written; i++) {
+            struct diff_common *field = &common[i];
+            long long value = runs[0].record[field->offset[0]];
+            int same = 1;
+            for (int a = 1; a < DIFF_ALGORITHM_COUNT; a++) {
+                same &= runs[a].record[field->offset[a]] == value;
+            }
+            field->compared++;
+            if (!same) {
+                field->differing++;
+                if (field->first_line < 0) {
+                    field->first_line = row.line_number;
+                }
+            }
+        }
+    }
+
+    // Step 4: Close everything and write the summary
+    harness_reader_close(&reader);
+    for (int a = 0; a < DIFF_ALGORITHM_COUNT; a++) {
+        diff_algorithms[a].close(runs[a].handle);
+        free(runs[a].record);
+    }
+
+    int status = summary_file ? diff_write_summary(summary_file, common, common_count) : 0;
+    free(common);
+    if (fflush(stdout) != 0) {
+        perror("Failed to write the output");
+        return 1;
+    }
+    return status;
+}
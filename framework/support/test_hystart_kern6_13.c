@@ -22,25 +22,38 @@
 #include "tcp.h"
 #include "hystart_defs.h"
 #include "cc_helper_function.h"
-
-int main(int argc, char *argv[]) {
-    if (argc < 2) {
-        fprintf(stderr, "Usage: %s <input.csv>\n", argv[0]);
-        return 1;
-    }
-
-    // Open the CSV file
-    FILE *file = fopen(argv[1], "r");
-    if (!file) {
-        perror("Failed to open file");
-        return 1;
-    }
-
+#include "test_harness.h"
+
+// State of one trace; it is rebuilt by trace_open() before every trace
+struct trace_state {
+    struct sock *sk;
+    int EXIT_FLAG;
+    int LOSS_FLAG;
+    u32 pre_acked;
+};
+
+// Fields of the record written for each row in the columnar output format (-F npy)
+static const struct harness_field trace_fields[] = {
+    {"line", 1},
+    {"now_us", 1},
+    {"cwnd", 1},
+    {"ssthresh", 1},
+    {"end_seq", 1},
+    {"delay_min", 1},
+    {"sample_count", 1},
+    {"curr_rtt", 1},
+    {"hystart_found", 1},
+    {"round_start", 1},
+    {"app_limited", 1},
+    {"loss", 1},
+    {"snd_una", 1},
+};
+
+static int trace_open(struct trace_state *st) {
     // Allocate memory for sock structure
     struct sock *sk = malloc(sizeof(struct sock));
     if (!sk) {
         fprintf(stderr, "Failed to allocate memory for sock.\n");
-        fclose(file);
         return 1;
     }
     memset(sk, 0, sizeof(struct sock));  // Initialize struct to zero
@@ -50,9 +63,10 @@ int main(int argc, char *argv[]) {
     if (!sk->bictcp) {
         fprintf(stderr, "Failed to allocate memory for bictcp.\n");
         free(sk);
-        fclose(file);
         return 1;
     }
+    memset(sk->bictcp, 0, sizeof(struct bictcp));  // Initialize struct to zero
+    st->sk = sk;
 
     struct tcp_sock *tp = tcp_sk(sk);
     struct bictcp *ca = inet_csk_ca(sk);
@@ -66,134 +80,156 @@ int main(int argc, char *argv[]) {
     // Initialize protocol-specific variables
     tp->snd_ssthresh = TCP_INFINITE_SSTHRESH;
     tp->snd_cwnd = TCP_INIT_CWND;
-    int EXIT_FLAG = 0;
-    int LOSS_FLAG = 0;
-    u32 pre_acked = 0;
-
-    char line[256];
-    int line_number = 0;
-
-    printf("Processing CSV input: %s\n\n", argv[1]);
-
-    while (fgets(line, sizeof(line), file)) {
-        line_number++;
-
-        // Skip the header line or lines that start with '#'
-        if (line_number == 1 || line[0] == '#') {
-            continue;
-        }
-
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Define the variables based on your protocol's input,
-        // parse the CSV value, and set parsed values to the mock structure.
-        // -----------------------------------------------------------------------------
-                    
-        // Variables to store parsed values
-        u32 now_us, mss, rtt_us, tp_rate_interval_us, app_limited, tp_delivered_rate, tp_delivered, lost, retrans, sk_pacing_rate;
-        u64 bytes_acked, snd_nxt, snd_una;
-
-        // Parse the CSV line
-        if (sscanf(line, "%u,%llu,%u,%u,%u,%u,%u,%u,%u,%u, %llu, %u, %llu", &now_us, &bytes_acked, &mss, &rtt_us, &tp_delivered_rate, 
-                &tp_rate_interval_us, &tp_delivered, &lost, &retrans, &app_limited, &snd_nxt, &sk_pacing_rate, &snd_una) != 13) {
-            fprintf(stderr, "Invalid line format at line %d: %s", line_number, line);
-            continue;
-        }
-
-        /* Update the TCP socket state with the current input values */
-        tp->snd_nxt = snd_nxt;
-        tp->snd_una = snd_una;
-        sk->sk_pacing_rate = sk_pacing_rate;
-
-        // Convert cumulative ACKed bytes (from logs) into ACKed packet counts
-        u32 acked;
-        u32 delta_ack_pkt;
-        u32 cumulative_ack_pkts;
-
-        cumulative_ack_pkts = bytes_acked / mss;
-        delta_ack_pkt = cumulative_ack_pkts - pre_acked;
-        acked = delta_ack_pkt;
-        pre_acked = cumulative_ack_pkts;
-
-        /* 
-         * Initialize the connection state during the first data row.
-         * Estimate the end sequence number based on snd_nxt and number of sent segments.
-         * - Assumes 10 segments (e.g., based on sent packet=10 at the time of first ack).
-         * - Sets ca->end_seq as the expected boundary for the current round.
-         */
-        if (line_number == 2 && line[0] != '#') {
-            ca->end_seq = snd_nxt - (10 * mss);
-        }
-
-        /* 
-         * Use RTT sample from input; ensure non-zero delay 
-         * (avoid divide-by-zero or meaningless results)
-         */
-        u32 delay;
-        delay = rtt_us;
-        if (delay == 0)
-            delay = 1;
-
-        /* Update the minimum observed delay for HyStart */
-        /* first time call or link delay decreases */
-        if (ca->delay_min == 0 || ca->delay_min > delay)
-            ca->delay_min = delay;
-
-        // Call protocol-specific update functions    
-        /* Trigger HyStart */
-        hystart_update(sk, delay);
-
-        // Print details
-        // This is aligned with the kernel log order, where CWND is logged prior to ACK-driven updates.
-        printf("Line %d:\n", line_number);
-        printf("  now_us: %u\n", now_us);
-        printf("  cwnd: %u\n", tp->snd_cwnd); 
-
-        // Note: cwnd only changes during slow start because we only call tcp_slow_start().
-        // After exiting slow start, cwnd will remain constant unless additional cwnd
-        // update logic is implemented for congestion avoidance.
-        if (tcp_in_slow_start(tp)) {
-            acked = tcp_slow_start(tp, acked);
-        }
-
-        /*
-         * Detect and flag the presence of packet loss during the flow.
-         * Only set LOSS_FLAG once (when loss is first seen).
-        */
-        if (LOSS_FLAG == 0 && lost > 0) {
-            printf("  First Loss is happened at %u us\n", now_us);
-            LOSS_FLAG = 1;
-        }
-        
-        if (ca->found && EXIT_FLAG == 0) {
-            printf("  HyStart Exits Slow Phase at %u us\n", now_us);
-            EXIT_FLAG = 1;
-        }
-
-        // Print details
-        printf("  end_seq: %u\n", ca->end_seq);
-        printf("  delay_min: %u\n", ca->delay_min);
-        printf("  sample_count: %u\n", ca->sample_cnt);
-        printf("  curr_rtt: %u\n", ca->curr_rtt);
-        printf("  hystart_found: %u\n", ca->found);
-        printf("  round_start: %u\n", ca->round_start);
-        printf("  app_limited: %u\n", app_limited);
-        printf("  loss happen: %u\n", LOSS_FLAG);
-        printf("  snd_una: %u\n", tp->snd_una);
-        printf("\n");
-
-        // Exit from test as loss happens
-        if (LOSS_FLAG == 1){
-            printf("Break as loss happened\n");
-            break;    
-        }
+    st->EXIT_FLAG = 0;
+    st->LOSS_FLAG = 0;
+    st->pre_acked = 0;
+
+    return 0;
+}
+
+static int trace_row(struct trace_state *st, const struct harness_row *row) {
+    int line_number = row->line_number;
+    struct sock *sk = st->sk;
+    struct tcp_sock *tp = tcp_sk(sk);
+    struct bictcp *ca = inet_csk_ca(sk);
+
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Define the variables based on your protocol's input,
+    // parse the CSV value, and set parsed values to the mock structure.
+    // -----------------------------------------------------------------------------
+                
+    // Check that the row holds every column used below
+    if (row->columns < 13) {
+        fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));
+        return HARNESS_CONTINUE;
     }
-    // Clean up memory
-    if (sk->bictcp) {
-        free(sk->bictcp);
+
+    // Variables to store parsed values
+    u32 now_us = row->v[TRACE_NOW_US];
+    u64 bytes_acked = row->v[TRACE_BYTES_ACKED];
+    u32 mss = row->v[TRACE_MSS];
+    u32 rtt_us = row->v[TRACE_RTT_US];
+    u32 lost = row->v[TRACE_LOST];
+    u32 app_limited = row->v[TRACE_APP_LIMITED];
+    u64 snd_nxt = row->v[TRACE_SND_NXT];
+    u32 sk_pacing_rate = row->v[TRACE_PACING_RATE];
+    u64 snd_una = row->v[TRACE_SND_UNA];
+
+    /* Update the TCP socket state with the current input values */
+    tp->snd_nxt = snd_nxt;
+    tp->snd_una = snd_una;
+    sk->sk_pacing_rate = sk_pacing_rate;
+
+    // Convert cumulative ACKed bytes (from logs) into ACKed packet counts
+    u32 acked;
+    u32 delta_ack_pkt;
+    u32 cumulative_ack_pkts;
+
+    cumulative_ack_pkts = bytes_acked / mss;
+    delta_ack_pkt = cumulative_ack_pkts - st->pre_acked;
+    acked = delta_ack_pkt;
+    st->pre_acked = cumulative_ack_pkts;
+
+    /* 
+     * Initialize the connection state during the first data row.
+     * Estimate the end sequence number based on snd_nxt and number of sent segments.
+     * - Assumes 10 segments (e.g., based on sent packet=10 at the time of first ack).
+     * - Sets ca->end_seq as the expected boundary for the current round.
+     */
+    if (line_number == 2) {
+        ca->end_seq = snd_nxt - (10 * mss);
     }
-    free(sk);
-    fclose(file);
 
-    printf("Finished processing.\n");
-    return 0;
+    /* 
+     * Use RTT sample from input; ensure non-zero delay 
+     * (avoid divide-by-zero or meaningless results)
+     */
+    u32 delay;
+    delay = rtt_us;
+    if (delay == 0)
+        delay = 1;
+
+    /* Update the minimum observed delay for HyStart */
+    /* first time call or link delay decreases */
+    if (ca->delay_min == 0 || ca->delay_min > delay)
+        ca->delay_min = delay;
+
+    // Call protocol-specific update functions    
+    /* Trigger HyStart */
+    hystart_update(sk, delay);
+
+    // Print details
+    // This is aligned with the kernel log order, where CWND is logged prior to ACK-driven updates.
+    u32 logged_cwnd = tp->snd_cwnd;
+    trace_printf("Line %d:\n", line_number);
+    trace_printf("  now_us: %u\n", now_us);
+    trace_printf("  cwnd: %u\n", logged_cwnd);
+
+    // Note: cwnd only changes during slow start because we only call tcp_slow_start().
+    // After exiting slow start, cwnd will remain constant unless additional cwnd
+    // update logic is implemented for congestion avoidance.
+    if (tcp_in_slow_start(tp)) {
+        acked = tcp_slow_start(tp, acked);
+    }
+
+    /*
+     * Detect and flag the presence of packet loss during the flow.
+     * Only set LOSS_FLAG once (when loss is first seen).
+    */
+    if (st->LOSS_FLAG == 0 && lost > 0) {
+        trace_printf("  First Loss is happened at %u us\n", now_us);
+        st->LOSS_FLAG = 1;
+    }
+    
+    if (ca->found && st->EXIT_FLAG == 0) {
+        trace_printf("  HyStart Exits Slow Phase at %u us\n", now_us);
+        st->EXIT_FLAG = 1;
+    }
+
+    // Print details
+    trace_printf("  end_seq: %u\n", ca->end_seq);
+    trace_printf("  delay_min: %u\n", ca->delay_min);
+    trace_printf("  sample_count: %u\n", ca->sample_cnt);
+    trace_printf("  curr_rtt: %u\n", ca->curr_rtt);
+    trace_printf("  hystart_found: %u\n", ca->found);
+    trace_printf("  round_start: %u\n", ca->round_start);
+    trace_printf("  app_limited: %u\n", app_limited);
+    trace_printf("  loss happen: %u\n", st->LOSS_FLAG);
+    trace_printf("  snd_una: %u\n", tp->snd_una);
+    trace_printf("\n");
+
+    if (trace_records()) {
+        trace_record(line_number);
+        trace_record(now_us);
+        trace_record(logged_cwnd);
+        trace_record(tp->snd_ssthresh);
+        trace_record(ca->end_seq);
+        trace_record(ca->delay_min);
+        trace_record(ca->sample_cnt);
+        trace_record(ca->curr_rtt);
+        trace_record(ca->found);
+        trace_record(ca->round_start);
+        trace_record(app_limited);
+        trace_record(st->LOSS_FLAG);
+        trace_record(tp->snd_una);
+        trace_record_end();
+    }
+
+    // Exit from test as loss happens
+    if (st->LOSS_FLAG == 1){
+        trace_printf("Break as loss happened\n");
+        return HARNESS_STOP;    
+    }
+
+    return HARNESS_CONTINUE;
+}
+
+static void trace_close(struct trace_state *st) {
+    // Clean up memory
+    if (st->sk->bictcp) {
+        free(st->sk->bictcp);
+    }
+    free(st->sk);
 }
+
+HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)
@@ -21,6 +21,7 @@
 #include "tcp.h"
 #include "hystartpp_defs.h"
 #include "cc_helper_function.h"
+#include "test_harness.h"
 // -----------------------------------------------------------------------------
 // ⚠ USER NOTE: 
 // Include the header file for the your module definitions
@@ -29,24 +30,37 @@
 // prototypes used by the congestion control algorithm. 
 // -----------------------------------------------------------------------------
 
-int main(int argc, char *argv[]) {
-    if (argc < 2) {
-        fprintf(stderr, "Usage: %s <input.csv>\n", argv[0]);
-        return 1;
-    }
+// State of one trace; it is rebuilt by trace_open() before every trace
+struct trace_state {
+    struct sock *sk;
+    int LOSS_FLAG;
+    u32 pre_acked;
+};
 
-    // Open the CSV file
-    FILE *file = fopen(argv[1], "r");
-    if (!file) {
-        perror("Failed to open file");
-        return 1;
-    }
+// Fields of the record written for each row in the columnar output format (-F npy)
+static const struct harness_field trace_fields[] = {
+    {"line", 1},
+    {"now_us", 1},
+    {"snd_cwnd", 1},
+    {"snd_cwnd_cnt", 1},
+    {"ssthresh", 1},
+    {"hspp_end_seq", 1},
+    {"hspp_rttsample_counter", 1},
+    {"hspp_current_round_minrtt", 1},
+    {"hspp_round_counter", 1},
+    {"hspp_entered_css_at_round", 1},
+    {"hspp_css_baseline_minrtt", 1},
+    {"hspp_last_round_minrtt", 1},
+    {"hspp_flag", 1},
+    {"snd_una", 1},
+    {"loss", 1},
+};
 
+static int trace_open(struct trace_state *st) {
     // Allocate memory for sock structure
     struct sock *sk = malloc(sizeof(struct sock));
     if (!sk) {
         fprintf(stderr, "Failed to allocate memory for sock.\n");
-        fclose(file);
         return 1;
     }
     memset(sk, 0, sizeof(struct sock));  // Initialize struct to zero
@@ -69,9 +83,10 @@ int main(int argc, char *argv[]) {
     if (!sk->bictcp) {
         fprintf(stderr, "Failed to allocate memory for bictcp.\n");
         free(sk);
-        fclose(file);
         return 1;
     }
+    memset(sk->bictcp, 0, sizeof(struct bictcp));  // Initialize struct to zero
+    st->sk = sk;
 
     struct bictcp *ca = inet_csk_ca(sk);
 
@@ -84,120 +99,145 @@ int main(int argc, char *argv[]) {
     // Initialize protocol-specific variables
     tp->snd_ssthresh = TCP_INFINITE_SSTHRESH;
     tp->snd_cwnd = TCP_INIT_CWND;
-    int LOSS_FLAG = 0;
-    u32 pre_acked = 0;
-
-    char line[256];
-    int line_number = 0;
-
-    printf("Processing CSV input: %s\n\n", argv[1]);
-
-    while (fgets(line, sizeof(line), file)) {
-        line_number++;
-
-        // Skip the header line or lines that start with '#'
-        if (line_number == 1 || line[0] == '#') {
-            continue;
-        }
-
-        // Variables to store parsed values
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Define the variables based on your protocol's input,
-        // parse the CSV value, and set parsed values to the mock structure.
-        // -----------------------------------------------------------------------------
-        
-        // Variables to store parsed values
-        u32 now_us, mss, rtt_us, tp_rate_interval_us, app_limited, tp_delivered_rate, tp_delivered, lost, retrans, snd_nxt, snd_una, sk_pacing_rate;
-        u64 bytes_acked;
-
-        // Parse the CSV line
-        if (sscanf(line, "%u,%llu,%u,%u,%u,%u,%u,%u,%u,%u, %u, %u, %u", &now_us, &bytes_acked, &mss, &rtt_us, &tp_delivered_rate, 
-                &tp_rate_interval_us, &tp_delivered, &lost, &retrans, &app_limited, &snd_nxt, &sk_pacing_rate, &snd_una) != 13) {
-            fprintf(stderr, "Invalid line format at line %d: %s", line_number, line);
-            continue;
-        }                   
-
-        // Call protocol-specific update functions
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Call the function(s) to start running your protocol.
-        // -----------------------------------------------------------------------------  
-
-        /* Update the TCP socket state with the current input values */
-        tp->snd_nxt = snd_nxt;
-        tp->snd_una = snd_una;
-        sk->sk_pacing_rate = sk_pacing_rate;
-
-        u32 acked;
-        u32 delta_ack_pkt;
-        u32 cumulative_ack_pkts;
-
-        cumulative_ack_pkts = bytes_acked / mss;
-        delta_ack_pkt = cumulative_ack_pkts - pre_acked;
-        acked = delta_ack_pkt;
-
-        pre_acked = cumulative_ack_pkts;
-
-        if (line_number == 2 && line[0] != '#') {
-            ca->hspp_end_seq = tp->snd_nxt;
-            ca->hspp_current_round_minrtt = rtt_us;
-            ca->hspp_last_round_minrtt = ca->hspp_current_round_minrtt; /* {RFC9406_L186} */
-            ca->hspp_current_round_minrtt = ~0U;                /* {RFC9406_L187} */
-            ca->hspp_flag = HSPP_IN_SS;
-        }
-        
-        /* Use RTT sample from input; ensure non-zero delay 
-         *  (avoid divide-by-zero or meaningless results)
-         */
-        u32 delay;
-        delay = rtt_us;
-        if (delay == 0)
-            delay = 1;
-        
-        /* Update the minimum observed delay for HyStart */
-        /* first time call or link delay decreases */
-        if (ca->delay_min == 0 || ca->delay_min > delay)
-            ca->delay_min = delay;
-
-        if (LOSS_FLAG == 0 && lost > 0){
-            LOSS_FLAG = 1;
-            printf("First Loss is happened at %u us\n", now_us);
-        }
-
-        if (tcp_in_slow_start(tp) && (ca->hspp_flag != HSPP_DEACTIVE))
-            hystartpp_adjust_params(sk, delay);
-
-        // Print details
-        // This is aligned with the kernel log order, where CWND is logged prior to ACK-driven updates.
-        printf("Line %d:\n", line_number);
-        printf("  now_us: %u\n", now_us);
-        printf("  snd_cwnd: %u\n", tp->snd_cwnd);
-        printf("  snd_cwnd_cnt: %u\n", tp->snd_cwnd_cnt);
-
-        if (ca->hspp_flag != HSPP_DEACTIVE)
-            hystartpp_adjust_cwnd(sk, acked);
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Print results and info based on your requirements.
-        // -----------------------------------------------------------------------------
-        // Print details
-        printf("  hspp_end_seq: %u\n", ca->hspp_end_seq);
-        printf("  hspp_rttsample_counter: %u\n", ca->hspp_rttsample_counter);
-        printf("  hspp_current_round_minrtt: %u\n", ca->hspp_current_round_minrtt);
-        printf("  hspp_round_counter: %u\n", ca->hspp_round_counter);
-        printf("  hspp_entered_css_at_round: %u\n", ca->hspp_entered_css_at_round);
-        printf("  hspp_css_baseline_minrtt: %u\n", ca->hspp_css_baseline_minrtt);
-        printf("  hspp_last_round_minrtt: %u\n", ca->hspp_last_round_minrtt);
-        printf("  hspp_flag: %u\n", ca->hspp_flag);
-        printf("  snd_una: %u\n", tp->snd_una);
-        printf("  loss happen: %u\n", LOSS_FLAG);
-        printf("\n");    
-
-        // Exit from test as loss happens
-        if (LOSS_FLAG == 1){
-            printf("Break as loss happened\n");
-            break;    
-        }
+    st->LOSS_FLAG = 0;
+    st->pre_acked = 0;
+
+    return 0;
+}
+
+static int trace_row(struct trace_state *st, const struct harness_row *row) {
+    int line_number = row->line_number;
+    struct sock *sk = st->sk;
+    struct tcp_sock *tp = tcp_sk(sk);
+    struct bictcp *ca = inet_csk_ca(sk);
+
+    // Variables to store parsed values
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Define the variables based on your protocol's input,
+    // parse the CSV value, and set parsed values to the mock structure.
+    // -----------------------------------------------------------------------------
+    
+    // Check that the row holds every column used below
+    if (row->columns < 13) {
+        fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));
+        return HARNESS_CONTINUE;
+    }
+
+    // Variables to store parsed values
+    u32 now_us = row->v[TRACE_NOW_US];
+    u64 bytes_acked = row->v[TRACE_BYTES_ACKED];
+    u32 mss = row->v[TRACE_MSS];
+    u32 rtt_us = row->v[TRACE_RTT_US];
+    u32 lost = row->v[TRACE_LOST];
+    u32 snd_nxt = row->v[TRACE_SND_NXT];
+    u32 sk_pacing_rate = row->v[TRACE_PACING_RATE];
+    u32 snd_una = row->v[TRACE_SND_UNA];                   
+
+    // Call protocol-specific update functions
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Call the function(s) to start running your protocol.
+    // -----------------------------------------------------------------------------  
+
+    /* Update the TCP socket state with the current input values */
+    tp->snd_nxt = snd_nxt;
+    tp->snd_una = snd_una;
+    sk->sk_pacing_rate = sk_pacing_rate;
+
+    u32 acked;
+    u32 delta_ack_pkt;
+    u32 cumulative_ack_pkts;
+
+    cumulative_ack_pkts = bytes_acked / mss;
+    delta_ack_pkt = cumulative_ack_pkts - st->pre_acked;
+    acked = delta_ack_pkt;
+
+    st->pre_acked = cumulative_ack_pkts;
+
+    if (line_number == 2) {
+        ca->hspp_end_seq = tp->snd_nxt;
+        ca->hspp_current_round_minrtt = rtt_us;
+        ca->hspp_last_round_minrtt = ca->hspp_current_round_minrtt; /* {RFC9406_L186} */
+        ca->hspp_current_round_minrtt = ~0U;                /* {RFC9406_L187} */
+        ca->hspp_flag = HSPP_IN_SS;
+    }
+    
+    /* Use RTT sample from input; ensure non-zero delay 
+     *  (avoid divide-by-zero or meaningless results)
+     */
+    u32 delay;
+    delay = rtt_us;
+    if (delay == 0)
+        delay = 1;
+    
+    /* Update the minimum observed delay for HyStart */
+    /* first time call or link delay decreases */
+    if (ca->delay_min == 0 || ca->delay_min > delay)
+        ca->delay_min = delay;
+
+    if (st->LOSS_FLAG == 0 && lost > 0){
+        st->LOSS_FLAG = 1;
+        trace_printf("First Loss is happened at %u us\n", now_us);
     }
 
+    if (tcp_in_slow_start(tp) && (ca->hspp_flag != HSPP_DEACTIVE))
+        hystartpp_adjust_params(sk, delay);
+
+    // Print details
+    // This is aligned with the kernel log order, where CWND is logged prior to ACK-driven updates.
+    u32 logged_cwnd = tp->snd_cwnd;
+    u32 logged_cwnd_cnt = tp->snd_cwnd_cnt;
+    trace_printf("Line %d:\n", line_number);
+    trace_printf("  now_us: %u\n", now_us);
+    trace_printf("  snd_cwnd: %u\n", logged_cwnd);
+    trace_printf("  snd_cwnd_cnt: %u\n", logged_cwnd_cnt);
+
+    if (ca->hspp_flag != HSPP_DEACTIVE)
+        hystartpp_adjust_cwnd(sk, acked);
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Print results and info based on your requirements.
+    // -----------------------------------------------------------------------------
+    // Print details
+    trace_printf("  hspp_end_seq: %u\n", ca->hspp_end_seq);
+    trace_printf("  hspp_rttsample_counter: %u\n", ca->hspp_rttsample_counter);
+    trace_printf("  hspp_current_round_minrtt: %u\n", ca->hspp_current_round_minrtt);
+    trace_printf("  hspp_round_counter: %u\n", ca->hspp_round_counter);
+    trace_printf("  hspp_entered_css_at_round: %u\n", ca->hspp_entered_css_at_round);
+    trace_printf("  hspp_css_baseline_minrtt: %u\n", ca->hspp_css_baseline_minrtt);
+    trace_printf("  hspp_last_round_minrtt: %u\n", ca->hspp_last_round_minrtt);
+    trace_printf("  hspp_flag: %u\n", ca->hspp_flag);
+    trace_printf("  snd_una: %u\n", tp->snd_una);
+    trace_printf("  loss happen: %u\n", st->LOSS_FLAG);
+    trace_printf("\n");    
+
+    if (trace_records()) {
+        trace_record(line_number);
+        trace_record(now_us);
+        trace_record(logged_cwnd);
+        trace_record(logged_cwnd_cnt);
+        trace_record(tp->snd_ssthresh);
+        trace_record(ca->hspp_end_seq);
+        trace_record(ca->hspp_rttsample_counter);
+        trace_record(ca->hspp_current_round_minrtt);
+        trace_record(ca->hspp_round_counter);
+        trace_record(ca->hspp_entered_css_at_round);
+        trace_record(ca->hspp_css_baseline_minrtt);
+        trace_record(ca->hspp_last_round_minrtt);
+        trace_record(ca->hspp_flag);
+        trace_record(tp->snd_una);
+        trace_record(st->LOSS_FLAG);
+        trace_record_end();
+    }
+
+    // Exit from test as loss happens
+    if (st->LOSS_FLAG == 1){
+        trace_printf("Break as loss happened\n");
+        return HARNESS_STOP;    
+    }
+
+    return HARNESS_CONTINUE;
+}
+
+static void trace_close(struct trace_state *st) {
     // -----------------------------------------------------------------------------
     // ⚠ USER NOTE:
     // Ensure that you clean up memory for congestion control structures
@@ -209,13 +249,11 @@ int main(int argc, char *argv[]) {
     // This ensures proper resource management and prevents memory leaks.
     // -----------------------------------------------------------------------------
     // Clean up memory
-    if (sk->bictcp) {
-        free(sk->bictcp);
+    if (st->sk->bictcp) {
+        free(st->sk->bictcp);
     }
 
-    free(sk);
-    fclose(file);
-
-    printf("Finished processing.\n");
-    return 0;
+    free(st->sk);
 }
+
+HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)
@@ -0,0 +1,185 @@
+/*
+ *****************************************************************************
+ *  test_search_v3.1.c
+ *  ----------------------------------------------------------------------------
+ *  This file is designed to test the `SEARCH` module of tcp_cubic_search_v3.1.c using CSV input.
+ *  Unlike v3, its reset function takes whether the bin duration is kept.
+ *  This test file allows you to validate and verify your module.
+ * 
+ *  You can process CSV input, simulate various network conditions, and print relevant results.
+ *  Modify this file to adjust parameters, conditions, or outputs for custom testing.
+ *  
+ *
+ *  ⚠ WARNING: 
+ *  If you modify this file directly, rerunning `ss_extract.py` will overwrite your changes.
+ *****************************************************************************
+ */
+
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include "tcp.h"
+#include "search_defs.h"
+#include "cc_helper_function.h"
+#include "test_harness.h"
+
+// State of one trace; it is rebuilt by trace_open() before every trace
+struct trace_state {
+    struct sock *sk;
+    int EXIT_FLAG;
+    int LOSS_FLAG;
+};
+
+// Fields of the record written for each row in the columnar output format (-F npy)
+static const struct harness_field trace_fields[] = {
+    {"line", 1},
+    {"now_us", 1},
+    {"bytes_acked", 1},
+    {"mss", 1},
+    {"rtt_us", 1},
+    {"cwnd", 1},
+    {"ssthresh", 1},
+    {"loss", 1},
+    {"exit_slow_start", 1},
+    {"curr_idx", 1},
+    {"bin_duration_us", 1},
+    {"bin_end_us", 1},
+    {"scale_factor", 1},
+    {"bin", SEARCH_TOTAL_BINS},
+};
+
+static int trace_open(struct trace_state *st) {
+    // Allocate memory for sock structure
+    struct sock *sk = malloc(sizeof(struct sock));
+    if (!sk) {
+        fprintf(stderr, "Failed to allocate memory for sock.\n");
+        return 1;
+    }
+    memset(sk, 0, sizeof(struct sock));  // Initialize struct to zero
+
+    // Allocate memory for bictcp inside sock
+    sk->bictcp = malloc(sizeof(struct bictcp));
+    if (!sk->bictcp) {
+        fprintf(stderr, "Failed to allocate memory for bictcp.\n");
+        free(sk);
+        return 1;
+    }
+    memset(sk->bictcp, 0, sizeof(struct bictcp));  // Initialize struct to zero
+    st->sk = sk;
+
+    struct tcp_sock *tp = tcp_sk(sk);
+    struct bictcp *ca = inet_csk_ca(sk);
+
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Add your reset function below, if applicable.
+    // -----------------------------------------------------------------------------
+    bictcp_search_reset(ca, UNSET_BIN_DURATION_FALSE);
+
+    // Initialize protocol-specific variables
+    tp->snd_ssthresh = TCP_INFINITE_SSTHRESH;
+    tp->snd_cwnd = TCP_INIT_CWND;
+    st->EXIT_FLAG = 0;
+    st->LOSS_FLAG = 0;
+
+    return 0;
+}
+
+static int trace_row(struct trace_state *st, const struct harness_row *row) {
+    int line_number = row->line_number;
+    struct sock *sk = st->sk;
+    struct tcp_sock *tp = tcp_sk(sk);
+    struct bictcp *ca = inet_csk_ca(sk);
+
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Define the variables based on your protocol's input,
+    // parse the CSV value, and set parsed values to the mock structure.
+    // -----------------------------------------------------------------------------
+    // Check that the row holds every column used below
+    if (row->columns < 12) {
+        fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));
+        return HARNESS_CONTINUE;
+    }
+
+    // Variables to store parsed values
+    u32 now_us = row->v[TRACE_NOW_US];
+    u64 bytes_acked = row->v[TRACE_BYTES_ACKED];
+    u32 mss = row->v[TRACE_MSS];
+    u32 rtt_us = row->v[TRACE_RTT_US];
+    u32 lost = row->v[TRACE_LOST];
+
+    // Set parsed values to the mock structure
+    tp->tcp_mstamp = now_us;
+    tp->bytes_acked = bytes_acked;
+    tp->mss_cache = mss;
+
+    if (st->LOSS_FLAG == 0 && lost > 0)
+        st->LOSS_FLAG = 1;
+
+    // Call protocol-specific update functions
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Call the function(s) to start running your protocol.
+    // -----------------------------------------------------------------------------     
+    search_update(sk, rtt_us);
+
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Print results and info based on your requirements.
+    // -----------------------------------------------------------------------------
+
+    if ((tp->snd_ssthresh == tp->snd_cwnd) && (st->EXIT_FLAG == 0)) {
+        trace_printf("Exit Slow Start at %u\n", now_us);
+        st->EXIT_FLAG = 1;
+    }
+
+    // Print details
+    trace_printf("Line %d:\n", line_number);
+    trace_printf("  now_us: %u\n", now_us);
+    trace_printf("  bytes_acked: %llu\n", bytes_acked);
+    trace_printf("  mss: %u\n", mss);
+    trace_printf("  rtt_us: %u\n", rtt_us);
+    trace_printf("  loss happen: %u\n", st->LOSS_FLAG);
+    trace_printf("  Current bin index: %d\n", ca->search.curr_idx);
+    trace_printf("  Bin duration: %d\n", ca->search.bin_duration_us);
+    trace_printf("  Bin end time: %d\n", ca->search.bin_end_us);
+    trace_printf("  Scale factor: %d\n", ca->search.scale_factor);
+
+    trace_printf("  Bin values:\n");
+
+    for (int i = 0; i < SEARCH_TOTAL_BINS; i++) {
+        trace_printf("    Bin[%d]: %u\n", i, ca->search.bin[i]);
+    }
+    trace_printf("\n");
+
+    if (trace_records()) {
+        trace_record(line_number);
+        trace_record(now_us);
+        trace_record(bytes_acked);
+        trace_record(mss);
+        trace_record(rtt_us);
+        trace_record(tp->snd_cwnd);
+        trace_record(tp->snd_ssthresh);
+        trace_record(st->LOSS_FLAG);
+        trace_record(st->EXIT_FLAG);
+        trace_record(ca->search.curr_idx);
+        trace_record(ca->search.bin_duration_us);
+        trace_record(ca->search.bin_end_us);
+        trace_record(ca->search.scale_factor);
+        for (int i = 0; i < SEARCH_TOTAL_BINS; i++) {
+            trace_record(ca->search.bin[i]);
+        }
+        trace_record_end();
+    }
+
+    return HARNESS_CONTINUE;
+}
+
+static void trace_close(struct trace_state *st) {
+    // Clean up memory
+    if (st->sk->bictcp) {
+        free(st->sk->bictcp);
+    }
+    free(st->sk);
+}
+
+HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)
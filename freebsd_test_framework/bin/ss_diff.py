@@ -0,0 +1,226 @@
+import os
+import re
+import csv
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from ss_run import run_test, collect_input_files, print_summary
+from ss_convert import TRACE_COLUMNS
+
+# Directory of the framework scripts; the support files are in ../support
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Name of the differential binary and the support files it is built from
+DIFF_EXECUTABLE = "test_diff"
+DIFF_SOURCES = ["diff_harness.c", "test_harness.h"]
+ALGORITHMS_HEADER = "diff_algorithms.h"
+
+# Summary of all the traces, see summarize_traces()
+SUMMARY_FILE = "diff_summary.csv"
+SUMMARY_COLUMNS = ["trace", "field", "compared_rows", "diff_rows", "first_diff_line"]
+
+# Fields the harnesses copy from the trace instead of the algorithm state: they are the
+# same for any two algorithms, so a diff comparing only them compares nothing
+INPUT_FIELDS = {"line", "loss", *TRACE_COLUMNS}
+
+_unsafe_characters = re.compile(r"\W")
+
+
+def namespace(name):
+    """Turn an algorithm name into the C identifier prefixing its entry points."""
+    name = _unsafe_characters.sub("_", name)
+    if not name or name[0].isdigit():
+        raise ValueError(f"'{name}' is not a valid algorithm name, it must not start with a digit")
+    return name
+
+
+def parse_algorithm(spec):
+    """
+    Parse an algorithm given on the command line: a test directory, or NAME=DIR to
+    name it. The default name is the one of the directory.
+    :return: Tuple (namespace, test directory).
+    """
+    name, separator, test_dir = spec.partition("=")
+    if not separator:
+        name, test_dir = os.path.basename(os.path.normpath(spec)), spec
+    return namespace(name), test_dir
+
+
+def read_workspaces(workspaces_file, sources=None):
+    """
+    List the ready workspaces of an ss_prepare.py index, named after their source.
+    :param sources: Optional source names to keep, with or without the .c extension.
+    :return: List of (namespace, workspace) tuples.
+    """
+    wanted = {os.path.splitext(source)[0] for source in sources} if sources else None
+    algorithms = []
+    found = set()
+    with open(workspaces_file, 'r', newline='') as infile:
+        for row in csv.DictReader(infile):
+            stem = os.path.splitext(row["source"])[0]
+            if row["ready"] == "1" and (wanted is None or stem in wanted):
+                algorithms.append((namespace(stem), row["workspace"]))
+                found.add(stem)
+    if wanted:
+        missing = wanted - found
+        if missing:
+            raise ValueError(f"no ready workspace for {', '.join(sorted(missing))} in {workspaces_file}")
+    return algorithms
+
+
+def build_object(name, test_dir, build_dir, make_args=()):
+    """
+    Build the namespaced object of one algorithm with `make diff` and copy it to the build directory.
+    :return: Tuple (built, object file or error message).
+    """
+    try:
+        process = subprocess.run(["make", "-C", test_dir, "diff", f"NAMESPACE={name}", *make_args],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        object_file = os.path.join(test_dir, f"{name}.diff.o")
+        if process.returncode != 0 or not os.path.isfile(object_file):
+            lines = process.stdout.strip().splitlines()
+            return False, lines[-1] if lines else "make diff failed"
+        shutil.copy(object_file, build_dir)
+        return True, os.path.join(build_dir, os.path.basename(object_file))
+
+    except Exception as e:
+        return False, str(e)
+
+
+def build_diff(algorithms, output_folder, jobs=1, make_args=()):
+    """
+    Build the differential binary of the algorithms in <output_folder>/build.
+    :param algorithms: List of (namespace, test directory) tuples, in the column order of the output.
+    :param jobs: Number of algorithms built in parallel.
+    :return: Path of the binary.
+    """
+    names = [name for name, _ in algorithms]
+    if len(set(names)) != len(names):
+        raise ValueError(f"two algorithms have the same name: {', '.join(names)}")
+
+    build_dir = os.path.join(output_folder, "build")
+    os.makedirs(build_dir, exist_ok=True)
+
+    # Step 1: Build the object of every algorithm in its own test directory
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        builds = list(pool.map(lambda algorithm: build_object(*algorithm, build_dir, make_args), algorithms))
+    errors = [f"{name}: {result}" for (name, _), (built, result) in zip(algorithms, builds) if not built]
+    if errors:
+        raise RuntimeError(f"make diff failed for {'; '.join(errors)}")
+
+    # Step 2: List the algorithms for the driver and link them with it
+    support_dir = os.path.join(os.path.dirname(BIN_DIR), "support")
+    for filename in DIFF_SOURCES:
+        shutil.copy(os.path.join(support_dir, filename), build_dir)
+    with open(os.path.join(build_dir, ALGORITHMS_HEADER), 'w') as outfile:
+        outfile.write("/* Algorithms of the differential harness, generated by ss_diff.py */\n")
+        outfile.write(f"#define DIFF_ALGORITHMS(X) {' '.join(f'X({name})' for name in names)}\n")
+
+    executable = os.path.join(build_dir, DIFF_EXECUTABLE)
+    command = ["gcc", "-Wall", "-Wextra", "-O2", "-o", executable, os.path.join(build_dir, DIFF_SOURCES[0]),
+               *[result for _, result in builds]]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"linking {DIFF_EXECUTABLE} failed: {process.stdout.strip()}")
+    return executable
+
+
+def summarize_traces(tasks, results, summary_file):
+    """
+    Gather the per-trace summaries of the differential binary into one table.
+    :return: Tuple (dictionary of trace -> list of the fields that differ, set of the compared fields).
+    """
+    differing = {}
+    compared = set()
+    with open(summary_file, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(SUMMARY_COLUMNS)
+        for input_file, output_file in sorted(tasks):
+            trace_summary = os.path.splitext(output_file)[0] + ".summary.csv"
+            if not results[input_file][0] or not os.path.isfile(trace_summary):
+                continue
+            trace = os.path.basename(input_file)
+            with open(trace_summary, 'r', newline='') as infile:
+                for row in csv.DictReader(infile):
+                    writer.writerow([trace] + [row[column] for column in SUMMARY_COLUMNS[1:]])
+                    compared.add(row["field"])
+                    if row["diff_rows"] != "0":
+                        differing.setdefault(trace, []).append(f"{row['field']} (line {row['first_diff_line']})")
+            os.remove(trace_summary)
+    return differing, compared
+
+
+def run_diff(algorithms, input_folder, output_folder, jobs=1, make_args=()):
+    """
+    Build the differential binary of the algorithms and replay every trace of the input
+    folder through it, writing <output_folder>/<trace>.csv and the summary table.
+    :return: True if the binary was built and every trace was replayed.
+    """
+    try:
+        jobs = jobs or os.cpu_count() or 1
+        os.makedirs(output_folder, exist_ok=True)
+        print(f"Building {DIFF_EXECUTABLE} of {', '.join(name for name, _ in algorithms)}")
+        executable = build_diff(algorithms, output_folder, jobs, make_args)
+        if not input_folder:
+            print(f"Built {executable}")
+            return True
+
+        # Each trace gets its own summary, gathered once every trace is done
+        tasks = collect_input_files(input_folder, output_folder, ".csv")
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            outcomes = list(pool.map(
+                lambda task: run_test(executable, *task,
+                                      harness_args=["-s", os.path.splitext(task[1])[0] + ".summary.csv"]),
+                tasks))
+        results = {input_file: outcome for (input_file, _), outcome in zip(tasks, outcomes)}
+        print_summary(results)
+
+        summary_file = os.path.join(output_folder, SUMMARY_FILE)
+        differing, compared = summarize_traces(tasks, results, summary_file)
+        if compared and not compared - INPUT_FIELDS:
+            print(f"Error: the algorithms share no state field, only {', '.join(sorted(compared))} copied from "
+                  f"the traces, so their outputs were not compared (see the <name>.<field> columns of the outputs)")
+            return False
+        for trace, fields in sorted(differing.items()):
+            print(f"{trace}: {', '.join(fields)} differ")
+        print(f"\n{len(differing)} of {len(tasks)} traces differ, see {summary_file}")
+        return all(passed for passed, _ in results.values())
+
+    except Exception as e:
+        print(f"Error running the differential harness: {e}")
+        return False
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Replay traces through several CC algorithms in one process and write their records side by side.")
+
+    parser.add_argument("-a", "--algorithm", action="append", default=[], metavar="[NAME=]DIR",
+                        help="Test directory of an algorithm, optionally named; repeat for each algorithm.")
+    parser.add_argument("-w", "--workspaces", help="The workspaces.csv of ss_prepare.py; its ready workspaces are added.")
+    parser.add_argument("-s", "--source", action="append", dest="sources",
+                        help="Only add the workspace of this source from -w (e.g., tcp_cubic_hystartpp); repeat for several.")
+    parser.add_argument("-i", "--input_folder", help="The folder containing the input .csv files (default: only build).")
+    parser.add_argument("-o", "--output_folder", required=True, help="The folder receiving the binary, the outputs and diff_summary.csv.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of builds and traces run in parallel (0 = all CPUs, default: 1).")
+    parser.add_argument("--make-arg", action="append", default=[], dest="make_args", metavar="VAR=VALUE",
+                        help="Variable given to make diff in every test directory, e.g. PROFILE=debug.")
+
+    args = parser.parse_args()
+
+    try:
+        algorithms = [parse_algorithm(spec) for spec in args.algorithm]
+        if args.workspaces:
+            algorithms += read_workspaces(args.workspaces, args.sources)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    if len(algorithms) < 2:
+        parser.error("at least two algorithms are needed, give them with -a or -w")
+
+    if not run_diff(algorithms, args.input_folder, args.output_folder, args.jobs, args.make_args):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,68 @@
 import sys
 import re
 import os
-import datetime
+import hashlib
 import textwrap
 from collections import defaultdict
 import argparse
-import shutil
 
 
-def copy_file_if_exists(src, dest):
-    """Copy the file from src to dest if it exists."""
+def content_hash(content):
+    """Short sha256 of generated content, stamped in its header instead of the generation time."""
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def write_if_changed(output_file, content):
+    """
+    Write the content to the output file unless the file already holds exactly this
+    content, so that its mtime (and therefore make) only sees real changes.
+    :return: True if the file was written.
+    """
+    if os.path.isfile(output_file):
+        with open(output_file, 'r') as infile:
+            if infile.read() == content:
+                print(f"Unchanged: {os.path.basename(output_file)}")
+                return False
+
+    with open(output_file, 'w') as outfile:
+        outfile.write(content)
+    print(f"Generated: {os.path.basename(output_file)}")
+    return True
+
+
+def guard_macro_defaults(content):
+    """
+    Wrap object-like macros (`#define NAME value`) in `#ifndef NAME` guards so that
+    their value can be overridden at compile time with -DNAME=value.
+    Macros without a value (include guards) and multi-line macros are left as is.
+    :param content: The header content to process.
+    :return: The content with guarded macros.
+    """
+    guarded_lines = []
+    in_comment = False
+    for line in content.splitlines():
+        match = re.match(r"^\s*#\s*define\s+([A-Za-z_]\w*)\s+(\S.*)$", line)
+        if match and not line.rstrip().endswith("\\"):
+            guarded_lines.append(f"#ifndef {match.group(1)}")
+            guarded_lines.append(line)
+            # A trailing comment may continue on the next lines; close the guard after it
+            in_comment = line.rfind("/*") > line.rfind("*/")
+            if not in_comment:
+                guarded_lines.append("#endif")
+        else:
+            guarded_lines.append(line)
+            if in_comment and "*/" in line:
+                guarded_lines.append("#endif")
+                in_comment = False
+    return "\n".join(guarded_lines)
+
+
+def copy_header_with_overrides(src, dest):
+    """Copy the header from src to the dest folder with its macros guarded by #ifndef, if it exists."""
     if os.path.isfile(src):
-        shutil.copy(src, dest)
-        print(f"Copied: {src} to {dest}")
+        with open(src, 'r') as infile:
+            content = infile.read()
+        write_if_changed(os.path.join(dest, os.path.basename(src)), guard_macro_defaults(content) + "\n")
     else:
         print(f"Warning: {src} does not exist. You need  this file for running test.")
 
@@ -44,27 +94,210 @@ def extract_function_declarations(module_content):
         return []
 
 
-def extract_marked_sections(input_file, keyword, marker_type):
+# Function definitions of the module: `<type> [*]<name>(<params>) {`, with the return type on
+# the same line or the one before (FreeBSD sources indent them by one space)
+_DEFINITION_PATTERN = re.compile(
+    r"^ ?([a-zA-Z_][a-zA-Z0-9_]*\s+\**)([a-zA-Z_][a-zA-Z0-9_]*)\(([^)]*)\)(?=\s*\{)", re.MULTILINE)
+
+# Words of a parameter that are not its type name or its own name
+_TYPE_QUALIFIERS = {"const", "volatile", "struct", "enum", "union", "unsigned", "signed"}
+
+
+def find_profiled_functions(module_content):
     """
-    Extract marked sections from the input file.
-    :param input_file: The source file to process.
+    Find the functions defined in the module content that get an instrumentation shim.
+    Functions whose arguments cannot be forwarded (variadic, unnamed or function pointer
+    parameters) are left out.
+    :param module_content: The content of the module file.
+    :return: A list of dictionaries with the "name", "returns" (return type), "params" and
+             "args" (argument names) of each function, in source order.
+    """
+    functions = []
+    seen = set()
+    for match in _DEFINITION_PATTERN.finditer(module_content):
+        name = match.group(2)
+        params = " ".join(match.group(3).split())
+        if name in seen or "(" in params:
+            continue
+        seen.add(name)
+
+        args = []
+        for param in ([] if params in ("", "void") else params.split(",")):
+            words = [word for word in re.findall(r"[A-Za-z_]\w*", re.sub(r"\[[^\]]*\]", "", param))
+                     if word not in _TYPE_QUALIFIERS]
+            if "..." in param or len(words) < 2:
+                args = None
+                break
+            args.append(words[-1])
+        if args is None:
+            continue
+
+        returns = " ".join(match.group(1).split())
+        functions.append({"name": name, "returns": returns, "params": params or "void", "args": args})
+    return functions
+
+
+def instrument_module(module_content, functions, keyword):
+    """
+    Instrument the module content for the profiled build (make INSTRUMENT=1, see cc_profile.h).
+    Each profiled definition is renamed to CC_PROF_IMPL(<name>), which is <name>__impl with
+    -DCC_PROFILE and <name> otherwise, after a prototype of <name>; the shims appended to the
+    module define <name>, count and time the call, and call <name>__impl.
+    Without -DCC_PROFILE the module compiles to the same code as without instrumentation.
+    :param module_content: The content of the module file.
+    :param functions: The functions of find_profiled_functions().
+    :param keyword: The keyword identifying the protocol.
+    :return: The instrumented module content.
+    """
+    names = {function["name"] for function in functions}
+
+    def rename(match):
+        name = match.group(2)
+        if name not in names:
+            return match.group(0)
+        prototype = f"{match.group(1)}{name}({match.group(3)});\n"
+        text = match.group(0)
+        offset = match.start(2) - match.start(0)
+        return prototype + text[:offset] + f"CC_PROF_IMPL({name})" + text[offset + len(name):]
+
+    preamble = textwrap.dedent("""\
+        /* Profiled build (make INSTRUMENT=1): the functions below are defined as <name>__impl
+         * and called through the shims at the end of this file */
+        #ifdef CC_PROFILE
+        #define CC_PROF_IMPL(name) name##__impl
+        #else
+        #define CC_PROF_IMPL(name) name
+        #endif
+
+        """)
+
+    shims = [
+        "",
+        "#ifdef CC_PROFILE",
+        f"/* Instrumentation shims of the {len(functions)} {keyword} functions: call counts and timings, see cc_profile.h */",
+        '#include "cc_profile.h"',
+        "",
+        "static struct cc_profile_entry cc_profile_entries[] = {",
+    ]
+    shims += [f'    {{"{function["name"]}", 0, 0, 0}},' for function in functions]
+    shims += ["};", ""]
+    for index, function in enumerate(functions):
+        call = f"{function['name']}__impl({', '.join(function['args'])})"
+        shims += [f"{function['returns']} {function['name']}__impl({function['params']});",
+                  f"{function['returns']} {function['name']}({function['params']})",
+                  "{",
+                  "    cc_profile_enter();"]
+        if function["returns"] == "void":
+            shims += [f"    {call};", f"    cc_profile_exit(&cc_profile_entries[{index}]);"]
+        else:
+            shims += [f"    {function['returns']} result = {call};",
+                      f"    cc_profile_exit(&cc_profile_entries[{index}]);",
+                      "    return result;"]
+        shims += ["}", ""]
+    shims += [
+        "__attribute__((destructor))",
+        "static void cc_profile_report(void)",
+        "{",
+        "    cc_profile_dump(cc_profile_entries, (int)(sizeof(cc_profile_entries) / sizeof(cc_profile_entries[0])));",
+        "}",
+        "#endif /* CC_PROFILE */",
+        "",
+    ]
+
+    return preamble + _DEFINITION_PATTERN.sub(rename, module_content) + "\n".join(shims)
+
+
+# Tokens of a labeled kernel source. Comments, strings and character literals are matched
+# as a whole, so that markers, pointers or field accesses inside them are ignored.
+_TOKEN_PATTERN = re.compile(r"""
+      (?P<marker>//[ \t]*(?P<marker_keyword>[A-Za-z]\w*?)_(?P<marker_defs>defs_)?(?P<marker_edge>begin|end)(?!\w))
+    | (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<struct_def>struct\s+(?P<def_struct>\w+)\s*\{)
+    | (?P<pointer>struct\s+(?P<ptr_struct>\w+)\s*\*+\s*(?P<ptr_name>\w+))
+    | (?P<variable>struct\s+(?P<var_struct>\w+)\s+(?P<var_name>\w+)\s*;)
+    | (?P<ccv>CCV\s*\(\s*(?P<ccv_arg>\w+)\s*,\s*(?P<ccv_field>\w+)\s*\))
+    | (?P<access>(?P<access_base>\w+)\s*(?:->|\.)\s*(?P<access_field>\w+))
+    | (?P<word>\w+)
+""", re.DOTALL | re.VERBOSE)
+
+
+def new_facts():
+    """Facts collected from the module regions of one keyword, resolved by extract_structs_and_fields()."""
+    return {
+        "pointers": [],     # (struct, pointer) of `struct cc_var *ccv`
+        "variables": [],    # (struct, variable) of `struct newreno nreno;`
+        "accesses": [],     # (pointer, field) of `nreno->field` or `nreno.field`
+        "ccv_fields": [],   # (argument, field) of `CCV(ccv, field)`
+    }
+
+
+def scan_source(content):
+    """
+    Tokenize a labeled kernel source in a single pass, collecting for every keyword
+    the `// <KW>_begin` ... `// <KW>_end` (module) and `// <KW>_defs_begin` ... `// <KW>_defs_end`
+    (defs) regions in source order and the facts of its module regions, plus the
+    structs defined anywhere in the source.
+    :param content: The source file content.
+    :return: Dictionary with "regions" ({KW: {"module": [...], "defs": [...]}}),
+             "facts" ({KW: new_facts()}) and "structs".
+    """
+    regions = defaultdict(lambda: {"module": [], "defs": []})
+    facts = defaultdict(new_facts)
+    open_regions = {}
+    module_keywords = []
+    structs = set()
+
+    for token in _TOKEN_PATTERN.finditer(content):
+        kind = token.lastgroup
+
+        if kind == "marker":
+            keyword = token.group("marker_keyword")
+            region = "defs" if token.group("marker_defs") else "module"
+            if token.group("marker_edge") == "begin":
+                # A begin marker inside an open region is kept as content, up to the first end marker
+                if (keyword, region) not in open_regions:
+                    open_regions[(keyword, region)] = token.end()
+                    if region == "module":
+                        module_keywords.append(keyword)
+            elif (keyword, region) in open_regions:
+                regions[keyword][region].append(content[open_regions.pop((keyword, region)):token.start()])
+                if region == "module":
+                    module_keywords.remove(keyword)
+        elif kind == "struct_def":
+            structs.add(token.group("def_struct"))
+        elif kind == "pointer":
+            for keyword in module_keywords:
+                facts[keyword]["pointers"].append((token.group("ptr_struct"), token.group("ptr_name")))
+        elif kind == "variable":
+            for keyword in module_keywords:
+                facts[keyword]["variables"].append((token.group("var_struct"), token.group("var_name")))
+        elif kind == "ccv":
+            for keyword in module_keywords:
+                facts[keyword]["ccv_fields"].append((token.group("ccv_arg"), token.group("ccv_field")))
+        elif kind == "access":
+            for keyword in module_keywords:
+                facts[keyword]["accesses"].append((token.group("access_base"), token.group("access_field")))
+
+    for keyword, region in open_regions:
+        print(f"Warning: // {keyword}_{'defs_' if region == 'defs' else ''}begin has no matching end marker.")
+
+    return {"regions": regions, "facts": facts, "structs": structs}
+
+
+def extract_marked_sections(scan, keyword, marker_type):
+    """
+    Extract marked sections of the scanned source.
+    :param scan: The result of scan_source().
     :param keyword: The keyword identifying the protocol.
     :param marker_type: Either "module" or "defs" to identify the section.
     :return: Extracted content as a string.
     """
     try:
-        with open(input_file, 'r') as infile:
-            content = infile.read()
-
-        # Identify the section markers
-        if marker_type == "module":
-            pattern = rf"// {keyword.upper()}_begin(.*?)// {keyword.upper()}_end"
-        elif marker_type == "defs":
-            pattern = rf"// {keyword.upper()}_defs_begin(.*?)// {keyword.upper()}_defs_end"
-        else:
+        if marker_type not in ("module", "defs"):
             raise ValueError(f"Unknown marker type: {marker_type}")
 
-        matches = re.findall(pattern, content, re.DOTALL)
+        matches = scan["regions"].get(keyword.upper(), {}).get(marker_type)
         if matches:
             return "".join(matches).strip()
         else:
@@ -75,16 +308,16 @@ def extract_marked_sections(input_file, keyword, marker_type):
         print(f"Error extracting marked sections: {e}")
         return ""
 
-def extract_structs_and_fields(module_content, module_headers_file):
+def extract_structs_and_fields(facts, header_structs):
     """
-    Extracts structure definitions, field accesses, and macro mappings from the module content.
-    - Identifies struct pointers (`struct sock *sk`).
-    - Finds fields accessed through these pointers (`sk->field`).
-    - Detects congestion control structures (`bictcp`, `bbr`, etc.).
-    - Generates necessary macros (`tcp_sk(sk)`, `inet_csk_ca(sk)`).
-
-    :param module_content: The content of the module file.
-    :param module_defs_content: The content of the module_defs.h file.
+    Resolves the facts collected by scan_source() into structure definitions, field accesses, and macro mappings.
+    - Identifies struct pointers (`struct cc_var *ccv`) and struct variables.
+    - Finds fields accessed through them (`ccv->field`, `var.field`).
+    - Detects congestion control structures defined in the module header.
+    - Maps `CCV(ccv, field)` accesses to `struct tcpcb`.
+
+    :param facts: The facts of one keyword (see new_facts()).
+    :param header_structs: The structs defined in the module header.
     :return: Dictionary of structures and their accessed fields, plus detected macros, and CC structs.
     """
     try:
@@ -92,78 +325,29 @@ def extract_structs_and_fields(module_content, module_headers_file):
         # Dictionary to store struct fields
         struct_fields = {}
 
-        # Dictionary to store detected macro relationships (e.g., `tcp_sk -> tcp_sock`)
-        struct_macros = {}
-
-        with open(module_headers_file, "r") as f:
-            content = f.read()
-        cc_matches = set(re.findall(r"struct\s+(\w+)\s*\n*\s*\{", content, re.MULTILINE))
-
-        # Step 1: Detect struct pointers in function parameters (e.g., `struct sock *sk`)
-        pointer_pattern = r"struct\s+(\w+)\s*\*+\s*(\w+)"
-        struct_var_pattern = r"struct\s+(\w+)\s+(\w+)\s*;"
-
-        pointer_matches = re.findall(pointer_pattern, module_content)
-        struct_matches = re.findall(struct_var_pattern, module_content)
-
-        ccv_field_pattern = r"CCV\s*\(\s*ccv\s*,\s*(\w+)\s*\)"
-        ccv_fields = set(re.findall(ccv_field_pattern, module_content))
+        # Step 1: Map pointer and variable names to struct types (e.g., `ccv` → `cc_var`),
+        # except for the structures of the module header
+        all_matches = facts["pointers"] + facts["variables"]
+        pointer_map = {ptr_name: struct_name for struct_name, ptr_name in all_matches if struct_name not in header_structs}
 
-
-        all_matches = pointer_matches + struct_matches
-
-        filtered_matches = [
-            (struct_type, var_name)
-            for struct_type, var_name in all_matches
-            if struct_type not in cc_matches
-        ]
-
-        # Map pointer names to struct types (e.g., `sk` → `sock`)
-        pointer_map = {ptr_name: struct_name for struct_name, ptr_name in filtered_matches}
-
-        # Step 2: Find field accesses using either `->` or `.`
-        field_access_pattern = r"(\w+)\s*(?:->|\.)\s*([\w]+)"
-        field_matches = re.findall(field_access_pattern, module_content)
-
-
-        # Step 3: Assign detected fields to their corresponding structures
-        for pointer, field in field_matches:
+        # Step 2: Assign detected fields to their corresponding structures
+        for pointer, field in facts["accesses"]:
             if pointer in pointer_map:  # Check if the pointer belongs to a known struct
-                struct_name = pointer_map[pointer]
-                if struct_name not in struct_fields:
-                    struct_fields[struct_name] = set()
-                struct_fields[struct_name].add(field)
-
-        # Step 4: Detect congestion control structures (`bictcp`, `bbr`, etc.)
-        cc_structs_used = set()
-        for cc_struct in cc_matches:
-            cc_structs_used.add(cc_struct)  # Only add if it is in module_header.h
+                struct_fields.setdefault(pointer_map[pointer], set()).add(field)
 
-        # Step 6: Detect FreeBSD-style implicit macro usages like:
-        # e.g., uint64_t val = CCV(ccv, snd_cwnd);
-        # Here, we assume CCV maps to struct tcpcb
+        # Step 3: Detect congestion control structures (`newreno`, etc.)
+        cc_structs_used = set(header_structs)
 
+        # Step 4: FreeBSD-style macro usages like `uint64_t val = CCV(ccv, snd_cwnd);`
         # You can hardcode the known macro → struct mapping
         struct_macros = {
             "CCV": "tcpcb",  # Add other macros here if needed
         }
 
-        # Step 7: Detect macro-based struct field accesses (e.g., `CCV(ccv, snd_cwnd)`)
-        for macro, struct_name in struct_macros.items():
-            # Match macro like CCV(ccv, snd_cwnd)
-            macro_access_pattern = rf"{macro}\(\w+,\s*([\w]+)\)"
-            macro_field_matches = re.findall(macro_access_pattern, module_content)
-
-            # Add these fields to the corresponding struct
-            for field in macro_field_matches:
-                if struct_name in struct_fields:
-                    struct_fields[struct_name].add(field)
-                else:
-                    struct_fields[struct_name] = {field}
-
-        # Inject tcpcb mock if needed
-        if "tcpcb" not in struct_fields:
-            struct_fields["tcpcb"] = {f"{field}" for field in ccv_fields}
+        # Step 5: Add the fields accessed through CCV(ccv, field) to struct tcpcb
+        struct_fields.setdefault("tcpcb", set())
+        for _, field in facts["ccv_fields"]:
+            struct_fields["tcpcb"].add(field)
 
         return struct_fields, struct_macros, cc_structs_used
 
@@ -173,31 +357,30 @@ def extract_structs_and_fields(module_content, module_headers_file):
 
 
 ############################################# CC.H ###################################################################
-def generate_cc_h(module_file, module_headers_file):
+def generate_cc_h(facts, module_headers_file, test_dir="test_dir"):
     """
-    Generate the cc.h file with a mock implementation of Linux kernel's TCP structures.
-    - Automatically detects struct pointers and field accesses.
-    - Ensures correct struct nesting (e.g., `sock` contains `tcp_sock`, `bictcp`, `bbr`, etc.).
+    Generate the cc.h file with a mock implementation of FreeBSD's CC structures.
+    - Uses the struct pointers and field accesses found by scan_source().
+    - Ensures correct struct nesting.
     - Dynamically generates necessary macros based on actual usage.
     - Provides comments for users to manually add any undefined macros/functions.
 
-    :param module_file: The module file to process.
-    :param module_defs_file: The module_defs.h file to check for pre-defined structures.
-    :param output_tcp_h: The output tcp.h file.
+    :param facts: The facts of the module regions of the keyword (see new_facts()).
+    :param module_headers_file: The module header, checked for pre-defined structures.
+    :param test_dir: The directory receiving cc.h.
     """
     try:
 
-        cwd = os.getcwd()
-        dir_path = os.path.join(cwd, 'test_dir')
+        dir_path = os.path.abspath(test_dir)
         os.makedirs(dir_path, exist_ok=True)
         output_cc_h=os.path.join(dir_path,"cc.h")
 
-        # Read the input files
-        with open(module_file, 'r') as infile:
-            module_content = infile.read()
+        # Structures defined by the module header
+        with open(module_headers_file, "r") as f:
+            header_structs = scan_source(f.read())["structs"]
 
-        # Extract dynamically detected struct fields and macros
-        extracted_fields, struct_macros, cc_structs_used = extract_structs_and_fields(module_content, module_headers_file)
+        # Resolve the struct fields and macros detected in the source
+        extracted_fields, struct_macros, cc_structs_used = extract_structs_and_fields(facts, header_structs)
 
         # Optional: skip system-defined structs like timeval
         extracted_fields.pop("timeval", None)
@@ -208,27 +391,6 @@ def generate_cc_h(module_file, module_headers_file):
             extracted_fields["cc_var"].discard("cc_data")
             extracted_fields["cc_var"].discard("ccvc")
 
-        # Get current date and time
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Header file content
-        header_comment = textwrap.dedent(f"""\
-            /*
-             *****************************************************************************
-             * Automatically Generated {output_cc_h}
-             * ----------------------------------
-             * This file was automatically generated by the `generate_module.py` script
-             * on {current_datetime}.
-             *
-             * It defines core CC structures required for the test framework.
-             * Note: This file does NOT include congestion control structures.
-             *
-             * ⚠ WARNING: If you modify this file manually, be aware that rerunning
-             * the `generate_module.py` script will overwrite any changes.
-             * ✅ To customize the generated content, consider modifying `generate_module.py`.
-             *****************************************************************************
-            */
-            """)
-
         include_guard = textwrap.dedent("""\
             #ifndef CC_H
             #define CC_H
@@ -266,7 +428,7 @@ def generate_cc_h(module_file, module_headers_file):
             if struct in visited:
                 return
             visited.add(struct)
-            for dep in struct_dependencies[struct]:
+            for dep in sorted(struct_dependencies[struct]):
                 visit(dep)
             sorted_structs.append(struct)
 
@@ -277,7 +439,7 @@ def generate_cc_h(module_file, module_headers_file):
         # Step 3: Generate structure definitions dynamically
         struct_definitions = []
         for struct_name in sorted_structs:
-            fields = extracted_fields[struct_name]
+            fields = sorted(extracted_fields[struct_name])
             struct_body = "\n".join([f"    uint64_t {field};" if " " not in field else f"    {field};" for field in fields])
             struct_definitions.append(f"struct {struct_name} {{\n{struct_body}\n}};\n")
 
@@ -294,38 +456,62 @@ def generate_cc_h(module_file, module_headers_file):
         footer = "\n#endif /* CC_H */\n"
 
         # Combine everything into the final cc.h content
-        cc_h_content = (
-            header_comment + "\n" +
+        body = (
             include_guard + "\n" +
             "\n".join(struct_definitions) + "\n" +
             "\n".join(macro_definitions) + "\n" +
             footer
         )
 
-        # Write to cc.h
-        with open(output_cc_h, 'w') as outfile:
-            outfile.write(cc_h_content)
+        # Header file content
+        header_comment = textwrap.dedent(f"""\
+            /*
+             *****************************************************************************
+             * Automatically Generated cc.h
+             * ----------------------------------
+             * This file was automatically generated by the `generate_module.py` script.
+             * Content hash: {content_hash(body)}
+             *
+             * It defines core CC structures required for the test framework.
+             * Note: This file does NOT include congestion control structures.
+             *
+             * ⚠ WARNING: If you modify this file manually, be aware that rerunning
+             * the `generate_module.py` script will overwrite any changes.
+             * ✅ To customize the generated content, consider modifying `generate_module.py`.
+             *****************************************************************************
+            */
+            """)
 
-        print(f"Generated: cc.h")
+        # Write to cc.h only if its content changed
+        write_if_changed(output_cc_h, header_comment + "\n" + body)
 
     except Exception as e:
         print(f"Error generating cc.h: {e}")
 
 ############################################# MODULE.C &  MODULE_HEADERS.H ###################################################
-def generate_files(input_file, keyword):
+def generate_files(input_file, keyword, test_dir="test_dir", instrument=False):
     """
     Generate the module, defs, and tcp.h files from the input file.
     :param input_file: The source file to process.
     :param keyword: The keyword identifying the protocol.
+    :param test_dir: The directory receiving the generated files.
+    :param instrument: Add the instrumentation shims of the module functions (see instrument_module()).
     """
     try:
 
-        cwd = os.getcwd()
-        dir_path = os.path.join(cwd, 'test_dir')
+        dir_path = os.path.abspath(test_dir)
         os.makedirs(dir_path, exist_ok=True)
 
+        # Tokenize the source once; the regions and facts of every keyword come from this pass
+        with open(input_file, 'r') as infile:
+            scan = scan_source(infile.read())
+
+        # The header sits next to the source and is copied next to the module
+        header_file = os.path.splitext(input_file)[0]
+        header_name = os.path.basename(header_file)
+
         # Extract and process module content
-        module_content = extract_marked_sections(input_file, keyword, "module")
+        module_content = extract_marked_sections(scan, keyword, "module")
         if module_content:
             # Apply replacements
             replacements = {
@@ -343,65 +529,63 @@ def generate_files(input_file, keyword):
             # Write to module file
             module_file = os.path.join(dir_path, f"{keyword}_module.c")
 
-            # Get current date and time
-            current_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             # Generate uppercase keyword
             keyword_upper = keyword.upper()
 
-            with open(module_file, 'w') as outfile:
-                # Write the header comment block
-                header_comment = textwrap.dedent(f"""\
-                    /*
-                     *****************************************************************************
-                     *  Automatically Generated {keyword}_module.c
-                     *  ----------------------------------------------------------------------------
-                     * This file was automatically generated by the `generate_module.py` script.
-                     * It extracts the `{keyword_upper}_begin` to `{keyword_upper}_end` module section
-                     * from the **source file**: `{input_file}` and was generated on {current_datetime}.
-                     *
-                     * This file is part of a test framework designed for evaluating TCP module implementations.
-                     *  
-                     *  ⚠ WARNING: 
-                     * If you modify this file directly, rerunning `generate_module.py` will overwrite your changes.
-                     *  
-                     *  ✅ To prevent losing your modifications:
-                     * - Modify the **source file** `{input_file}` instead.
-                     *****************************************************************************
-                    */
-                    """)
-
-                header_file = os.path.splitext(input_file)[0]
-
-                # Write the module content
-                includes = textwrap.dedent(f"""\
-                    #include <string.h>
-                    #include "cc.h"
-                    #include "{header_file}.h"
-                    #include "cc_helper_function.h"
-                    """)
-
-                # Write all components to the file
-                outfile.write(header_comment + "\n" + includes+ "\n" + module_content)
-
-            print(f"Generated: {f"{keyword}_module.c"}")
-
-        # Copy {header_file}.h to the test directory
-        copy_file_if_exists(f"{header_file}.h", dir_path)
+            # Write the module content
+            includes = textwrap.dedent(f"""\
+                #include <string.h>
+                #include "cc.h"
+                #include "{header_name}.h"
+                #include "cc_helper_function.h"
+                """)
+            body = includes + "\n" + (instrument_module(module_content, find_profiled_functions(module_content),
+                                                        keyword) if instrument else module_content)
+
+            # Write the header comment block
+            header_comment = textwrap.dedent(f"""\
+                /*
+                 *****************************************************************************
+                 *  Automatically Generated {keyword}_module.c
+                 *  ----------------------------------------------------------------------------
+                 * This file was automatically generated by the `generate_module.py` script.
+                 * It extracts the `{keyword_upper}_begin` to `{keyword_upper}_end` module section
+                 * from the **source file**: `{input_file}`.
+                 * Content hash: {content_hash(body)}
+                 *
+                 * This file is part of a test framework designed for evaluating TCP module implementations.
+                 *  
+                 *  ⚠ WARNING: 
+                 * If you modify this file directly, rerunning `generate_module.py` will overwrite your changes.
+                 *  
+                 *  ✅ To prevent losing your modifications:
+                 * - Modify the **source file** `{input_file}` instead.
+                 *****************************************************************************
+                */
+                """)
+
+            # Write all components to the file, only if they changed
+            write_if_changed(module_file, header_comment + "\n" + body)
+
+        # Copy {header_file}.h to the test directory; its constants can be overridden with -DNAME=value
+        copy_header_with_overrides(f"{header_file}.h", dir_path)
 
         # Generate cc.h
-        generate_cc_h(module_file, f"{header_file}.h")
+        generate_cc_h(scan["facts"][keyword.upper()], f"{header_file}.h", test_dir)
 
     except Exception as e:
         print(f"Error generating files: {e}")
 
 ############################################# MAKEFILE ###################################################################
-def generate_makefile(keyword):
+def generate_makefile(keyword, test_dir="test_dir", profile="release", train=()):
     """
     Generates a Makefile automatically based on the detected C source files.
+    :param test_dir: The directory receiving the Makefile.
+    :param profile: The default build profile: debug, release, native or pgo.
+    :param train: Traces (paths or glob patterns) replayed to train the pgo profile.
     """
     try:
-        cwd = os.getcwd()
-        dir_path = os.path.join(cwd, 'test_dir')
+        dir_path = os.path.abspath(test_dir)
         os.makedirs(dir_path, exist_ok=True)
         output_file=os.path.join(dir_path,"Makefile")
 
@@ -411,55 +595,139 @@ def generate_makefile(keyword):
         cc = "gcc"
         cflags = "-Wall -Wextra"
 
-        # Get current date and time
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Write the header comment block
-        header_comment = textwrap.dedent(f"""\
-        # *****************************************************************************
-        # * Automatically Generated Makefile
-        # * --------------------------------
-        # * This Makefile was generated by the `generate_module.py` script 
-        # * on {current_datetime}.
-        # *
-        # * ⚠ WARNING: 
-        # * Any manual modifications may be overwritten if the script is run again.
-        # *
-        # * ✅ If you need to customize the build process, modify `generate_module.py`
-        # * or create a separate custom Makefile that includes this one.
-        # *****************************************************************************
-        """ )
+        # The Makefile lives in the test directory, so the training traces are made absolute
+        train = " ".join(os.path.abspath(pattern) for pattern in train)
+
+        # Prefix of the entry points in the object of the differential harness, a C identifier
+        namespace = re.sub(r"\W", "_", keyword)
 
         # Construct the Makefile content
         makefile_content = f"""\
 # Variables
 CC = {cc}
 CFLAGS = {cflags}
+# Compile-time overrides of the header constants, e.g. make DEFINES="-DSEARCH_THRESH=40"
+DEFINES =
+# Function profile of the module (extracted with ss_extract.py -I), e.g. make INSTRUMENT=1; see cc_profile.h
+INSTRUMENT =
+INSTRUMENT_FLAGS = $(if $(INSTRUMENT),-DCC_PROFILE)
+# Build profile: debug, release, native (tuned for the CPU that builds it) or pgo (release trained on the TRAIN traces),
+# e.g. make PROFILE=debug
+PROFILE = {profile}
+# Traces (paths or glob patterns) replayed by the instrumented binary of the pgo profile
+TRAIN = {train}
 EXEC = {executable_name}
+# Shared library with the cc_* entry points of test_harness.h, built by make lib (see ss_lib.py)
+LIB = lib{keyword}.so
 SRC = {keyword}_module.c test_{keyword}.c
 
+OBJ = $(SRC:.c=.o)
+DEP = $(OBJ:.o=.d)
+LIB_OBJ = $(SRC:.c=.pic.o)
+# Relocatable object of the differential harness, built by make diff (see ss_diff.py)
+NAMESPACE = {namespace}
+DIFF_OBJ = $(NAMESPACE).diff.o
+NS_OBJ = $(SRC:.c=.ns.o)
+CC_SYMBOLS = cc_api_version cc_field_count cc_field_name cc_field_size cc_open cc_reset cc_step cc_state cc_close
+OBJCOPY = objcopy
+FLAGS_FILE = .build_flags
+PGO_DIR = .pgo_train
+
+# Optimization flags of each profile; pgo-generate and pgo-use are the two builds of the pgo profile,
+# the other targets of the pgo profile (e.g. lib) use the release flags
+PROFILE_FLAGS_debug = -O0 -g
+PROFILE_FLAGS_release = -O2
+PROFILE_FLAGS_native = -O3 -march=native -flto=auto
+PROFILE_FLAGS_pgo = $(PROFILE_FLAGS_release)
+PROFILE_FLAGS_pgo-generate = $(PROFILE_FLAGS_release) -fprofile-generate
+PROFILE_FLAGS_pgo-use = $(PROFILE_FLAGS_release) -fprofile-use -fprofile-correction -Wno-missing-profile
+PROFILE_FLAGS = $(PROFILE_FLAGS_$(PROFILE))
+
+ifeq ($(PROFILE_FLAGS),)
+$(error Unknown PROFILE '$(PROFILE)', expected debug, release, native or pgo)
+endif
+
 # The default rule
+ifeq ($(PROFILE),pgo)
+all: pgo
+else
 all: $(EXEC)
+endif
+
+# Link the objects into the program
+$(EXEC): $(OBJ)
+\t$(CC) $(PROFILE_FLAGS) -o $(EXEC) $(OBJ) $(LDFLAGS)
+
+# Compile each source on its own; -MMD records the headers it includes in a .d file
+%.o: %.c $(FLAGS_FILE)
+\t$(CC) $(CFLAGS) $(PROFILE_FLAGS) $(DEFINES) $(INSTRUMENT_FLAGS) -MMD -MP -c -o $@ $<
+
+# Build the shared library from position-independent objects, with the cc_* entry points instead of main()
+lib: $(LIB)
+
+$(LIB): $(LIB_OBJ)
+\t$(CC) $(PROFILE_FLAGS) -shared -o $(LIB) $(LIB_OBJ) $(LDFLAGS)
+
+%.pic.o: %.c $(FLAGS_FILE)
+\t$(CC) $(CFLAGS) $(PROFILE_FLAGS) $(DEFINES) $(INSTRUMENT_FLAGS) -fPIC -DHARNESS_LIBRARY -MMD -MP -c -o $@ $<
+
+# Link the library objects into one relocatable object whose cc_* entry points are renamed
+# <NAMESPACE>_cc_* and whose other symbols are made local, so that the objects of several
+# algorithms link into one binary. LTO is left out: objcopy needs the compiled code.
+diff: $(DIFF_OBJ)
+
+$(DIFF_OBJ): $(NS_OBJ)
+\t$(LD) -r -o $@.tmp $(NS_OBJ)
+\t$(OBJCOPY) $(foreach s,$(CC_SYMBOLS),--redefine-sym $(s)=$(NAMESPACE)_$(s) -G $(NAMESPACE)_$(s)) $@.tmp $@
+\trm -f $@.tmp
+
+%.ns.o: %.c $(FLAGS_FILE)
+\t$(CC) $(CFLAGS) $(filter-out -flto%,$(PROFILE_FLAGS)) $(DEFINES) $(INSTRUMENT_FLAGS) -DHARNESS_LIBRARY -MMD -MP -c -o $@ $<
 
-# Rule to compile the program
-$(EXEC): $(SRC)
-\t$(CC) -o $(EXEC) $(SRC) $(CFLAGS)
+# Recompile every object when the compiler or its flags change (e.g. another DEFINES, PROFILE or INSTRUMENT)
+$(FLAGS_FILE): FORCE
+\t@echo '$(CC) $(CFLAGS) $(PROFILE_FLAGS) $(DEFINES) $(INSTRUMENT_FLAGS)' | cmp -s - $@ || echo '$(CC) $(CFLAGS) $(PROFILE_FLAGS) $(DEFINES) $(INSTRUMENT_FLAGS)' > $@
+
+# Profile-guided build: build an instrumented binary, replay the TRAIN traces with it, then rebuild with the profile
+pgo:
+\t@test -n "$(wildcard $(TRAIN))" || {{ echo "No training trace: set TRAIN, e.g. make pgo TRAIN='../traces/*.csv'"; exit 1; }}
+\trm -rf *.gcda $(PGO_DIR) && mkdir $(PGO_DIR)
+\t$(MAKE) PROFILE=pgo-generate $(EXEC)
+\t./$(EXEC) -o $(PGO_DIR) $(wildcard $(TRAIN)) > /dev/null
+\t$(MAKE) PROFILE=pgo-use $(EXEC)
+\trm -rf $(PGO_DIR)
+
+-include $(DEP) $(LIB_OBJ:.o=.d) $(NS_OBJ:.o=.d)
 
 # Clean up compiled files
 clean:
-\trm -f $(EXEC)
+\trm -rf $(EXEC) $(OBJ) $(DEP) $(LIB) $(LIB_OBJ) $(LIB_OBJ:.o=.d) $(NS_OBJ) $(NS_OBJ:.o=.d) *.diff.o $(FLAGS_FILE) *.gcda $(PGO_DIR)
 
 # Run the program
 run: $(EXEC)
 \t./$(EXEC)
 
-.PHONY: all clean run
+.PHONY: all clean run pgo lib diff FORCE
 """
 
-        # Write the Makefile
-        with open(output_file, "w") as f:
-            f.write(header_comment+ "\n" + makefile_content)
+        # Write the header comment block
+        header_comment = textwrap.dedent(f"""\
+        # *****************************************************************************
+        # * Automatically Generated Makefile
+        # * --------------------------------
+        # * This Makefile was generated by the `generate_module.py` script.
+        # * Content hash: {content_hash(makefile_content)}
+        # *
+        # * ⚠ WARNING: 
+        # * Any manual modifications may be overwritten if the script is run again.
+        # *
+        # * ✅ If you need to customize the build process, modify `generate_module.py`
+        # * or create a separate custom Makefile that includes this one.
+        # *****************************************************************************
+        """ )
 
-        print(f"Generated: Makefile")
+        # Write the Makefile, only if it changed
+        write_if_changed(output_file, header_comment + "\n" + makefile_content)
 
     except Exception as e:
         print(f"Error generating Makefile: {e}")
@@ -473,13 +741,20 @@ def main():
     # Add arguments
     parser.add_argument("-f", "--file", required=True, help="Path to the input file")
     parser.add_argument("-k", "--keyword", required=True, help="Keyword to use for processing")
+    parser.add_argument("-d", "--test_dir", default="test_dir", help="Directory receiving the generated files (default: test_dir)")
+    parser.add_argument("-p", "--profile", choices=["debug", "release", "native", "pgo"], default="release",
+                        help="Default build profile of the Makefile (default: release)")
+    parser.add_argument("-t", "--train", nargs="+", default=[], metavar="TRACE",
+                        help="Traces or glob patterns replayed to train the pgo profile")
+    parser.add_argument("-I", "--instrument", action="store_true",
+                        help="Add call count and timing shims to the module functions, enabled with make INSTRUMENT=1")
 
     # Parse arguments
     args = parser.parse_args()
 
     # Run functions with parsed arguments
-    generate_files(args.file, args.keyword)
-    generate_makefile(args.keyword)
+    generate_files(args.file, args.keyword, args.test_dir, args.instrument)
+    generate_makefile(args.keyword, args.test_dir, args.profile, args.train)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+import os
+import time
+import ctypes
+import subprocess
+import argparse
+import numpy as np
+from ss_convert import TRACE_COLUMNS, TRACE_MAGIC, HEADER_STRUCT, parse_csv_line
+
+# Version of the cc_* entry points of support/test_harness.h this driver speaks
+API_VERSION = 1
+
+# Record layout of a binary trace written by ss_convert.py
+TRACE_RECORD_DTYPE = np.dtype([("line", "<u4"), ("columns", "<u4"), ("v", "<u8", (len(TRACE_COLUMNS),))])
+
+_u64_pointer = ctypes.POINTER(ctypes.c_ulonglong)
+_i64_pointer = ctypes.POINTER(ctypes.c_longlong)
+
+
+def load_library(test_dir, keyword, build=True):
+    """
+    Load lib<keyword>.so of a test directory, building it first with `make lib`.
+    :return: Dictionary with the ctypes library, the record fields and their NumPy dtype.
+    """
+    path = os.path.abspath(os.path.join(test_dir, f"lib{keyword}.so"))
+    if build:
+        process = subprocess.run(["make", "-C", test_dir, "lib"], stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, text=True)
+        if process.returncode != 0:
+            lines = process.stdout.strip().splitlines()
+            raise RuntimeError(f"make lib failed in {test_dir}: {lines[-1] if lines else process.returncode}")
+
+    lib = ctypes.CDLL(path)
+    lib.cc_api_version.restype = ctypes.c_int
+    if lib.cc_api_version() != API_VERSION:
+        raise RuntimeError(f"{path} has API version {lib.cc_api_version()}, expected {API_VERSION}")
+
+    lib.cc_field_count.restype = ctypes.c_int
+    lib.cc_field_name.argtypes = [ctypes.c_int]
+    lib.cc_field_name.restype = ctypes.c_char_p
+    lib.cc_field_size.argtypes = [ctypes.c_int]
+    lib.cc_field_size.restype = ctypes.c_int
+    lib.cc_open.restype = ctypes.c_void_p
+    lib.cc_reset.argtypes = [ctypes.c_void_p]
+    lib.cc_reset.restype = ctypes.c_int
+    lib.cc_step.argtypes = [ctypes.c_void_p, ctypes.POINTER(_u64_pointer), ctypes.c_int, ctypes.c_longlong,
+                            ctypes.POINTER(ctypes.c_uint), _i64_pointer, _i64_pointer]
+    lib.cc_step.restype = ctypes.c_longlong
+    lib.cc_state.argtypes = [ctypes.c_void_p, _i64_pointer]
+    lib.cc_state.restype = ctypes.c_int
+    lib.cc_close.argtypes = [ctypes.c_void_p]
+    lib.cc_close.restype = None
+
+    # Records are native int64 values, one field after the other as in trace_fields
+    fields = [(lib.cc_field_name(i).decode(), lib.cc_field_size(i)) for i in range(lib.cc_field_count())]
+    dtype = np.dtype([(name, np.int64) if size == 1 else (name, np.int64, (size,)) for name, size in fields])
+    return {"path": path, "lib": lib, "fields": fields, "dtype": dtype}
+
+
+def open_state(library):
+    """Open a new CC state (the trace_open() of the test file)."""
+    handle = library["lib"].cc_open()
+    if not handle:
+        raise RuntimeError(f"cc_open failed in {library['path']}")
+    return {"library": library, "handle": handle}
+
+
+def reset_state(state):
+    """Rebuild the CC state as for a new trace."""
+    if state["library"]["lib"].cc_reset(state["handle"]) != 0:
+        raise RuntimeError("cc_reset failed")
+
+
+def close_state(state):
+    """Free the CC state (the trace_close() of the test file)."""
+    if state["handle"]:
+        state["library"]["lib"].cc_close(state["handle"])
+        state["handle"] = None
+
+
+def step(state, columns, lines=None):
+    """
+    Run the CC logic over a batch of rows.
+    :param columns: Column arrays in the order of TRACE_COLUMNS, or a dictionary keyed by their
+                    names (the leading columns present are used). uint64 C-contiguous arrays
+                    are passed without a copy.
+    :param lines: Optional line numbers of the rows, by default numbered on from the last step.
+    :return: Tuple (records of the rows as a structured array, number of rows consumed); fewer
+             rows are consumed once the test file stopped the trace (HARNESS_STOP).
+    """
+    if isinstance(columns, dict):
+        names = []
+        for name in TRACE_COLUMNS:
+            if name not in columns:
+                break
+            names.append(name)
+        columns = [columns[name] for name in names]
+
+    arrays = [np.ascontiguousarray(column, dtype=np.uint64) for column in columns]
+    rows = len(arrays[0]) if arrays else 0
+    if any(len(array) != rows for array in arrays):
+        raise ValueError("column arrays have different lengths")
+    if len(arrays) > len(TRACE_COLUMNS):
+        raise ValueError(f"at most {len(TRACE_COLUMNS)} columns are supported")
+
+    pointers = (_u64_pointer * max(len(arrays), 1))(*[array.ctypes.data_as(_u64_pointer) for array in arrays])
+    line_array = None
+    if lines is not None:
+        line_array = np.ascontiguousarray(lines, dtype=np.uint32)
+        if len(line_array) != rows:
+            raise ValueError("lines and columns have different lengths")
+
+    library = state["library"]
+    records = np.empty(rows, dtype=library["dtype"])
+    written = ctypes.c_longlong(0)
+    consumed = library["lib"].cc_step(
+        state["handle"], pointers, len(arrays), rows,
+        line_array.ctypes.data_as(ctypes.POINTER(ctypes.c_uint)) if line_array is not None else None,
+        records.ctypes.data_as(_i64_pointer), ctypes.byref(written))
+    if consumed < 0:
+        raise RuntimeError("cc_step rejected its arguments")
+    return records[:written.value], consumed
+
+
+def read_state(state):
+    """Record of the last row that wrote one, or None before the first."""
+    record = np.zeros(1, dtype=state["library"]["dtype"])
+    if state["library"]["lib"].cc_state(state["handle"], record.ctypes.data_as(_i64_pointer)) != 0:
+        return None
+    return record[0]
+
+
+def load_trace(input_file):
+    """
+    Read a .csv or binary trace into column arrays, skipping the same lines as the harness.
+    :return: Dictionary with "values" (one contiguous uint64 row per column), "lines" and
+             "columns" (the number of columns parsed for each row).
+    """
+    with open(input_file, 'rb') as infile:
+        magic = infile.read(len(TRACE_MAGIC))
+
+    if magic == TRACE_MAGIC:
+        records = np.fromfile(input_file, dtype=TRACE_RECORD_DTYPE, offset=HEADER_STRUCT.size)
+        return {"values": np.ascontiguousarray(records["v"].T), "lines": records["line"].copy(),
+                "columns": records["columns"].copy()}
+
+    lines, counts, rows = [], [], []
+    with open(input_file, 'r') as infile:
+        for line_number, line in enumerate(infile, start=1):
+            # Skip the header line or lines that start with '#'
+            if line_number == 1 or line.startswith("#"):
+                continue
+            values = parse_csv_line(line)
+            lines.append(line_number)
+            counts.append(len(values))
+            rows.append(values + [0] * (len(TRACE_COLUMNS) - len(values)))
+
+    values = np.array(rows, dtype=np.uint64).reshape(-1, len(TRACE_COLUMNS))
+    return {"values": np.ascontiguousarray(values.T), "lines": np.array(lines, dtype=np.uint32),
+            "columns": np.array(counts, dtype=np.uint32)}
+
+
+def replay(library, input_file):
+    """
+    Replay a whole trace in-process, like the test binary with -F npy.
+    :return: Structured array of the records.
+    """
+    trace = load_trace(input_file)
+    state = open_state(library)
+    try:
+        # Rows are stepped in runs of the same column count, as the harness checks it per row
+        counts = trace["columns"]
+        bounds = [0] + [int(i) for i in np.flatnonzero(counts[1:] != counts[:-1]) + 1] + [len(counts)]
+        chunks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            columns = [column[start:end] for column in trace["values"][:int(counts[start])]]
+            records, consumed = step(state, columns, trace["lines"][start:end])
+            chunks.append(records)
+            if consumed < end - start:
+                break
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=library["dtype"])
+    finally:
+        close_state(state)
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Replay traces in-process through the shared library of a test directory.")
+
+    parser.add_argument("-k", "--keyword", required=True, help="The keyword used for the test (e.g., 'search').")
+    parser.add_argument("-d", "--test_dir", default="test_dir", help="The directory with the generated sources and Makefile.")
+    parser.add_argument("-i", "--input", nargs="+", required=True, help="The .csv or binary traces to replay.")
+    parser.add_argument("-o", "--output_folder", help="Write the records of each trace to <output_folder>/<name>.npy.")
+
+    args = parser.parse_args()
+
+    try:
+        library = load_library(args.test_dir, args.keyword)
+    except (OSError, RuntimeError) as e:
+        print(f"Error loading the library: {e}")
+        raise SystemExit(1)
+
+    if args.output_folder:
+        os.makedirs(args.output_folder, exist_ok=True)
+    for input_file in args.input:
+        try:
+            start = time.perf_counter()
+            records = replay(library, input_file)
+            elapsed = time.perf_counter() - start
+            print(f"{input_file}: {len(records)} records in {elapsed:.3f} s")
+            if args.output_folder:
+                name = os.path.splitext(os.path.basename(input_file))[0]
+                np.save(os.path.join(args.output_folder, f"{name}.npy"), records)
+        except Exception as e:
+            print(f"Error replaying {input_file}: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+import argparse
+from ss_convert import TRACE_COLUMNS, count_trace_rows, find_csv_files, parse_csv_line
+from ss_prepare import find_framework, discover_pairs, select_test_file, workspace_path, prepare_workspace
+
+# Version of the layout of perf_results.json
+RESULTS_VERSION = 1
+
+# Rows of the synthetic stress trace
+DEFAULT_STRESS_ROWS = 2000000
+
+# Cumulative columns of a trace; the stress trace shifts them at every repetition of the template
+CUMULATIVE_COLUMNS = ["now_us", "bytes_acked", "tp_delivered", "snd_nxt", "snd_una"]
+
+# Metrics of an algorithm, with whether a higher value is better
+METRICS = {
+    "extract_s": False,
+    "build_s": False,
+    "replay_s": False,
+    "replay_rows_per_sec": True,
+    "replay_mb_per_sec": True,
+    "stress_s": False,
+    "stress_rows_per_sec": True,
+    "stress_mb_per_sec": True,
+}
+
+
+def find_traces(input_folder):
+    """
+    Find the input traces under a folder: the .csv files whose header starts with the
+    columns of the harness (the kernel logs used by ss_verify.py are left out).
+    :return: Sorted list of trace paths.
+    """
+    traces = []
+    for path in find_csv_files(input_folder):
+        with open(path, 'r') as infile:
+            names = [name.strip() for name in infile.readline().strip().split(",")]
+        if len(names) > 1 and names == TRACE_COLUMNS[:len(names)]:
+            traces.append(path)
+    return sorted(traces)
+
+
+def make_stress_trace(template, output_file, rows):
+    """
+    Write a synthetic trace of the given number of rows by repeating the rows of a template
+    trace. The cumulative columns (time, bytes, sequence numbers) are shifted at every
+    repetition so that they keep growing as in one long flow.
+    :return: Size of the trace in bytes.
+    """
+    with open(template, 'r') as infile:
+        header = infile.readline()
+        values = [parse_csv_line(line) for line in infile if line.strip() and not line.startswith("#")]
+    values = [row for row in values if row]
+    if not values:
+        raise ValueError(f"{template} has no rows")
+
+    # Keep the columns every row has, so that all the rows of the stress trace are valid
+    columns = min(len(row) for row in values)
+    values = [row[:columns] for row in values]
+    header = ",".join(header.strip().split(",")[:columns]) + "\n"
+    cumulative = [TRACE_COLUMNS.index(name) for name in CUMULATIVE_COLUMNS if TRACE_COLUMNS.index(name) < columns]
+    # Shift by the span of the template plus the step between its first two rows
+    shift = {i: values[-1][i] - values[0][i] + (values[1][i] - values[0][i] if len(values) > 1 else 1)
+             for i in cumulative}
+
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as outfile:
+        outfile.write(header)
+        written = 0
+        repetition = 0
+        while written < rows:
+            lines = []
+            for row in values[:rows - written]:
+                row = list(row)
+                for i in cumulative:
+                    row[i] += shift[i] * repetition
+                lines.append(",".join(map(str, row)))
+            outfile.write("\n".join(lines) + "\n")
+            written += len(lines)
+            repetition += 1
+    os.replace(tmp_file, output_file)
+    return os.path.getsize(output_file)
+
+
+def time_command(command, repeat=3, cwd=None, before=None):
+    """
+    Time a command, repeat times.
+    :param before: Optional command run (untimed) before each timing, e.g. `make clean`.
+    :return: Best wall-clock time in seconds, or None if the command failed.
+    """
+    best = None
+    for _ in range(repeat):
+        if before:
+            subprocess.run(before, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def rates(seconds, rows, size):
+    """Rows/sec and MB/sec of a replay, None when it failed."""
+    if not seconds:
+        return None, None
+    return rows / seconds, size / seconds / 1e6
+
+
+def bench_pair(framework_dir, source, keyword, test_keyword, workspace, traces, stress, repeat=3,
+               output_format="text"):
+    """
+    Time the extraction, the build and the replays of one (source, keyword) pair.
+    :param traces: Dictionary with the "files", "rows" and "bytes" of the replayed corpus.
+    :param stress: Dictionary with the "file", "rows" and "bytes" of the stress trace, or None.
+    :return: Dictionary of the result of the pair (see METRICS), with an "error" when it failed.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    result = {"name": f"{os.path.basename(framework_dir)}/{stem}/{keyword}", "source": os.path.basename(source),
+              "keyword": keyword}
+    result.update({metric: None for metric in METRICS})
+
+    # Step 1: Prepare the workspace once, which also checks that the pair builds
+    ready, error = prepare_workspace(framework_dir, source, keyword, test_keyword, workspace)
+    if not ready:
+        result["error"] = error
+        return result
+
+    # Step 2: Extraction and build times
+    relative_source = os.path.relpath(os.path.abspath(source), framework_dir)
+    result["extract_s"] = time_command(
+        [sys.executable, os.path.join(framework_dir, "bin", "ss_extract.py"), "-f", relative_source, "-k", keyword,
+         "-d", workspace], repeat, cwd=framework_dir)
+    result["build_s"] = time_command(["make", "-C", workspace], repeat, before=["make", "-C", workspace, "clean"])
+
+    executable = os.path.join(workspace, f"test_{keyword}")
+    if not os.path.isfile(executable):
+        result["error"] = f"make did not produce test_{keyword}"
+        return result
+
+    # Step 3: Replay the corpus in one batch process, then the stress trace
+    harness_args = ["-F", output_format] if output_format != "text" else []
+    output_dir = os.path.join(workspace, "perf_out")
+    os.makedirs(output_dir, exist_ok=True)
+    result["replay_s"] = time_command([executable, *harness_args, "-o", output_dir, *traces["files"]], repeat)
+    result["replay_rows_per_sec"], result["replay_mb_per_sec"] = rates(result["replay_s"], traces["rows"],
+                                                                       traces["bytes"])
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    if stress:
+        # Written to /dev/null: the stress output would be gigabytes of text
+        result["stress_s"] = time_command([executable, *harness_args, stress["file"]], repeat)
+        result["stress_rows_per_sec"], result["stress_mb_per_sec"] = rates(result["stress_s"], stress["rows"],
+                                                                           stress["bytes"])
+
+    failed = [step for step in ("extract_s", "build_s", "replay_s") if result[step] is None]
+    if stress and result["stress_s"] is None:
+        failed.append("stress_s")
+    if failed:
+        result["error"] = f"failed: {', '.join(failed)}"
+    return result
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    Compare the metrics of a run with the ones of a baseline run.
+    :param threshold: Relative change beyond which a worse metric is a regression.
+    :return: List of comparison rows (name, metric, baseline, current, change, regression);
+             change is the relative change, positive when the metric got better.
+    """
+    base = {entry["name"]: entry for entry in baseline.get("results", [])}
+    rows = []
+    for entry in results:
+        previous = base.get(entry["name"])
+        if not previous:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = previous.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_better else (old - new) / old
+            rows.append({"name": entry["name"], "metric": metric, "baseline": old, "current": new,
+                         "change": change, "regression": change < -threshold})
+    return rows
+
+
+def print_results(results, comparison):
+    """Print the timings of every algorithm and the metrics that changed against the baseline."""
+    width = max([len("algorithm")] + [len(entry["name"]) for entry in results])
+    print(f"\n{'algorithm':<{width}}  {'extract':>8} {'build':>8} {'rows/sec':>12} {'MB/sec':>8} "
+          f"{'stress rows/sec':>16} {'MB/sec':>8}")
+
+    def number(value, width, spec):
+        return f"{'-' if value is None else format(value, spec):>{width}}"
+
+    for entry in results:
+        print(f"{entry['name']:<{width}}  {number(entry['extract_s'], 8, '.3f')} {number(entry['build_s'], 8, '.2f')} "
+              f"{number(entry['replay_rows_per_sec'], 12, ',.0f')} {number(entry['replay_mb_per_sec'], 8, '.1f')} "
+              f"{number(entry['stress_rows_per_sec'], 16, ',.0f')} {number(entry['stress_mb_per_sec'], 8, '.1f')}"
+              + (f"  ({entry['error']})" if entry.get("error") else ""))
+
+    if comparison:
+        print("\nAgainst the baseline:")
+        for row in comparison:
+            print(f"  {row['name']:<{width}} {row['metric']:<20} {row['baseline']:>14.4g} -> {row['current']:<14.4g} "
+                  f"{row['change'] * 100:+7.1f}%{'  REGRESSION' if row['regression'] else ''}")
+
+
+def run_perf(source_folders, input_folder, output_folder, keywords=None, stress_rows=DEFAULT_STRESS_ROWS, repeat=3,
+             output_format="text", baseline_file=None, threshold=0.1):
+    """
+    Benchmark the extraction, build and replay of every labeled algorithm of the source
+    folders and write the results to <output_folder>/perf_results.json.
+    :param input_folder: Folder searched recursively for the replayed traces.
+    :param stress_rows: Rows of the synthetic stress trace (0 leaves it out).
+    :param baseline_file: Optional perf_results.json of an earlier run to compare with.
+    :param threshold: Relative change beyond which a worse metric is reported as a regression.
+    :return: True if every algorithm was benchmarked without a regression.
+    """
+    try:
+        files = find_traces(input_folder)
+        if not files:
+            print(f"Error: no trace in {input_folder}")
+            return False
+        traces = {"files": files, "rows": sum(count_trace_rows(path) for path in files),
+                  "bytes": sum(os.path.getsize(path) for path in files)}
+        os.makedirs(output_folder, exist_ok=True)
+
+        # Step 1: Synthetic stress trace from the largest trace of the corpus, kept for the next runs
+        stress = None
+        if stress_rows:
+            template = max(files, key=os.path.getsize)
+            stress_file = os.path.join(os.path.abspath(output_folder), f"stress_{stress_rows}.csv")
+            if not os.path.isfile(stress_file):
+                print(f"Writing a {stress_rows}-row stress trace from {template}")
+                make_stress_trace(template, stress_file, stress_rows)
+            stress = {"file": stress_file, "rows": stress_rows, "bytes": os.path.getsize(stress_file)}
+
+        # Step 2: Benchmark every (source, keyword) pair, one at a time
+        tasks = []
+        for source_folder in source_folders:
+            framework_dir = find_framework(source_folder)
+            support_dir = os.path.join(framework_dir, "support")
+            for source, keyword in discover_pairs(source_folder, keywords):
+                tasks.append((framework_dir, source, keyword, select_test_file(support_dir, source, keyword),
+                              workspace_path(os.path.join(output_folder, "work"), framework_dir, source, keyword)))
+        print(f"Benchmarking {len(tasks)} algorithms on {len(files)} traces ({traces['rows']} rows)"
+              + (f" and a {stress_rows}-row stress trace" if stress else ""))
+
+        results = []
+        for task in tasks:
+            print(f"Timing {os.path.basename(task[1])} ({task[2]})")
+            results.append(bench_pair(*task, traces, stress, repeat, output_format))
+
+        # Step 3: Compare with the baseline and write the results
+        comparison = []
+        if baseline_file:
+            with open(baseline_file, 'r') as infile:
+                comparison = compare_results(results, json.load(infile), threshold)
+        print_results(results, comparison)
+
+        compiler = subprocess.run(["cc", "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        report = {
+            "version": RESULTS_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": {"machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count(),
+                     "python": platform.python_version(), "compiler": (compiler.stdout.splitlines() or [""])[0]},
+            "format": output_format,
+            "repeat": repeat,
+            "corpus": {"traces": len(files), "rows": traces["rows"], "bytes": traces["bytes"]},
+            "stress": {"rows": stress["rows"], "bytes": stress["bytes"]} if stress else None,
+            "results": results,
+            "baseline": baseline_file,
+            "comparison": comparison,
+        }
+        results_file = os.path.join(output_folder, "perf_results.json")
+        with open(results_file, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        print(f"\nResults written to {results_file}")
+
+        regressions = [row for row in comparison if row["regression"]]
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {threshold * 100:.0f}%")
+        return not regressions and not any(entry.get("error") for entry in results)
+
+    except Exception as e:
+        print(f"Error running the benchmark: {e}")
+        return False
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Time the extraction, build and replay of every labeled algorithm, with a comparison against a baseline.")
+
+    parser.add_argument("-s", "--source_folder", action="append", required=True,
+                        help="Folder of labeled .c sources; repeat for several (e.g., the Linux and FreeBSD ones).")
+    parser.add_argument("-i", "--input_folder", required=True,
+                        help="Folder searched recursively for the traces to replay (e.g., sample_of_input_output).")
+    parser.add_argument("-o", "--output_folder", required=True,
+                        help="The folder receiving the workspaces, the stress trace and perf_results.json.")
+    parser.add_argument("-k", "--keyword", action="append", dest="keywords",
+                        help="Only benchmark this keyword; repeat for several (default: every labeled keyword).")
+    parser.add_argument("-n", "--stress_rows", type=int, default=DEFAULT_STRESS_ROWS,
+                        help=f"Rows of the synthetic stress trace, 0 to leave it out (default: {DEFAULT_STRESS_ROWS}).")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timings per step, the best one is kept (default: 3).")
+    parser.add_argument("-F", "--format", choices=["text", "npy"], default="text",
+                        help="Output format of the harness during the replays (default: text).")
+    parser.add_argument("-b", "--baseline", help="perf_results.json of an earlier run to compare with.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="Relative change beyond which a worse metric is a regression (default: 0.1).")
+
+    args = parser.parse_args()
+
+    if not run_perf(args.source_folder, args.input_folder, args.output_folder, args.keywords, args.stress_rows,
+                    args.repeat, args.format, args.baseline, args.threshold):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import csv
+import glob
+import subprocess
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from ss_extract import scan_source
+
+# Directory of the framework scripts; the framework root is its parent
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Columns of <output_folder>/workspaces.csv
+INDEX_COLUMNS = ["framework", "source", "keyword", "test_file", "workspace", "ready"]
+
+
+def find_framework(source_folder):
+    """
+    Find the framework a folder of labeled sources belongs to: the closest parent
+    holding bin/ss_extract.py and support/, or else the framework of this script.
+    :return: Absolute path of the framework root.
+    """
+    folder = os.path.abspath(source_folder)
+    while True:
+        if os.path.isfile(os.path.join(folder, "bin", "ss_extract.py")) and os.path.isdir(os.path.join(folder, "support")):
+            return folder
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return os.path.dirname(BIN_DIR)
+        folder = parent
+
+
+def discover_pairs(source_folder, keywords=None):
+    """
+    List the (source, keyword) pairs of a folder from the `// <KW>_begin` labels of its .c files.
+    :param keywords: Optional list of keywords to keep (case-insensitive).
+    :return: Sorted list of (source path, lower-case keyword) tuples.
+    """
+    wanted = {keyword.upper() for keyword in keywords} if keywords else None
+    pairs = []
+    for source in sorted(glob.glob(os.path.join(source_folder, "*.c"))):
+        with open(source, 'r') as infile:
+            scan = scan_source(infile.read())
+        for keyword, region in sorted(scan["regions"].items()):
+            if region["module"] and (wanted is None or keyword in wanted):
+                pairs.append((source, keyword.lower()))
+    return pairs
+
+
+def select_test_file(support_dir, source, keyword):
+    """
+    Pick the test file of a (source, keyword) pair, e.g. test_hystart_kern6_13 for
+    tcp_cubic_hystart_kern6_13.c: a support file test_<keyword>_<suffix>.c is used when
+    the source name contains _<suffix>, otherwise test_<keyword>.c.
+    :return: The keyword given to ss_setup.py.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    prefix = f"test_{keyword}_"
+    suffixes = [name[len(prefix) - 1:-2] for name in os.listdir(support_dir)
+                if name.startswith(prefix) and name.endswith(".c")]
+    matches = [suffix for suffix in suffixes if suffix in stem]
+    if matches:
+        return keyword + max(matches, key=len)
+    return keyword
+
+
+def workspace_path(output_folder, framework_dir, source, keyword):
+    """Workspace of a (source, keyword) pair: <output_folder>/<framework>/<source name>/<keyword>."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(os.path.abspath(output_folder), os.path.basename(framework_dir), stem, keyword)
+
+
+def prepare_workspace(framework_dir, source, keyword, test_keyword, workspace):
+    """
+    Extract, set up and compile one (source, keyword) pair into its own workspace.
+    The output of every step is kept in <workspace>/prepare.log.
+    :return: Tuple (ready, error message or None).
+    """
+    try:
+        os.makedirs(workspace, exist_ok=True)
+
+        # Drop the test file of an earlier run, the Makefile compiles every test_<keyword>*.c
+        for stale in glob.glob(os.path.join(workspace, f"test_{keyword}*.c")):
+            if os.path.basename(stale) != f"test_{test_keyword}.c":
+                os.remove(stale)
+
+        bin_dir = os.path.join(framework_dir, "bin")
+        # The generated files name the source relative to the framework, as when ss_extract.py is run by hand
+        source = os.path.relpath(os.path.abspath(source), framework_dir)
+        steps = [
+            ("extract", [sys.executable, os.path.join(bin_dir, "ss_extract.py"), "-f", source, "-k", keyword, "-d", workspace]),
+            ("setup", [sys.executable, os.path.join(bin_dir, "ss_setup.py"), "-k", test_keyword, "-d", workspace]),
+            ("make", ["make", "-C", workspace]),
+        ]
+
+        with open(os.path.join(workspace, "prepare.log"), 'w') as log:
+            for step, command in steps:
+                process = subprocess.run(command, cwd=framework_dir, stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT, text=True)
+                log.write(f"$ {' '.join(command)}\n{process.stdout}\n")
+                # The extractor and setup report their errors on stdout, the compiler on stderr
+                errors = [line for line in process.stdout.splitlines()
+                          if line.startswith("Error") or (step == "make" and "error" in line)]
+                if process.returncode != 0 or errors:
+                    lines = errors or process.stdout.strip().splitlines() or [f"exit status {process.returncode}"]
+                    return False, f"{step} failed: {lines[-1]}"
+
+        if not os.path.isfile(os.path.join(workspace, f"test_{keyword}")):
+            return False, f"make did not produce test_{keyword}"
+        return True, None
+
+    except Exception as e:
+        return False, str(e)
+
+
+def prepare_all(source_folders, output_folder, keywords=None, jobs=1):
+    """
+    Prepare a workspace for every (source, keyword) pair of the source folders, in parallel,
+    and list them in <output_folder>/workspaces.csv.
+    :param source_folders: Folders of labeled sources, e.g. "original cc files with labels".
+    :param keywords: Optional list of keywords to keep.
+    :param jobs: Number of workspaces prepared in parallel (0 uses every CPU).
+    :return: True if every workspace is ready.
+    """
+    try:
+        jobs = jobs or os.cpu_count() or 1
+
+        # Step 1: Discover the pairs and the framework, test file and workspace of each
+        tasks = []
+        for source_folder in source_folders:
+            framework_dir = find_framework(source_folder)
+            support_dir = os.path.join(framework_dir, "support")
+            for source, keyword in discover_pairs(source_folder, keywords):
+                tasks.append((framework_dir, source, keyword, select_test_file(support_dir, source, keyword),
+                              workspace_path(output_folder, framework_dir, source, keyword)))
+
+        workspaces = [task[-1] for task in tasks]
+        if len(set(workspaces)) != len(workspaces):
+            raise ValueError("two sources map to the same workspace")
+        if not tasks:
+            print("No labeled sources found.")
+            return False
+        print(f"Preparing {len(tasks)} workspaces in {output_folder}")
+
+        # Step 2: Prepare them in parallel; each worker only waits on its child processes, so threads are enough
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(lambda task: prepare_workspace(*task), tasks))
+
+        # Step 3: Report and index the workspaces
+        rows = []
+        for (framework_dir, source, keyword, test_keyword, workspace), (ready, error) in zip(tasks, results):
+            if ready:
+                print(f"Ready: {workspace} (test_{keyword}, test_{test_keyword}.c)")
+            else:
+                print(f"Error preparing {workspace}: {error}")
+            rows.append([os.path.basename(framework_dir), os.path.basename(source), keyword,
+                         f"test_{test_keyword}.c", workspace, int(ready)])
+
+        os.makedirs(output_folder, exist_ok=True)
+        index_file = os.path.join(output_folder, "workspaces.csv")
+        with open(index_file, 'w', newline='') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(INDEX_COLUMNS)
+            writer.writerows(rows)
+
+        ready = sum(row[-1] for row in rows)
+        print(f"\nSummary: {ready} ready, {len(rows) - ready} failed (see {index_file})")
+        return ready == len(rows)
+
+    except Exception as e:
+        print(f"Error preparing the workspaces: {e}")
+        return False
+
+
+def main():
+    """Main function to handle command-line argument parsing."""
+    parser = argparse.ArgumentParser(description="Extract, set up and compile every labeled algorithm of one or more source folders, each in its own workspace.")
+
+    parser.add_argument("-i", "--input_folder", action="append", required=True,
+                        help="Folder of labeled .c sources; repeat to prepare several folders (e.g., the Linux and FreeBSD ones).")
+    parser.add_argument("-o", "--output_folder", required=True, help="The folder receiving the workspaces and workspaces.csv.")
+    parser.add_argument("-k", "--keyword", action="append", dest="keywords",
+                        help="Only prepare this keyword; repeat for several (default: every labeled keyword).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of workspaces prepared in parallel (0 = all CPUs, default: 1).")
+
+    args = parser.parse_args()
+
+    if not prepare_all(args.input_folder, args.output_folder, args.keywords, args.jobs):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
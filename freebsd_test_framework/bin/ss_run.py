@@ -1,24 +1,802 @@
 import os
+import re
+import sys
+import json
+import time
+import signal
+import math
+import heapq
+import fnmatch
+import resource
+import threading
+import tempfile
 import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ss_cache import hash_file, cache_key, load_index, save_index, cache_lookup, cache_store, cache_evict
+from ss_convert import convert_cached, count_trace_rows, decompress_command, is_trace_file, trace_stem
+from ss_manifest import MANIFEST_FILE, MANIFEST_REDUCERS, STOPPED_STATUSES, build_manifest, result_status, write_manifest
+from ss_queue import (HEARTBEAT_SECONDS, STALE_SECONDS, init_queue, read_queue, run_queue, queue_progress,
+                      print_progress, worker_name, worker_output)
 
-def run_test(executable, input_file, output_file):
-    """Run the executable with input and redirect output to a file."""
+# Extension of the output files for each output format of the test binary
+OUTPUT_EXTENSIONS = {"text": ".txt", "npy": ".npy"}
+
+# Stop conditions understood by the -S option of the test binary
+STOP_PATTERN = re.compile(r"^(exit(\+\d+)?|loss|now_us=\d+)$")
+
+# Version of the layout of run_report.json
+RUN_REPORT_VERSION = 1
+
+# Runs listed as the slowest ones (lowest rows/sec) in the run report
+REPORT_SLOWEST = 10
+
+# The kernel enforces RLIMIT_CPU on its own accounting, which wait4() may report slightly below
+# the limit; a process killed within this many CPU seconds of its limit has reached it
+CPU_LIMIT_SLACK_S = 0.05
+
+# ru_maxrss is in kilobytes, except on macOS where it is in bytes
+_MAX_RSS_UNIT = 1024 if sys.platform == "darwin" else 1
+
+def lookup_cache(input_file, output_file, cache):
+    """
+    Look a trace up in the result cache and link its stored output on a hit.
+    :return: A (hit, key) tuple; key is None when no cache is used.
+    """
+    if cache is None:
+        return False, None
+    # A text output starts with the path the test binary was given: the trace itself, or its
+    # binary form in the binary cache folder (named after the hash of the trace)
+    input_path = (cache["binary_cache"] or input_file) if cache["text_output"] else None
+    key = cache_key(hash_file(input_file), cache["binary_hash"], cache["args"], input_path)
+    return cache_lookup(cache["dir"], cache["index"], key, output_file), key
+
+def supports_summary(executable):
+    """Whether the test binary prints the summary line of -s (see test_harness.h); older builds do not."""
+    try:
+        usage = subprocess.run([executable, "-s"], stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                               timeout=10).stderr
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return "[-s]" in usage
+
+def open_input(input_file, binary_cache=None):
+    """
+    Give the input of the test binary for a trace. A compressed trace is streamed through
+    its decompressor into the stdin of the test binary, without a temporary file.
+    :param binary_cache: Optional folder of converted traces; the binary trace is replayed instead of the CSV.
+    :return: A (path argument, decompressor process or None) tuple; the stdout of the
+             decompressor is the stdin of the test binary.
+    """
+    if binary_cache:
+        return convert_cached(input_file, binary_cache), None
+    command = decompress_command(input_file)
+    if command is None:
+        return input_file, None
+    return "-", subprocess.Popen(command, stdout=subprocess.PIPE)
+
+def open_limits(wall_s=None, cpu_s=None, memory_mb=None):
+    """
+    Describe the limits of the processes of the test binary, and keep track of the running
+    ones so that a cancelled run (Ctrl-C) can kill them.
+    :param wall_s: Wall clock seconds a trace may take before its process is killed.
+    :param cpu_s: CPU seconds a trace may use (RLIMIT_CPU of its process).
+    :param memory_mb: Address space of a process in MB (RLIMIT_AS).
+    """
+    return {"wall_s": wall_s, "cpu_s": cpu_s, "memory_mb": memory_mb, "lock": threading.Lock(),
+            "running": {}, "cancelled": False}
+
+def _set_rlimits(cpu_s, memory_bytes):
+    """Run in the child before the test binary starts: apply its CPU and address space limits."""
+    if cpu_s:
+        # Past the soft limit the kernel sends SIGXCPU, past the hard one SIGKILL
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_s, cpu_s + 1))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+def start_process(command, limits, run, traces=1, **popen_args):
+    """
+    Start a process of the test binary under the limits of the run (see open_limits).
+    :param run: Dictionary of the process; "limit" is set in it if a limit stops the process, and
+                "cpu_limit_s" to the CPU seconds it may use.
+    :param traces: Number of traces of the process, whose CPU limit is that of one trace times this.
+    :return: The process, or None if the run was cancelled.
+    """
+    if limits is None:
+        return subprocess.Popen(command, **popen_args)
+    cpu_s = math.ceil(limits["cpu_s"] * traces) if limits["cpu_s"] else None
+    memory_bytes = int(limits["memory_mb"] * 1024 * 1024) if limits["memory_mb"] else None
+    preexec = (lambda: _set_rlimits(cpu_s, memory_bytes)) if cpu_s or memory_bytes else None
+    if cpu_s:
+        run["cpu_limit_s"] = cpu_s
+
+    # A process is either started before a cancellation, and killed by it, or not started at all
+    with limits["lock"]:
+        if limits["cancelled"]:
+            run["limit"] = "cancelled"
+            return None
+        process = subprocess.Popen(command, preexec_fn=preexec, **popen_args)
+        limits["running"][process.pid] = {"run": run, "timer": None}
+    restart_watchdog(process, limits)
+    return process
+
+def _kill(pid, limits, reason):
+    """Kill a process of the test binary that is still running, recording why in its run."""
+    with limits["lock"]:
+        entry = limits["running"].get(pid)
+        if entry is not None:
+            entry["run"].setdefault("limit", reason)
+            os.kill(pid, signal.SIGKILL)
+
+def restart_watchdog(process, limits):
+    """
+    (Re)start the wall clock limit of a trace on a process: the process is killed if it has not
+    called restart_watchdog() again, or exited, within the limit. A batch process restarts it
+    after each trace.
+    """
+    if limits is None or not limits["wall_s"]:
+        return
+    timer = threading.Timer(limits["wall_s"], _kill, (process.pid, limits, "wall"))
+    timer.daemon = True
+    with limits["lock"]:
+        entry = limits["running"].get(process.pid)
+        if entry is None:
+            return
+        if entry["timer"] is not None:
+            entry["timer"].cancel()
+        entry["timer"] = timer
+    timer.start()
+
+def cancel_processes(limits):
+    """Cancel a run: no process of the test binary starts anymore and the running ones are killed."""
+    with limits["lock"]:
+        limits["cancelled"] = True
+        pids = list(limits["running"])
+    for pid in pids:
+        _kill(pid, limits, "cancelled")
+
+def limit_message(returncode, run, limits):
+    """
+    Describe a process of the test binary that was stopped by a limit, cancelled or killed by a signal.
+    The message starts with the status of its traces in the summary and the manifest
+    ("timeout", "cancelled" or "crashed", see ss_manifest.result_status).
+    :return: The message, or None if the process exited by itself.
+    """
+    if run.get("limit") == "cancelled" or returncode == -signal.SIGINT:
+        return "cancelled"
+    if run.get("limit") == "wall":
+        return f"timeout: killed after the wall clock limit of {limits['wall_s']:g}s"
+    # SIGXCPU and SIGKILL come from RLIMIT_CPU only if the process used up its CPU time (see
+    # wait_usage); otherwise it was killed by something else, such as the OOM killer
+    if (run.get("cpu_limit_s") and returncode in (-signal.SIGXCPU, -signal.SIGKILL)
+            and run.get("user_s", 0) + run.get("sys_s", 0) >= run["cpu_limit_s"] - CPU_LIMIT_SLACK_S):
+        run["limit"] = "cpu"
+        return f"timeout: killed after the CPU limit of {limits['cpu_s']:g}s"
+    if returncode < 0:
+        return f"crashed: killed by {signal.Signals(-returncode).name}"
+    return None
+
+def wait_usage(process, run=None, limits=None):
+    """
+    Wait for a child process like Popen.wait(), collecting its resource usage with wait4().
+    :param run: Optional dictionary receiving the "user_s" and "sys_s" CPU times and the
+                "max_rss_kb" peak resident set size of the child.
+    :param limits: The limits the process was started under (see start_process); its
+                   watchdog is stopped before it is reaped, so that its pid is never killed
+                   once it may have been reused.
+    :return: Its exit status.
+    """
+    if limits is not None:
+        if hasattr(os, "waitid"):
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        with limits["lock"]:
+            entry = limits["running"].pop(process.pid, None)
+        if entry is not None and entry["timer"] is not None:
+            entry["timer"].cancel()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if run is not None:
+        run.update(user_s=usage.ru_utime, sys_s=usage.ru_stime, max_rss_kb=usage.ru_maxrss // _MAX_RSS_UNIT)
+    return process.returncode
+
+def close_input(decompressor, run=None):
+    """
+    Wait for the decompressor of a trace, if any.
+    :param run: Optional dictionary receiving the CPU time of the decompressor ("decompress_cpu_s").
+    :return: Its exit status, 0 without a decompressor.
+    """
+    if decompressor is None:
+        return 0
+    # Once the test binary is done, a decompressor still writing gets EPIPE and exits
+    decompressor.stdout.close()
+    usage = {}
+    status = wait_usage(decompressor, usage)
+    if run is not None:
+        run["decompress_cpu_s"] = usage["user_s"] + usage["sys_s"]
+    # Killed by SIGPIPE: the test binary stopped reading early (e.g. a stop condition), which
+    # is not an error of the decompressor; a failure of the binary is reported on its own
+    return 0 if status == -signal.SIGPIPE else status
+
+def run_test(executable, input_file, output_file, cache=None, binary_cache=None, harness_args=(), runs=None,
+             limits=None):
+    """
+    Run the executable with input and redirect output to a file.
+    :param cache: Optional result cache description (see open_cache); a hit reuses the stored output.
+    :param binary_cache: Optional folder of converted traces; the binary trace is replayed instead of the CSV.
+    :param harness_args: Extra arguments of the test binary, such as the output format.
+    :param runs: Optional list receiving the resource usage of the process (see wait_usage).
+    :param limits: Optional limits of the process, see open_limits.
+    :return: A (passed, message) tuple describing the outcome for this input.
+    """
     try:
         if not os.path.isfile(input_file):
             print(f"Error: {input_file} does not exist.")
-            return
+            return False, "input file does not exist"
+
+        hit, key = lookup_cache(input_file, output_file, cache)
+        if hit:
+            print(f"Cache hit. Output linked to {output_file}")
+            return True, output_file
+
+        # Never write through a hard link that may point into the cache
+        if os.path.lexists(output_file):
+            os.remove(output_file)
+
+        # Replay the binary form of the trace when a conversion cache is used
+        run_input, decompressor = open_input(input_file, binary_cache)
 
         # Run the executable with the input file and redirect the output
-        with open(output_file, 'w') as out:
-            subprocess.check_call([f"./{executable}", input_file], stdout=out)
+        run = {"inputs": [input_file]}
+        start = time.perf_counter()
+        try:
+            with open(output_file, 'w') as out:
+                process = start_process([os.path.join(".", executable), *harness_args, run_input], limits, run,
+                                        stdout=out, stdin=decompressor.stdout if decompressor else None)
+                returncode = wait_usage(process, run, limits) if process else None
+        finally:
+            status = close_input(decompressor, run)
+        if process is None:
+            return False, "cancelled"
+        run["wall_s"] = time.perf_counter() - start
+        if runs is not None:
+            runs.append(run)
+
+        message = limit_message(returncode, run, limits)
+        if message:
+            print(f"Error during test execution of {input_file}: {message}")
+            return False, message
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, process.args)
+        if status != 0:
+            raise subprocess.CalledProcessError(status, decompressor.args)
         print(f"Test completed. Output written to {output_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during test execution: {e}")
 
-def process_input_files(input_folder, output_folder, keyword):
-    """Process all .csv files in the input folder and generate output .txt files."""
+        if key is not None:
+            cache_store(cache["dir"], cache["index"], key, output_file, input_file, cache["args"])
+        return True, output_file
+    except (subprocess.CalledProcessError, ValueError, OSError) as e:
+        print(f"Error during test execution of {input_file}: {e}")
+        return False, str(e)
+
+def run_reduce(executable, input_file, output_file, reducers, metrics, binary_cache=None, keep_output=False,
+               harness_args=(), runs=None, limits=None):
+    """
+    Run the executable with -F stream and reduce its records while they are produced.
+    Only the metrics are kept, unless keep_output also writes the records to the output file.
+    :param reducers: Names of the reducers to apply (see ss_reduce.REDUCERS).
+    :param metrics: Dictionary receiving the metrics of the trace, keyed by the input file.
+    :param harness_args: Extra arguments of the test binary, such as the stop conditions.
+    :param runs: Optional list receiving the resource usage of the process (see wait_usage).
+    :param limits: Optional limits of the process, see open_limits.
+    :return: A (passed, message) tuple describing the outcome for this input.
+    """
+    # NumPy is only imported to reduce records, so that text runs work without it
+    from ss_reduce import reduce_stream
+
+    try:
+        if not os.path.isfile(input_file):
+            print(f"Error: {input_file} does not exist.")
+            return False, "input file does not exist"
+
+        run_input, decompressor = open_input(input_file, binary_cache)
+        run = {"inputs": [input_file]}
+        start = time.perf_counter()
+        result = error = None
+        try:
+            process = start_process([os.path.join(".", executable), "-F", "stream", *harness_args, run_input], limits,
+                                    run, stdout=subprocess.PIPE, stdin=decompressor.stdout if decompressor else None)
+            if process is None:
+                return False, "cancelled"
+            try:
+                result = reduce_stream(process.stdout, reducers, output_file if keep_output else None)
+            except (ValueError, OSError) as e:
+                # Do not leave the binary blocked on a pipe nobody reads anymore; os.kill() rather
+                # than Popen.kill(), which may reap the process before wait_usage() does
+                os.kill(process.pid, signal.SIGKILL)
+                error = e
+            finally:
+                process.stdout.close()
+                returncode = wait_usage(process, run, limits)
+        finally:
+            status = close_input(decompressor, run)
+            run["wall_s"] = time.perf_counter() - start
+            # A failed reduction is still accounted for, once the binary ran
+            if runs is not None and "user_s" in run:
+                runs.append(run)
+
+        # A binary killed here after a failed reduction reports that failure; one killed by
+        # a limit or a signal leaves a truncated stream, reported as what killed it
+        if error is not None and returncode == -signal.SIGKILL and "limit" not in run:
+            raise error
+        message = limit_message(returncode, run, limits)
+        if message:
+            print(f"Error during test execution of {input_file}: {message}")
+            return False, message
+        if error is not None:
+            raise error
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, executable)
+        if status != 0:
+            raise subprocess.CalledProcessError(status, decompressor.args)
+        metrics[input_file] = result
+        print(f"Test completed. Metrics of {input_file} reduced" + (f", output written to {output_file}" if keep_output else ""))
+        return True, output_file if keep_output else "reduced"
+    except (subprocess.CalledProcessError, ValueError, OSError) as e:
+        print(f"Error during test execution of {input_file}: {e}")
+        return False, str(e)
+
+def run_batch(executable, tasks, cache=None, binary_cache=None, harness_args=(), runs=None, limits=None):
+    """
+    Run several traces in a single process of the executable.
+    The (input, output) pairs are sent as a manifest on stdin and the executable
+    answers with one "ok"/"fail" status line per trace on stdout.
+    :param runs: Optional list receiving the resource usage of the process, shared by its traces.
+    :param limits: Optional limits of the process, see open_limits; the wall clock limit restarts
+                   with each trace, and the CPU limit is that of a trace times the traces of the batch.
+    :return: Dictionary mapping each input file to its (passed, message) outcome.
+    """
+    results = {}
+    # Identical traces share their binary conversion, so the pending traces are keyed by input
+    # file and the status lines are matched to them through the inputs of each run input
+    pending = {}
+    inputs_of = {}
+    for input_file, output_file in tasks:
+        try:
+            # A compressed trace goes through the stdin of its own process
+            if not binary_cache and decompress_command(input_file):
+                results[input_file] = run_test(executable, input_file, output_file, cache, None, harness_args, runs,
+                                               limits)
+                continue
+
+            if not os.path.isfile(input_file):
+                print(f"Error: {input_file} does not exist.")
+                results[input_file] = (False, "input file does not exist")
+                continue
+
+            hit, key = lookup_cache(input_file, output_file, cache)
+            if hit:
+                print(f"Cache hit. Output linked to {output_file}")
+                results[input_file] = (True, output_file)
+                continue
+
+            # Never write through a hard link that may point into the cache
+            if os.path.lexists(output_file):
+                os.remove(output_file)
+            run_input = convert_cached(input_file, binary_cache) if binary_cache else input_file
+            pending[input_file] = (run_input, output_file, key)
+            inputs_of.setdefault(run_input, []).append(input_file)
+        except (ValueError, OSError) as e:
+            print(f"Error preparing {input_file}: {e}")
+            results[input_file] = (False, str(e))
+
+    if not pending:
+        return results
+
+    manifest = "".join(f"{run_input}\t{output_file}\n" for run_input, output_file, _ in pending.values())
+    run = {"inputs": list(pending)}
+    returncode, lines, stopped = None, [], None
     try:
+        # The manifest is read from a file, so that the process is waited for with wait4() for its usage
+        with tempfile.TemporaryFile('w+') as manifest_file:
+            manifest_file.write(manifest)
+            manifest_file.seek(0)
+            start = time.perf_counter()
+            process = start_process([os.path.join(".", executable), *harness_args, "-m", "-"], limits, run,
+                                    traces=len(pending), stdin=manifest_file, stdout=subprocess.PIPE, text=True)
+            if process is not None:
+                with process.stdout:
+                    # Each status line ends a trace, and starts the wall clock limit of the next one
+                    for line in process.stdout:
+                        lines.append(line)
+                        restart_watchdog(process, limits)
+                returncode = wait_usage(process, run, limits)
+                stopped = limit_message(returncode, run, limits)
+                run["wall_s"] = time.perf_counter() - start
+                if runs is not None:
+                    runs.append(run)
+            else:
+                stopped = "cancelled"
+    except OSError as e:
+        print(f"Error during batch execution: {e}")
+
+    for line in "".join(lines).splitlines():
+        status, run_input, *reason = line.split("\t")
+        if not inputs_of.get(run_input):
+            continue
+        input_file = inputs_of[run_input].pop(0)
+        _, output_file, key = pending.pop(input_file)
+        if status == "ok":
+            print(f"Test completed. Output written to {output_file}")
+            if key is not None:
+                cache_store(cache["dir"], cache["index"], key, output_file, input_file, cache["args"])
+            results[input_file] = (True, output_file)
+        else:
+            message = reason[0] if reason else "test failed"
+            print(f"Error during test execution of {input_file}: {message}")
+            results[input_file] = (False, message)
+
+    # Traces without a status line were never reached, e.g. after a crash of the batch process;
+    # the first of them was running when a limit, a cancellation or a signal stopped the process
+    running = next(iter(pending)) if pending else None
+    for input_file in pending:
+        if stopped and (input_file == running or stopped == "cancelled"):
+            message = stopped
+        elif stopped:
+            message = f"not run, the batch process was stopped on {running} ({stopped.split(':')[0]})"
+        else:
+            message = f"batch process exited with status {returncode} before this trace"
+        print(f"Error during test execution of {input_file}: {message}")
+        results[input_file] = (False, message)
+
+    return results
+
+def _matches_any(relative_path, patterns):
+    """True if a glob pattern matches the path relative to the input folder, or its last component."""
+    name = relative_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def scan_traces(input_folder, recursive=False, include=None, exclude=None, skip=()):
+    """
+    List the traces of the input folder, and of its subfolders when recursive, with os.scandir
+    so that the size of each trace comes with the listing.
+    :param include: Optional glob patterns; only the traces matching one of them are kept.
+    :param exclude: Optional glob patterns; the traces and subfolders matching one of them are skipped.
+    The patterns are matched against the path relative to the input folder ("4g/cubic_all_off/*.csv")
+    and against the file or folder name ("*viasat*").
+    :param skip: Folders never walked, such as an output folder inside the input folder.
+    :return: List of (input file, path relative to the input folder, size) tuples.
+    """
+    traces = []
+    folders = [(input_folder, "")]
+    visited = {(status.st_dev, status.st_ino) for status in map(os.stat, skip)}
+    while folders:
+        folder, relative_folder = folders.pop()
+        # A symbolic link back up the tree is only walked once
+        status = os.stat(folder)
+        identity = (status.st_dev, status.st_ino)
+        if identity in visited:
+            continue
+        visited.add(identity)
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                relative_path = f"{relative_folder}{entry.name}"
+                if exclude and _matches_any(relative_path, exclude):
+                    continue
+                if entry.is_dir():
+                    if recursive:
+                        folders.append((entry.path, f"{relative_path}/"))
+                elif is_trace_file(entry.name) and (not include or _matches_any(relative_path, include)):
+                    traces.append((entry.path, relative_path, entry.stat().st_size))
+    return traces
+
+def collect_input_files(input_folder, output_folder, output_extension=".txt", recursive=False, include=None, exclude=None):
+    """
+    Collect the (input, output) pairs for every .csv file in the input folder,
+    including the compressed .csv.gz, .csv.xz and .csv.zst traces.
+    The list is sorted largest-first so the longest traces start as early as
+    possible and do not end up as stragglers at the end of a parallel run.
+    :param recursive: Also collect the traces of the subfolders; the outputs then mirror the
+                      folders of the input (<input>/4g/a.csv gives <output>/4g/a.txt), and the
+                      folders of the output are created.
+    :param include: Optional glob patterns of the traces to keep (see scan_traces).
+    :param exclude: Optional glob patterns of the traces and subfolders to skip (see scan_traces).
+    """
+    tasks = []
+    skip = [output_folder] if recursive and os.path.isdir(output_folder) else []
+    for input_file, relative_path, size in scan_traces(input_folder, recursive, include, exclude, skip):
+        relative_folder = os.path.dirname(relative_path)
+        output_file = os.path.join(output_folder, relative_folder, f"{trace_stem(input_file)}{output_extension}")
+        tasks.append((size, input_file, output_file))
+
+    for folder in sorted({os.path.dirname(output_file) for _, _, output_file in tasks}):
+        os.makedirs(folder, exist_ok=True)
+
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    return [(input_file, output_file) for _, input_file, output_file in tasks]
+
+def make_batches(tasks, batch_size):
+    """
+    Split the largest-first task list into batches of at most batch_size traces.
+    Each trace goes to the batch with the fewest bytes so far, so batches carry
+    similar amounts of work; the batches are returned largest first.
+    """
+    count = -(-len(tasks) // batch_size)
+    batches = [[] for _ in range(count)]
+    sizes = [0] * count
+    heap = [(0, i) for i in range(count)]
+
+    for task in tasks:
+        size, i = heapq.heappop(heap)
+        batches[i].append(task)
+        sizes[i] = size + os.path.getsize(task[0])
+        if len(batches[i]) < batch_size:
+            heapq.heappush(heap, (sizes[i], i))
+
+    return [batch for _, batch in sorted(zip(sizes, batches), key=lambda item: item[0], reverse=True)]
+
+def print_summary(results):
+    """
+    Print the final pass/fail summary of a run. The traces that timed out, crashed or were
+    cancelled are counted apart from the other failures, when there are any.
+    """
+    failed = [(result_status(passed, message), input_file, message)
+              for input_file, (passed, message) in results.items() if not passed]
+    counts = {status: sum(failure[0] == status for failure in failed) for status in ["failed"] + STOPPED_STATUSES}
+    stopped = "".join(f", {counts[status]} {status}" for status in STOPPED_STATUSES if counts[status])
+
+    print(f"\nSummary: {len(results) - len(failed)} passed, {counts['failed']} failed{stopped}, {len(results)} total.")
+    for status, input_file, message in sorted(failed, key=lambda failure: failure[1]):
+        print(f"  {status.upper()} {input_file}: {message}")
+
+def _percentile(values, fraction):
+    """Value at a fraction (0 to 1) of the sorted values, or None without values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def build_run_report(runs, results, elapsed):
+    """
+    Build the run report of a run: the cost of every process of the test binary and the
+    aggregates of the corpus, to spot pathological traces and regressions in harness speed.
+    The rows of a process are the input rows of its traces (read once more to count them),
+    so the rows/sec of traces ended early by a stop condition count the rows they skipped.
+    The throughput (rows/sec, slowest runs) only covers the processes whose traces all passed:
+    one killed by a limit or a signal, or failed, did not replay all its rows.
+    :param runs: Resource usage of the processes (see wait_usage), one per trace unless batched.
+    :param results: Dictionary mapping each input file to its (passed, message) outcome.
+    :param elapsed: Wall-clock time of the whole run in seconds.
+    :return: Dictionary with the "runs", their "totals" and the "slowest" runs.
+    """
+    entries = []
+    for run in sorted(runs, key=lambda run: run["inputs"]):
+        try:
+            rows = sum(count_trace_rows(input_file) for input_file in run["inputs"])
+        except (ValueError, OSError):
+            rows = None
+        cpu = run["user_s"] + run["sys_s"]
+        passed = all(results.get(input_file, (False, None))[0] for input_file in run["inputs"])
+        entry = {
+            "inputs": run["inputs"],
+            "passed": passed,
+            "rows": rows,
+            "wall_s": run["wall_s"],
+            "user_s": run["user_s"],
+            "sys_s": run["sys_s"],
+            "cpu_s": cpu,
+            "max_rss_kb": run["max_rss_kb"],
+            "rows_per_sec": rows / run["wall_s"] if passed and rows is not None and run["wall_s"] > 0 else None,
+        }
+        if "decompress_cpu_s" in run:
+            entry["decompress_cpu_s"] = run["decompress_cpu_s"]
+        if "limit" in run:
+            # The process was killed by the wall clock or CPU limit, or by a cancellation
+            entry["limit"] = run["limit"]
+        entries.append(entry)
+
+    run_inputs = {input_file for entry in entries for input_file in entry["inputs"]}
+    walls = [entry["wall_s"] for entry in entries]
+    rates = [entry["rows_per_sec"] for entry in entries if entry["rows_per_sec"] is not None]
+    completed = [entry for entry in entries if entry["passed"]]
+    rows = sum(entry["rows"] or 0 for entry in completed)
+    wall = sum(walls)
+    completed_wall = sum(entry["wall_s"] for entry in completed)
+    totals = {
+        "traces": len(results),
+        "runs": len(entries),
+        "failed_runs": len(entries) - len(completed),
+        "failed": sum(1 for passed, _ in results.values() if not passed),
+        "cached": sum(1 for input_file, (passed, _) in results.items() if passed and input_file not in run_inputs),
+        "rows": rows,
+        "elapsed_s": elapsed,
+        "wall_s": wall,
+        "user_s": sum(entry["user_s"] for entry in entries),
+        "sys_s": sum(entry["sys_s"] for entry in entries),
+        "cpu_s": sum(entry["cpu_s"] for entry in entries),
+        "decompress_cpu_s": sum(entry.get("decompress_cpu_s", 0) for entry in entries),
+        "max_rss_kb": max((entry["max_rss_kb"] for entry in entries), default=None),
+        "rows_per_sec": rows / completed_wall if completed_wall > 0 else None,
+        "rows_per_elapsed_sec": rows / elapsed if elapsed > 0 else None,
+        "wall_s_p50": _percentile(walls, 0.5),
+        "wall_s_p95": _percentile(walls, 0.95),
+        "wall_s_max": max(walls, default=None),
+        "rows_per_sec_min": min(rates, default=None),
+        "rows_per_sec_p50": _percentile(rates, 0.5),
+        "max_rss_kb_p50": _percentile([entry["max_rss_kb"] for entry in entries], 0.5),
+    }
+    slowest = sorted((entry for entry in entries if entry["rows_per_sec"] is not None),
+                     key=lambda entry: entry["rows_per_sec"])[:REPORT_SLOWEST]
+    return {"runs": entries, "totals": totals,
+            "slowest": [{key: entry[key] for key in ("inputs", "rows", "wall_s", "rows_per_sec")} for entry in slowest]}
+
+def print_report(report, report_file):
+    """Print the corpus aggregates of a run report."""
+    totals = report["totals"]
+    rate = f"{totals['rows_per_sec']:,.0f} rows/sec" if totals["rows_per_sec"] else "no rows/sec"
+    rss = f"{totals['max_rss_kb'] / 1024:.1f} MB" if totals["max_rss_kb"] is not None else "-"
+    print(f"\nRun report: {totals['runs']} processes, {totals['rows']:,} rows in {totals['wall_s']:.3f} s ({rate}), "
+          f"CPU {totals['user_s']:.3f} s user + {totals['sys_s']:.3f} s sys, peak RSS {rss}")
+    if totals["failed_runs"]:
+        print(f"  {totals['failed_runs']} processes failed or were killed; their rows are left out of the rows/sec")
+    for entry in report["slowest"][:3]:
+        print(f"  slowest: {', '.join(entry['inputs'])}: {entry['rows_per_sec']:,.0f} rows/sec")
+    print(f"Run report written to {report_file}")
+
+def open_cache(cache_dir, executable, harness_args=(), binary_cache=None, text_output=True):
+    """
+    Describe the result cache of a run: its directory, its loaded index, the hash
+    of the test binary and the harness arguments that are part of every key.
+    :param binary_cache: Optional folder of converted traces the binary replays.
+    :param text_output: Whether the outputs are text, which prints the input path, so that
+                        the path is part of the key.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    return {
+        "dir": cache_dir,
+        "index": load_index(cache_dir),
+        "binary_hash": hash_file(executable),
+        "args": list(harness_args) + (["binary-input"] if binary_cache else []),
+        "binary_cache": binary_cache,
+        "text_output": text_output,
+    }
+
+def close_cache(cache, max_size_mb=None, max_age_days=None):
+    """Apply the eviction policy and persist the cache index."""
+    evicted = cache_evict(cache["dir"], cache["index"], max_size_mb, max_age_days)
+    if evicted:
+        print(f"Evicted {evicted} entries from the result cache.")
+    save_index(cache["dir"], cache["index"])
+
+def run_queued(executable, input_file, output_file, binary_cache=None, harness_args=(), runs=None, limits=None):
+    """
+    Run a trace claimed from a queue. The output is written under a name of this worker
+    (see ss_queue.worker_output) and renamed into place once complete.
+    :return: A (passed, message) tuple describing the outcome for this input.
+    """
+    tmp_file = worker_output(output_file, worker_name())
+    passed, message = run_test(executable, input_file, tmp_file, None, binary_cache, harness_args, runs, limits)
+    if passed:
+        os.replace(tmp_file, output_file)
+        return True, output_file
+    if os.path.lexists(tmp_file):
+        os.remove(tmp_file)
+    return False, message
+
+def run_tasks(executable, tasks, jobs=1, batch_size=1, cache=None, binary_cache=None, harness_args=(),
+              reduce=None, runs=None, limits=None):
+    """
+    Run the test binary over (input_file, output_file) tasks, jobs at a time.
+    On Ctrl-C, the processes of the test binary are killed, and their traces and those
+    not started yet are reported as cancelled.
+    :param batch_size: Number of traces replayed by one process of the test binary.
+    :param reduce: Optional streaming reduction of the outputs, a dictionary with the
+                   "reducers", the "metrics" dictionary they fill and "keep_output".
+    :param runs: Optional list receiving the resource usage of every process of the test binary.
+    :param limits: Optional wall clock, CPU and memory limits of the processes, see open_limits.
+    :return: Dictionary mapping each input file to its (passed, message) outcome.
+    """
+    results = {}
+    limits = limits if limits is not None else open_limits()
+
+    # A unit of work is either one trace or a batch of traces for one process
+    if batch_size > 1:
+        units = make_batches(tasks, batch_size)
+    else:
+        units = [[task] for task in tasks]
+
+    def run_unit(unit):
+        if reduce is not None:
+            input_file, output_file = unit[0]
+            return {input_file: run_reduce(executable, input_file, output_file, reduce["reducers"], reduce["metrics"],
+                                           binary_cache, reduce["keep_output"], harness_args, runs, limits)}
+        if batch_size > 1:
+            return run_batch(executable, unit, cache, binary_cache, harness_args, runs, limits)
+        input_file, output_file = unit[0]
+        return {input_file: run_test(executable, input_file, output_file, cache, binary_cache, harness_args, runs,
+                                     limits)}
+
+    try:
+        if jobs == 1:
+            # Run the test for each .csv file
+            for unit in units:
+                results.update(run_unit(unit))
+        else:
+            # Each worker only waits on its child process, so threads are enough
+            pool = ThreadPoolExecutor(max_workers=jobs)
+            futures = []
+            try:
+                futures = [pool.submit(run_unit, unit) for unit in units]
+                for future in as_completed(futures):
+                    results.update(future.result())
+            except KeyboardInterrupt:
+                # Drop the units not started, kill the running processes and collect what they report
+                cancel_processes(limits)
+                pool.shutdown(wait=True, cancel_futures=True)
+                for future in futures:
+                    if not future.cancelled():
+                        results.update(future.result())
+                raise
+            finally:
+                pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        cancel_processes(limits)
+        for input_file, _ in tasks:
+            results.setdefault(input_file, (False, "cancelled"))
+        cancelled = sum(1 for passed, message in results.values() if result_status(passed, message) == "cancelled")
+        print(f"\nInterrupted: {cancelled} traces cancelled.")
+    return results
+
+def process_input_files(input_folder, output_folder, keyword, jobs=1,
+                        cache_dir=None, cache_max_size_mb=None, cache_max_age_days=None, batch_size=1,
+                        binary_cache=None, output_format="text", reducers=None, keep_output=False, stop=None,
+                        report=False, manifest=True, queue_dir=None, heartbeat=HEARTBEAT_SECONDS,
+                        stale_seconds=STALE_SECONDS, recursive=False, include=None, exclude=None, timeout=None,
+                        cpu_timeout=None, memory_mb=None):
+    """
+    Process all .csv files in the input folder and generate output .txt files.
+    :param jobs: Number of test binaries to run concurrently (0 uses every CPU).
+    :param cache_dir: Optional result cache directory; traces whose input, binary and
+                      arguments are unchanged reuse the stored output instead of running.
+    :param cache_max_size_mb: Evict least recently used cache entries beyond this size.
+    :param cache_max_age_days: Evict cache entries unused for longer than this.
+    :param batch_size: Number of traces replayed by one process of the test binary.
+    :param binary_cache: Optional folder where the traces are converted to the binary
+                         format once (keyed by content) and replayed from there.
+    :param output_format: "text" for the readable per-row output (.txt), or "npy" for
+                          one fixed-schema record per row in a NumPy array (.npy).
+    :param reducers: Optional reducer names (see ss_reduce.REDUCERS); the outputs are then
+                     reduced as they stream out of the test binary and only the metrics are
+                     written, to <output_folder>/metrics.csv.
+    :param keep_output: With reducers, also write the records of each trace (.npy).
+    :param stop: Optional stop conditions of the test binary (exit, exit+N, loss, now_us=US);
+                 each trace ends as soon as the first of them is reached.
+    :param report: Write the wall time, CPU time, peak RSS and rows/sec of every process of
+                   the test binary, with their aggregates, to <output_folder>/run_report.json.
+    :param manifest: Write the results of every trace (exit, cwnd at exit, first loss, status,
+                     with the hashes of the trace and the binary) to <output_folder>/manifest.jsonl.
+    :param queue_dir: Optional queue directory shared by several workers (see ss_queue.py): the
+                      traces of the input folder are added to it, and this worker runs the traces
+                      it claims until the queue is done. The output folder is then the one of the
+                      queue, and the report and manifest only cover the traces of this worker
+                      (manifest.<worker>.jsonl, run_report.<worker>.json).
+    :param heartbeat: Seconds between two heartbeats of this worker in the queue.
+    :param stale_seconds: Seconds without heartbeat after which the traces of a worker are reclaimed.
+    :param recursive: Also run the traces of the subfolders of the input folder, with their outputs
+                      in the same subfolders of the output folder; all of them share the jobs.
+    :param include: Optional glob patterns of the traces to run, e.g. "*/cubic_all_off/*".
+    :param exclude: Optional glob patterns of the traces and subfolders to skip, e.g. "viasat".
+    :param timeout: Wall clock seconds after which the process of a trace is killed; the trace
+                    is then reported as timed out instead of blocking its job forever.
+    :param cpu_timeout: CPU seconds of a trace, enforced with RLIMIT_CPU.
+    :param memory_mb: Address space of a process of the test binary in MB, enforced with RLIMIT_AS.
+    :return: Dictionary mapping each input file to its (passed, message) outcome,
+             or None if the run could not be started.
+    """
+    try:
+        # A worker joining a queue without its own output folder writes to the one of the queue
+        if queue_dir and not output_folder:
+            output_folder = read_queue(queue_dir)["output_folder"]
+
         # Ensure the output directory exists
         os.makedirs(output_folder, exist_ok=True)
 
@@ -26,19 +804,106 @@ def process_input_files(input_folder, output_folder, keyword):
         executable = f"test_dir/test_{keyword}"
         if not os.path.isfile(executable):
             print(f"Error: {executable} does not exist. Please compile the object file first.")
-            return
+            return None
+
+        if reducers and (cache_dir or batch_size > 1):
+            print("Error: the streaming reduction runs one trace per process and does not use the result cache.")
+            return None
 
-        # Iterate through all files in the input folder
-        for filename in os.listdir(input_folder):
-            if filename.endswith(".csv"):
-                input_file = os.path.join(input_folder, filename)
-                output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.txt")
+        if queue_dir and (reducers or cache_dir or batch_size > 1):
+            print("Error: a queue runs one trace per process and does not use the result cache or the streaming reduction.")
+            return None
 
-                # Run the test for each .csv file
-                run_test(executable, input_file, output_file)
+        # The streaming reduction sets the output format itself
+        harness_args = ["-F", output_format] if output_format != "text" and not reducers else []
+        harness_args += [arg for condition in stop or [] for arg in ("-S", condition)]
+        # The manifest reads the results of a text output from its summary line, instead of the whole output
+        if manifest and output_format == "text" and not reducers:
+            if supports_summary(executable):
+                harness_args.append("-s")
+            else:
+                print(f"Warning: {executable} has no -s summary line (built before it); "
+                      "the manifest reads the whole outputs, rebuild it or use --no-manifest.")
+        extension = ".npy" if reducers else OUTPUT_EXTENSIONS[output_format]
+        tasks = collect_input_files(input_folder, output_folder, extension, recursive, include, exclude) if input_folder else []
+        if input_folder and not tasks:
+            print(f"Warning: no trace found in {input_folder}.")
+        jobs = jobs or os.cpu_count() or 1
+        cache = open_cache(cache_dir, executable, harness_args, binary_cache,
+                           extension == OUTPUT_EXTENSIONS["text"]) if cache_dir else None
+        # The manifest takes its results from the reduction, so its reducers are always applied
+        reduce = None
+        if reducers:
+            reduce = {"reducers": reducers + [name for name in MANIFEST_REDUCERS if manifest and name not in reducers],
+                      "metrics": {}, "keep_output": keep_output}
+        runs = [] if report else None
+        limits = open_limits(timeout, cpu_timeout, memory_mb)
+
+        start = time.perf_counter()
+        if queue_dir:
+            # Every worker adds the traces of its input folder; the queue skips the ones it already holds
+            settings = {"keyword": keyword, "harness_args": harness_args, "output_folder": os.path.abspath(output_folder)}
+            added = init_queue(queue_dir, tasks, settings)
+            print(f"Added {added} of {len(tasks)} traces to the queue {queue_dir}")
+            # The report and the manifest cover the traces this worker ran
+            tasks = []
+
+            def run_claimed(input_file, output_file):
+                tasks.append((input_file, output_file))
+                return run_queued(executable, input_file, output_file, binary_cache, harness_args, runs, limits)
+
+            results = run_queue(queue_dir, run_claimed, jobs, heartbeat, stale_seconds,
+                                lambda: cancel_processes(limits))
+        else:
+            try:
+                results = run_tasks(executable, tasks, jobs, batch_size, cache, binary_cache, harness_args, reduce, runs,
+                                    limits)
+            finally:
+                if cache is not None:
+                    close_cache(cache, cache_max_size_mb, cache_max_age_days)
+        elapsed = time.perf_counter() - start
+        suffix = f".{worker_name()}" if queue_dir else ""
+
+        if reduce is not None:
+            from ss_reduce import write_metrics
+            metrics_file = os.path.join(output_folder, "metrics.csv")
+            write_metrics(metrics_file, reducers,
+                          [(os.path.relpath(input_file, input_folder) if recursive else os.path.basename(input_file),
+                            results[input_file][0], reduce["metrics"].get(input_file))
+                           for input_file, _ in sorted(tasks)])
+            print(f"Metrics written to {metrics_file}")
+
+        # Arguments the test binary actually got, as recorded in the report and the manifest
+        run_args = (["-F", "stream"] if reducers else []) + harness_args
+
+        if report:
+            report_file = os.path.join(output_folder, f"run_report{suffix}.json")
+            run_report = {"version": RUN_REPORT_VERSION, "executable": executable, "harness_args": run_args,
+                          "jobs": jobs, "batch_size": batch_size,
+                          "limits": {"wall_s": timeout, "cpu_s": cpu_timeout, "memory_mb": memory_mb},
+                          **build_run_report(runs, results, elapsed)}
+            with open(report_file, 'w') as outfile:
+                json.dump(run_report, outfile, indent=2)
+            print_report(run_report, report_file)
+
+        if manifest:
+            manifest_file = os.path.join(output_folder, MANIFEST_FILE.replace(".jsonl", f"{suffix}.jsonl"))
+            # The outputs of a queue are in its own output folder, whichever -o this worker got
+            entries = build_manifest(tasks, results, keyword, executable, run_args,
+                                     read_queue(queue_dir)["output_folder"] if queue_dir else output_folder,
+                                     reduce["metrics"] if reduce else None, jobs)
+            write_manifest(manifest_file, entries)
+            print(f"Manifest of {len(entries)} traces written to {manifest_file}")
+
+        print_summary(results)
+        if queue_dir:
+            print(f"\nQueue {queue_dir}:")
+            print_progress(queue_progress(queue_dir, stale_seconds))
+        return results
 
     except Exception as e:
         print(f"Error processing files: {e}")
+        return None
 
 
 def main():
@@ -47,14 +912,98 @@ def main():
     parser = argparse.ArgumentParser(description="Run tests for all .csv files in the input folder.")
 
     parser.add_argument("-k", "--keyword", required=True, help="The keyword used for the test (e.g., 'SEARCH').")
-    parser.add_argument("-i", "--input_folder", required=True, help="The folder containing the input .csv files.")
-    parser.add_argument("-o", "--output_folder", required=True, help="The folder to save the output .txt files.")
+    parser.add_argument("-i", "--input_folder", help="The folder containing the input .csv files.")
+    parser.add_argument("-o", "--output_folder", help="The folder to save the output .txt files.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of traces to run in parallel, largest first (0 = all CPUs, default: 1).")
+    parser.add_argument("-b", "--batch", type=int, default=1, metavar="N",
+                        help="Replay up to N traces per process of the test binary (default: 1).")
+    parser.add_argument("--cache", dest="cache_dir",
+                        help="Result cache directory; unchanged (input, binary, arguments) runs reuse the stored output.")
+    parser.add_argument("--cache-max-size", type=float, metavar="MB",
+                        help="Evict least recently used cache entries once the cache exceeds this size in MB.")
+    parser.add_argument("--cache-max-age", type=float, metavar="DAYS",
+                        help="Evict cache entries that have not been used for this many days.")
+    parser.add_argument("--binary-cache", metavar="DIR",
+                        help="Convert each trace to the binary format once, keyed by content, and replay it from DIR.")
+    parser.add_argument("-F", "--format", choices=sorted(OUTPUT_EXTENSIONS), default="text",
+                        help="Output of the test binary: readable text (.txt) or one record per row as a NumPy array (.npy).")
+    parser.add_argument("--reduce", nargs="*", metavar="REDUCER",
+                        help="Reduce the records as they stream out of the test binary and only write metrics.csv "
+                             "(reducers: see ss_reduce.py; default: all of them; requires numpy).")
+    parser.add_argument("--keep-output", action="store_true",
+                        help="With --reduce, also write the records of each trace (.npy).")
+    parser.add_argument("--stop", action="append", metavar="CONDITION",
+                        help="End each trace once the condition is reached: exit (slow start exit), exit+N (N rows "
+                             "past the exit), loss (first loss) or now_us=US; repeat for several, the first one wins.")
+    parser.add_argument("--no-manifest", dest="manifest", action="store_false",
+                        help="Do not write manifest.jsonl, the exit, cwnd at exit, first loss and status of every trace.")
+    parser.add_argument("--report", action="store_true",
+                        help="Write run_report.json with the wall time, CPU time, peak RSS and rows/sec of every "
+                             "process of the test binary and their aggregates.")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        help="Kill the test binary once a trace runs for this many seconds (wall clock) and report "
+                             "the trace as timed out.")
+    parser.add_argument("--cpu-timeout", type=float, metavar="SECONDS",
+                        help="Kill the test binary once a trace used this many CPU seconds (RLIMIT_CPU).")
+    parser.add_argument("--memory-limit", type=float, metavar="MB",
+                        help="Limit the address space of each process of the test binary to this many MB (RLIMIT_AS).")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Also run the traces of the subfolders of the input folder, writing their outputs to the "
+                             "same subfolders of the output folder.")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Only run the traces whose path relative to the input folder, or name, matches GLOB "
+                             "(e.g. '*/cubic_all_off/*'); repeat for several.")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip the traces and subfolders whose path relative to the input folder, or name, "
+                             "matches GLOB (e.g. viasat); repeat for several.")
+    parser.add_argument("--queue", metavar="DIR",
+                        help="Work on a queue shared by several workers, on one host or many: add the traces of -i to "
+                             "DIR, then run the traces claimed from it until every trace is done (-i and -o are "
+                             "optional for the workers joining it; see ss_queue.py for the progress).")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_SECONDS, metavar="SECONDS",
+                        help=f"With --queue, seconds between two heartbeats of this worker (default: {HEARTBEAT_SECONDS}).")
+    parser.add_argument("--stale", type=float, default=STALE_SECONDS, metavar="SECONDS",
+                        help="With --queue, reclaim the traces of the workers without heartbeat for this long "
+                             f"(default: {STALE_SECONDS}).")
 
     # Parse arguments
     args = parser.parse_args()
+    if not args.queue and not (args.input_folder and args.output_folder):
+        parser.error("-i and -o are required without --queue")
+    for name in ("timeout", "cpu_timeout", "memory_limit"):
+        if getattr(args, name) is not None and getattr(args, name) <= 0:
+            parser.error(f"--{name.replace('_', '-')} must be positive")
+    if args.queue and args.stale <= args.heartbeat:
+        parser.error("--stale must be longer than --heartbeat")
+    reducers = None
+    if args.reduce is not None:
+        # The reducers need NumPy, which the other runs do without
+        try:
+            from ss_reduce import REDUCERS
+        except ImportError as e:
+            parser.error(f"--reduce needs numpy ({e})")
+        unknown = [name for name in args.reduce if name not in REDUCERS]
+        if unknown:
+            parser.error(f"unknown reducer: {', '.join(unknown)} (choose from {', '.join(REDUCERS)})")
+        reducers = args.reduce or list(REDUCERS)
+    if args.keep_output and reducers is None:
+        parser.error("--keep-output needs --reduce")
+    for condition in args.stop or []:
+        if not STOP_PATTERN.match(condition):
+            parser.error(f"invalid stop condition: {condition} (expected exit, exit+N, loss or now_us=US)")
 
     # Process the input files and generate output files
-    process_input_files(args.input_folder, args.output_folder, args.keyword)
+    results = process_input_files(args.input_folder, args.output_folder, args.keyword, args.jobs,
+                                  args.cache_dir, args.cache_max_size, args.cache_max_age, args.batch,
+                                  args.binary_cache, args.format, reducers, args.keep_output, args.stop,
+                                  args.report, args.manifest, args.queue, args.heartbeat, args.stale,
+                                  args.recursive, args.include, args.exclude, args.timeout, args.cpu_timeout,
+                                  args.memory_limit)
+
+    # Report failure through the exit status so batch scripts can react to it
+    if results is None or not all(passed for passed, _ in results.values()):
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
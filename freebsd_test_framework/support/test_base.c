@@ -20,6 +20,7 @@
 #include <string.h>
 #include "tcp.h"
 #include "cc_helper_function.h"
+#include "test_harness.h"
 // -----------------------------------------------------------------------------
 // ⚠ USER NOTE: 
 // Include the header file for the your module definitions
@@ -28,29 +29,39 @@
 // prototypes used by the congestion control algorithm. 
 // -----------------------------------------------------------------------------
 
-int main(int argc, char *argv[]) {
-    if (argc < 2) {
-        fprintf(stderr, "Usage: %s <input.csv>\n", argv[0]);
-        return 1;
-    }
+// -----------------------------------------------------------------------------
+// ⚠ USER NOTE: 
+// Add the variables that must persist from one CSV line to the next
+// (e.g., flags, previous values) to this structure. `main()` is provided by
+// test_harness.h, which calls trace_open() before each trace, trace_row() for
+// each data line, and trace_close() at the end of the trace.
+// -----------------------------------------------------------------------------
+struct trace_state {
+    struct sock *sk;
+};
 
-    // Open the CSV file
-    FILE *file = fopen(argv[1], "r");
-    if (!file) {
-        perror("Failed to open file");
-        return 1;
-    }
+// -----------------------------------------------------------------------------
+// ⚠ USER NOTE: 
+// List the fields of the record written for each row in the columnar output
+// format (-F npy), in the order trace_row() adds them with trace_record().
+// Use a count above 1 for arrays, e.g. {"bin", SEARCH_TOTAL_BINS}.
+// -----------------------------------------------------------------------------
+static const struct harness_field trace_fields[] = {
+    {"line", 1},
+};
 
+static int trace_open(struct trace_state *st) {
     // Allocate memory for sock structure
     struct sock *sk = malloc(sizeof(struct sock));
     if (!sk) {
         fprintf(stderr, "Failed to allocate memory for sock.\n");
-        fclose(file);
         return 1;
     }
     memset(sk, 0, sizeof(struct sock));  // Initialize struct to zero
+    st->sk = sk;
 
     struct tcp_sock *tp = tcp_sk(sk);
+    (void)tp;
 
     // -----------------------------------------------------------------------------
     // ⚠ USER NOTE: 
@@ -69,52 +80,62 @@ int main(int argc, char *argv[]) {
     // -----------------------------------------------------------------------------
     // ⚠ USER NOTE: Add your reset function below, if applicable.
     // -----------------------------------------------------------------------------
-    
-    char line[256];
-    int line_number = 0;
-
-    printf("Processing CSV input: %s\n\n", argv[1]);
 
-    while (fgets(line, sizeof(line), file)) {
-        line_number++;
+    return 0;
+}
 
-        // Skip the header line or lines that start with '#'
-        if (line_number == 1 || line[0] == '#') {
-            continue;
-        }
+static int trace_row(struct trace_state *st, const struct harness_row *row) {
+    int line_number = row->line_number;
+    struct sock *sk = st->sk;
+    (void)sk;
 
-        // Variables to store parsed values
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Define the variables based on your protocol's input,
-        // parse the CSV value, and set parsed values to the mock structure.
-        // -----------------------------------------------------------------------------
-                    
+    // Variables to store parsed values
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Define the variables based on your protocol's input,
+    // take the parsed values from the row, and set them to the mock structure.
+    // Check first that the row holds the columns you use:
+    //     if (row->columns < 12) {
+    //         fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));
+    //         return HARNESS_CONTINUE;
+    //     }
+    //     u32 now_us = row->v[TRACE_NOW_US];
+    //     u32 rtt_us = row->v[TRACE_RTT_US];
+    // -----------------------------------------------------------------------------
+                
 
-        // Call protocol-specific update functions
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Call the function(s) to start running your protocol.
-        // -----------------------------------------------------------------------------     
+    // Call protocol-specific update functions
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Call the function(s) to start running your protocol.
+    // -----------------------------------------------------------------------------     
 
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Print results and info based on your requirements.
-        // -----------------------------------------------------------------------------
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Print results and info based on your requirements.
+    // Use trace_printf() for the text output and fill the record with the
+    // values listed in trace_fields.
+    // Return HARNESS_STOP instead to end the trace early (e.g., once loss happens).
+    // -----------------------------------------------------------------------------
 
+    if (trace_records()) {
+        trace_record(line_number);
+        trace_record_end();
     }
 
+    return HARNESS_CONTINUE;
+}
+
+static void trace_close(struct trace_state *st) {
     // -----------------------------------------------------------------------------
     // ⚠ USER NOTE:
     // Ensure that you clean up memory for congestion control structures
     // (e.g., `bictcp`, `bbr`, etc.) when the socket is being destroyed or closed.
     // Example cleanup for `bictcp`:
-    //     if (sk->bictcp) {
-    //         free(sk->bictcp); // Free memory for `bictcp`
+    //     if (st->sk->bictcp) {
+    //         free(st->sk->bictcp); // Free memory for `bictcp`
     //     }
     // This ensures proper resource management and prevents memory leaks.
     // -----------------------------------------------------------------------------
 
-    free(sk);
-    fclose(file);
-
-    printf("Finished processing.\n");
-    return 0;
+    free(st->sk);
 }
+
+HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)
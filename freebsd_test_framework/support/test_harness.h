@@ -0,0 +1,1417 @@
+/*
+ *****************************************************************************
+ * Test Harness Driver
+ * ----------------------------------------
+ * This file contains the `main()` shared by the `test_<keyword>.c` files.
+ * It opens every input trace, skips the header and the lines starting with '#',
+ * and hands each data row to the callbacks of the test file:
+ *
+ *   open(state)       Allocate the mock structures and reset the CC state.
+ *   row(state, row)   Use the parsed row, run the protocol and print results.
+ *                     Return HARNESS_STOP to end the trace early.
+ *   close(state)      Free what open() allocated.
+ *
+ * An input trace is either a CSV file or a binary trace produced by
+ * `ss_convert.py`, which is mapped in memory and walked record by record so
+ * the CSV text is parsed once instead of once per test run. Both give the same
+ * rows. A CSV file is read in blocks of HARNESS_READ_SIZE bytes and its lines
+ * are scanned in place, whatever their length. The input "-" is a CSV trace read
+ * from stdin, e.g. piped from a decompressor
+ * (`zstd -dc trace.csv.zst | test_<keyword> -`). The columns follow the CSV schema:
+ *   now_us, bytes_acked, mss, rtt_us, tp_deliver_rate, tp_interval, tp_delivered,
+ *   lost_pkt, total_retrans_pkt, app_limited, snd_nxt, sk_pacing_rate[, snd_una]
+ *
+ * Binary trace layout (all integers little-endian):
+ *   header  (64 bytes): char magic[8] = "CCTRACE1", u32 version = 1, u32 header_size = 64,
+ *                       u32 record_size = 112, u32 max_columns = 13, u64 record_count, 32 reserved bytes
+ *   records (112 bytes each): u32 line_number, u32 columns, u64 values[13]
+ *
+ * The test file declares them, with the schema of its output records, with:
+ *   HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)
+ *
+ * A test file may instead read its columns by header name (test files generated
+ * by `ss_setup.py` from a spec do):
+ *   HARNESS_MAIN_COLUMNS(struct trace_state, trace_open, trace_row, trace_close, trace_fields,
+ *                        trace_columns)
+ * where trace_columns is an array of header names: row->v[i] holds the column
+ * trace_columns[i] wherever it is in the header, and the other columns are not
+ * parsed. row->columns counts the bound columns that hold an integer, and a
+ * trace whose header lacks one of them fails. A binary trace and the column
+ * arrays of cc_step() follow the CSV schema, where the names are looked up.
+ *
+ * Output formats (selected with -F):
+ *   text  Default. The row callback prints a readable block per row with trace_printf().
+ *   npy   One fixed-schema record per row, written as a NumPy .npy structured array
+ *         (little-endian int64 fields, see struct harness_field). The row callback
+ *         fills the record with trace_record() and closes it with trace_record_end();
+ *         trace_printf() prints nothing in this format.
+ *   stream  The records of npy, written as they are produced instead of being kept
+ *         until the end of the trace when stdout is a pipe. The .npy header then has
+ *         a record count of 0: a reader of the pipe (e.g. bin/ss_reduce.py) reads the
+ *         records up to the end of the stream, in bounded memory.
+ *
+ * Stop conditions (-S, repeatable; see harness_add_stop()): exit, exit+N, loss and
+ * now_us=US end a trace as soon as the first of them is reached, e.g. once the
+ * algorithm left slow start. They are checked on the record of each row, so they
+ * work in every format; the text output ends with a "Stopped at line N" line.
+ *
+ * Summary (-s): the text output of each trace ends with one line giving its slow
+ * start exit, the cwnd at the exit and its first loss, e.g.
+ *   Summary: exit_us=8028593 exit_cwnd=10 first_loss_us=none
+ * read from the records like the stop conditions (see harness_summary_update()), so
+ * that bin/ss_manifest.py gets them without reading the whole output.
+ *
+ * Usage of the compiled test binary:
+ *   test_<keyword> [options] <input.csv>                     Run one trace and write the output on stdout.
+ *   test_<keyword> [options] -o <dir> <a.csv> [b.csv ...]    Batch mode: write each output to
+ *                                                            <dir>/<name>.txt (or .npy).
+ *   test_<keyword> [options] -m <manifest | ->               Batch mode: run the "<input>\t<output>" pairs
+ *                                                            listed in a manifest file (or on stdin).
+ *
+ * In batch mode the CC state is rebuilt with open() before each trace, and one
+ * status line ("ok\t<input>" or "fail\t<input>\t<reason>") per trace is written
+ * on the original stdout.
+ *
+ * Shared library (`make lib`, compiled with -DHARNESS_LIBRARY): HARNESS_MAIN defines
+ * these entry points instead of main(), so that a program (e.g. bin/ss_lib.py) drives
+ * the callbacks in-process over column arrays, without a CSV file or text output:
+ *   int  cc_api_version(void)                 HARNESS_API_VERSION of the library.
+ *   int  cc_field_count(void)                 Fields of the record, with their name and
+ *   const char *cc_field_name(int i)          number of values; a record is the sum of
+ *   int  cc_field_size(int i)                 the sizes in int64 values.
+ *   void *cc_open(void)                       open() a new state; NULL on failure.
+ *   int  cc_reset(void *h)                    close() and open() the state again.
+ *   long long cc_step(void *h, const unsigned long long *const *columns, int column_count,
+ *                     long long rows, const unsigned int *lines, long long *records,
+ *                     long long *written)
+ *                                             Run the row callback on rows[0..rows) of the
+ *                                             column arrays (in the CSV column order, the
+ *                                             missing columns read as 0). lines holds their
+ *                                             line numbers, or NULL to number them on from
+ *                                             2. The records of the rows go to records (may
+ *                                             be NULL), their number to *written. Returns
+ *                                             the rows consumed, fewer once the callback
+ *                                             returned HARNESS_STOP, or -1 on bad arguments.
+ *   int  cc_state(void *h, long long *record) Copy the record of the last row that wrote
+ *                                             one; -1 if none did yet.
+ *   void cc_close(void *h)                    close() and free the state.
+ * The record buffer is shared by the states of a library, so it is driven by one
+ * thread at a time.
+ *****************************************************************************
+ */
+
+#ifndef TEST_HARNESS_H
+#define TEST_HARNESS_H
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <stdint.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/types.h>
+
+#define HARNESS_CONTINUE 0
+#define HARNESS_STOP     1
+
+/* ssthresh of a flow that has not left slow start yet (TCP_INFINITE_SSTHRESH) */
+#define HARNESS_INFINITE_SSTHRESH 0x7fffffff
+
+/* Bytes of CSV text read at a time; the buffer grows to hold a longer line */
+#ifndef HARNESS_READ_SIZE
+#define HARNESS_READ_SIZE (1 << 20)
+#endif
+
+/* Column positions in a row, following the CSV schema */
+enum harness_column {
+    TRACE_NOW_US,
+    TRACE_BYTES_ACKED,
+    TRACE_MSS,
+    TRACE_RTT_US,
+    TRACE_DELIVERED_RATE,
+    TRACE_RATE_INTERVAL_US,
+    TRACE_DELIVERED,
+    TRACE_LOST,
+    TRACE_RETRANS,
+    TRACE_APP_LIMITED,
+    TRACE_SND_NXT,
+    TRACE_PACING_RATE,
+    TRACE_SND_UNA,
+    TRACE_MAX_COLUMNS
+};
+
+/* Header names of the columns, in the order of enum harness_column */
+static const char *const harness_schema[TRACE_MAX_COLUMNS] = {
+    "now_us", "bytes_acked", "mss", "rtt_us", "tp_deliver_rate", "tp_interval", "tp_delivered",
+    "lost_pkt", "total_retrans_pkt", "app_limited", "snd_nxt", "sk_pacing_rate", "snd_una",
+};
+
+/* One data row of a trace */
+struct harness_row {
+    int line_number;                           // Line of the row in the CSV source
+    int columns;                               // Number of leading columns that parsed as integers,
+                                               // or of bound columns that did (HARNESS_MAIN_COLUMNS)
+    unsigned long long v[TRACE_MAX_COLUMNS];   // Column values, indexed by enum harness_column,
+                                               // or in the order of the bound columns
+    const char *line;                          // CSV text of the row (NULL for binary traces)
+};
+
+/* One field of the record written per row by the columnar output format */
+struct harness_field {
+    const char *name;
+    int count;          // Number of values: 1 for a scalar, N for an array (e.g., the SEARCH bins)
+};
+
+enum harness_format {
+    HARNESS_FORMAT_TEXT,
+    HARNESS_FORMAT_NPY,
+    HARNESS_FORMAT_STREAM,      // .npy records written as they come, even on a pipe
+    HARNESS_FORMAT_LIBRARY      // Records copied to the buffer of the caller of cc_step()
+};
+
+struct harness_ops {
+    size_t state_size;
+    int  (*open)(void *state);
+    int  (*row)(void *state, const struct harness_row *row);
+    void (*close)(void *state);
+    const struct harness_field *fields;
+    int field_count;
+    const char *const *columns;     // Header names of the bound columns, NULL to read them by position
+    int column_count;
+};
+
+#define TRACE_MAGIC        "CCTRACE1"
+#define TRACE_VERSION      1
+#define TRACE_HEADER_SIZE  64
+#define TRACE_RECORD_SIZE  (8 + 8 * TRACE_MAX_COLUMNS)
+
+/* Reader over a CSV file or a memory-mapped binary trace */
+struct harness_reader {
+    int fd;                       // CSV input, -1 for a binary trace
+    char *buffer;                 // CSV text read in blocks; the rows point into it
+    size_t size;                  // Allocated bytes, one more than a block holds for the final NUL
+    size_t start;                 // Offset of the next line in the buffer
+    size_t end;                   // End of the text read so far
+    char saved;                   // Byte replaced by the NUL ending the last line given out
+    int eof;
+    int line_number;
+    const char *input_file;
+    const char *const *names;     // Columns bound by header name, NULL to read them by position
+    int name_count;
+    int *slot_of;                 // CSV: slot in row->v of each header column, -1 when unused
+    int header_columns;           // CSV: header columns up to the last bound one
+    int column_of[TRACE_MAX_COLUMNS];   // Binary: record column of each bound column
+    int error;                    // Set when the header lacks a bound column
+    const unsigned char *map;     // Binary input
+    size_t map_size;
+    uint64_t record_count;
+    uint64_t next_record;
+};
+
+/* Reason of the last trace failure, reported in the batch status line */
+static char harness_error[512];
+
+/* Output format of the run and the record being filled for the current row */
+static enum harness_format harness_format = HARNESS_FORMAT_TEXT;
+static long long *harness_record;
+static int harness_record_width;        // Values per record (sum of the field counts)
+static int harness_record_len;          // Values added to the current record
+static int harness_record_invalid;      // Set when a record did not match the schema
+static unsigned long long harness_record_count;
+static FILE *harness_record_out;
+static off_t harness_record_start;      // Offset of the .npy header in stdout, -1 if not seekable
+static char *harness_record_buffer;     // npy: records of a trace written to a non-seekable stdout
+static size_t harness_record_buffer_size;
+static long long *harness_record_sink;  // Library: next record of the caller's buffer, or NULL
+
+/* Print the text output of a row; prints nothing in the columnar formats */
+#define trace_printf(...) (harness_format == HARNESS_FORMAT_TEXT ? printf(__VA_ARGS__) : 0)
+
+/* Stop conditions of the replay (-S), checked on the record of each row */
+static int harness_stop_active;
+static int harness_stop_exit = -1;          // Offset of the exit field in the record, -1 if unused
+static int harness_stop_exit_ssthresh;      // The exit field is ssthresh rather than an exit flag
+static long long harness_stop_exit_rows;    // Rows replayed past the exit before stopping
+static int harness_stop_loss = -1;          // Offset of the loss field in the record, -1 if unused
+static int harness_stop_until;              // Stop before the first row past harness_stop_until_us
+static unsigned long long harness_stop_until_us;
+static long long harness_rows_past_exit;    // -1 until the exit of the current trace
+
+/* Summary line of the text output (-s), read from the record of each row */
+static int harness_summary;
+static int harness_summary_now = -1;        // Offsets of the fields in the record, -1 if unused
+static int harness_summary_cwnd = -1;
+static int harness_summary_exit = -1;
+static int harness_summary_exit_ssthresh;
+static int harness_summary_loss = -1;
+static long long harness_summary_exit_us;   // -1 until known for the current trace
+static long long harness_summary_exit_cwnd;
+static long long harness_summary_loss_us;
+
+/* Whether the row callback should fill a record with trace_record() */
+static int trace_records(void)
+{
+    return harness_format != HARNESS_FORMAT_TEXT || harness_stop_active || harness_summary;
+}
+
+/* Append the next value of the current record, in the order of the fields */
+static void trace_record(long long value)
+{
+    if (harness_record_len < harness_record_width) {
+        harness_record[harness_record_len] = value;
+    }
+    harness_record_len++;
+}
+
+/* Write the current record once all of its values were added */
+static void trace_record_end(void)
+{
+    if (harness_record_len != harness_record_width) {
+        if (!harness_record_invalid) {
+            fprintf(stderr, "Record has %d values but the schema defines %d\n",
+                    harness_record_len, harness_record_width);
+        }
+        harness_record_invalid = 1;
+    } else if (harness_format == HARNESS_FORMAT_LIBRARY) {
+        if (harness_record_sink) {
+            memcpy(harness_record_sink, harness_record, harness_record_width * sizeof(long long));
+            harness_record_sink += harness_record_width;
+        }
+        harness_record_count++;
+    } else {
+        // Text: the record is only read by the stop conditions
+        if (harness_format != HARNESS_FORMAT_TEXT) {
+            fwrite(harness_record, sizeof(long long), harness_record_width, harness_record_out);
+        }
+        harness_record_count++;
+    }
+    harness_record_len = 0;
+}
+
+static uint64_t harness_le64(const unsigned char *p)
+{
+    uint64_t v = 0;
+    for (int i = 7; i >= 0; i--) {
+        v = (v << 8) | p[i];
+    }
+    return v;
+}
+
+static uint32_t harness_le32(const unsigned char *p)
+{
+    return (uint32_t)p[0] | (uint32_t)p[1] << 8 | (uint32_t)p[2] << 16 | (uint32_t)p[3] << 24;
+}
+
+/* Open a CSV file or a binary trace, recognized by its magic bytes */
+static int harness_reader_open(struct harness_reader *reader, const char *input_file)
+{
+    memset(reader, 0, sizeof(*reader));
+    reader->fd = -1;
+    reader->input_file = input_file;
+
+    // "-" reads a CSV trace from stdin, e.g. from a decompressor
+    int fd = strcmp(input_file, "-") == 0 ? dup(STDIN_FILENO) : open(input_file, O_RDONLY);
+    if (fd < 0) {
+        return -1;
+    }
+
+    struct stat st;
+    char magic[8] = {0};
+    if (fstat(fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size >= TRACE_HEADER_SIZE &&
+        pread(fd, magic, sizeof(magic), 0) == (ssize_t)sizeof(magic) &&
+        memcmp(magic, TRACE_MAGIC, sizeof(magic)) == 0) {
+        void *map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        close(fd);
+        if (map == MAP_FAILED) {
+            return -1;
+        }
+        reader->map = map;
+        reader->map_size = st.st_size;
+        reader->record_count = harness_le64(reader->map + 24);
+
+        // Reject traces written with another layout or truncated on disk
+        if (harness_le32(reader->map + 8) != TRACE_VERSION ||
+            harness_le32(reader->map + 12) != TRACE_HEADER_SIZE ||
+            harness_le32(reader->map + 16) != TRACE_RECORD_SIZE ||
+            harness_le32(reader->map + 20) != TRACE_MAX_COLUMNS ||
+            reader->record_count > (reader->map_size - TRACE_HEADER_SIZE) / TRACE_RECORD_SIZE) {
+            fprintf(stderr, "%s: unsupported binary trace layout or truncated file\n", input_file);
+            munmap(map, st.st_size);
+            errno = EINVAL;
+            return -1;
+        }
+#ifdef MADV_SEQUENTIAL
+        madvise(map, st.st_size, MADV_SEQUENTIAL);
+#endif
+        return 0;
+    }
+
+    reader->fd = fd;
+    reader->size = HARNESS_READ_SIZE + 1;
+    reader->buffer = malloc(reader->size);
+    if (!reader->buffer) {
+        close(fd);
+        return -1;
+    }
+#ifdef POSIX_FADV_SEQUENTIAL
+    posix_fadvise(fd, 0, 0, POSIX_FADV_SEQUENTIAL);
+#endif
+    return 0;
+}
+
+static int harness_is_space(char c)
+{
+    return c == ' ' || (c >= '\t' && c <= '\r');
+}
+
+/*
+ * Parse an integer at *cursor and move the cursor past it, as sscanf("%llu") did:
+ * leading spaces are skipped, a value may have a sign (a negative one wraps around)
+ * and one past ULLONG_MAX saturates. Returns 0, leaving the cursor, if there is none.
+ */
+static int harness_parse_value(const char **cursor, unsigned long long *value)
+{
+    const char *p = *cursor;
+    while (harness_is_space(*p)) {
+        p++;
+    }
+
+    int negative = *p == '-';
+    if (*p == '-' || *p == '+') {
+        p++;
+    }
+    if (*p < '0' || *p > '9') {
+        return 0;
+    }
+
+    unsigned long long result = 0;
+    int overflow = 0;
+    do {
+        unsigned int digit = (unsigned int)(*p++ - '0');
+        if (result > (~0ULL - digit) / 10) {
+            overflow = 1;
+        }
+        result = result * 10 + digit;
+    } while (*p >= '0' && *p <= '9');
+
+    *value = overflow ? ~0ULL : (negative ? 0 - result : result);
+    *cursor = p;
+    return 1;
+}
+
+/*
+ * Parse the leading integer columns of a CSV line, as sscanf() with a "%llu," format
+ * per column did: spaces are allowed before a value, but its comma must follow it.
+ * Parsing stops at the first column that is not an integer or not ended by a comma.
+ */
+static int harness_parse_line(const char *line, unsigned long long *v)
+{
+    const char *p = line;
+    int columns = 0;
+
+    while (columns < TRACE_MAX_COLUMNS && harness_parse_value(&p, &v[columns])) {
+        columns++;
+        if (*p != ',') {
+            break;
+        }
+        p++;
+    }
+    return columns;
+}
+
+/*
+ * Parse the bound columns of a CSV line into their slots; the other columns are
+ * skipped without being parsed. A bound column counts when it holds one integer
+ * directly followed by its comma (or by the end of the line). Returns the number
+ * of bound columns that parsed.
+ */
+static int harness_parse_bound(const struct harness_reader *reader, const char *line, unsigned long long *v)
+{
+    const char *p = line;
+    int parsed = 0;
+
+    for (int c = 0; c < reader->header_columns; c++) {
+        int slot = reader->slot_of[c];
+        if (slot >= 0 && harness_parse_value(&p, &v[slot])) {
+            // The comma follows the value, unless it is the last column of the line
+            const char *end = p;
+            while (harness_is_space(*end)) {
+                end++;
+            }
+            parsed += *p == ',' || *end == '\0';
+        }
+
+        // Skip the rest of the column
+        while (*p != ',' && *p != '\0') {
+            p++;
+        }
+        if (*p != ',') {
+            break;
+        }
+        p++;
+    }
+    return parsed;
+}
+
+/* Position of a column in the CSV schema (enum harness_column), or -1 */
+static int harness_schema_index(const char *name)
+{
+    for (int i = 0; i < TRACE_MAX_COLUMNS; i++) {
+        if (strcmp(harness_schema[i], name) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+/* Find the bound columns in the header line of a CSV input; -1 if one is missing */
+static int harness_bind_header(struct harness_reader *reader, const char *header)
+{
+    int found[TRACE_MAX_COLUMNS] = {0};
+    int allocated = 0;
+    const char *p = header;
+
+    for (int c = 0; *p != '\0'; c++) {
+        while (*p == ' ' || *p == '\t') {
+            p++;
+        }
+        const char *name = p;
+        while (*p != ',' && *p != '\0') {
+            p++;
+        }
+        const char *end = p;
+        while (end > name && harness_is_space(end[-1])) {
+            end--;
+        }
+
+        if (c >= allocated) {
+            allocated = allocated ? allocated * 2 : 32;
+            int *slot_of = realloc(reader->slot_of, allocated * sizeof(int));
+            if (!slot_of) {
+                snprintf(harness_error, sizeof(harness_error), "out of memory reading the header");
+                return -1;
+            }
+            reader->slot_of = slot_of;
+        }
+        reader->slot_of[c] = -1;
+        for (int i = 0; i < reader->name_count; i++) {
+            if (!found[i] && strlen(reader->names[i]) == (size_t)(end - name) &&
+                strncmp(reader->names[i], name, end - name) == 0) {
+                reader->slot_of[c] = i;
+                reader->header_columns = c + 1;
+                found[i] = 1;
+                break;
+            }
+        }
+
+        if (*p == ',') {
+            p++;
+        }
+    }
+
+    for (int i = 0; i < reader->name_count; i++) {
+        if (!found[i]) {
+            snprintf(harness_error, sizeof(harness_error), "no column %s in the header", reader->names[i]);
+            fprintf(stderr, "%s: %s\n", reader->input_file, harness_error);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/*
+ * Read the given columns by header name instead of by position: the value of
+ * names[i] goes to row->v[i]. A binary trace follows the CSV schema, so its
+ * columns are found there. Returns -1 if a name is not in the schema of a binary trace.
+ */
+static int harness_reader_bind(struct harness_reader *reader, const char *const *names, int count)
+{
+    if (count > TRACE_MAX_COLUMNS) {
+        snprintf(harness_error, sizeof(harness_error), "more than %d bound columns", TRACE_MAX_COLUMNS);
+        return -1;
+    }
+    reader->names = names;
+    reader->name_count = count;
+
+    for (int i = 0; reader->map && i < count; i++) {
+        reader->column_of[i] = harness_schema_index(names[i]);
+        if (reader->column_of[i] < 0) {
+            snprintf(harness_error, sizeof(harness_error), "no column %s in a binary trace", names[i]);
+            fprintf(stderr, "%s: %s\n", reader->input_file, harness_error);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/*
+ * Find the next line of a CSV input in the buffer, reading more text as needed, and
+ * end it with a NUL in place. The line keeps its newline, as fgets() gave it.
+ * Returns NULL at the end of the input.
+ */
+static char *harness_read_line(struct harness_reader *reader)
+{
+    // Give back the byte the previous line was ended with
+    if (reader->saved) {
+        reader->buffer[reader->start] = reader->saved;
+        reader->saved = 0;
+    }
+
+    size_t scanned = reader->start;
+    while (1) {
+        char *newline = memchr(reader->buffer + scanned, '\n', reader->end - scanned);
+        if (newline || (reader->eof && reader->end > reader->start)) {
+            char *line = reader->buffer + reader->start;
+            reader->start = newline ? (size_t)(newline - reader->buffer) + 1 : reader->end;
+            reader->saved = reader->buffer[reader->start];
+            reader->buffer[reader->start] = '\0';
+            return line;
+        }
+        if (reader->eof) {
+            return NULL;
+        }
+
+        // Move the partial line to the front, and grow the buffer when it fills it
+        scanned = reader->end - reader->start;
+        memmove(reader->buffer, reader->buffer + reader->start, scanned);
+        reader->start = 0;
+        reader->end = scanned;
+        if (reader->size - 1 - reader->end < HARNESS_READ_SIZE / 2) {
+            char *buffer = realloc(reader->buffer, reader->size * 2);
+            if (!buffer) {
+                perror("Failed to grow the line buffer");
+                reader->eof = 1;
+                return NULL;
+            }
+            reader->buffer = buffer;
+            reader->size *= 2;
+        }
+
+        ssize_t count;
+        do {
+            count = read(reader->fd, reader->buffer + reader->end, reader->size - 1 - reader->end);
+        } while (count < 0 && errno == EINTR);
+        if (count < 0) {
+            perror("Failed to read the input");
+        }
+        if (count <= 0) {
+            reader->eof = 1;
+        } else {
+            reader->end += (size_t)count;
+        }
+    }
+}
+
+/* Fetch the next data row; returns 0 at the end of the trace */
+static int harness_reader_next(struct harness_reader *reader, struct harness_row *row)
+{
+    if (reader->map) {
+        if (reader->next_record >= reader->record_count) {
+            return 0;
+        }
+        const unsigned char *rec = reader->map + TRACE_HEADER_SIZE + reader->next_record++ * TRACE_RECORD_SIZE;
+        row->line_number = (int)harness_le32(rec);
+        row->columns = (int)harness_le32(rec + 4);
+        if (reader->names) {
+            int columns = row->columns;
+            memset(row->v, 0, sizeof(row->v));
+            row->columns = 0;
+            for (int i = 0; i < reader->name_count; i++) {
+                if (reader->column_of[i] < columns) {
+                    row->v[i] = harness_le64(rec + 8 + 8 * reader->column_of[i]);
+                    row->columns++;
+                }
+            }
+        } else {
+            for (int i = 0; i < TRACE_MAX_COLUMNS; i++) {
+                row->v[i] = harness_le64(rec + 8 + 8 * i);
+            }
+        }
+        row->line = NULL;
+        return 1;
+    }
+
+    char *line;
+    while ((line = harness_read_line(reader)) != NULL) {
+        reader->line_number++;
+
+        // Skip the header line, after finding the bound columns in it, or lines that start with '#'
+        if (reader->line_number == 1 && reader->names && harness_bind_header(reader, line) != 0) {
+            reader->error = 1;
+            return 0;
+        }
+        if (reader->line_number == 1 || line[0] == '#') {
+            continue;
+        }
+
+        memset(row->v, 0, sizeof(row->v));
+        row->line_number = reader->line_number;
+        row->columns = reader->names ? harness_parse_bound(reader, line, row->v) : harness_parse_line(line, row->v);
+        row->line = line;
+        return 1;
+    }
+    return 0;
+}
+
+static void harness_reader_close(struct harness_reader *reader)
+{
+    if (reader->map) {
+        munmap((void *)reader->map, reader->map_size);
+    }
+    if (reader->buffer) {
+        free(reader->buffer);
+        close(reader->fd);
+    }
+    free(reader->slot_of);
+}
+
+/* Text of a row for error messages; binary rows are rendered back to CSV */
+static const char *trace_row_text(const struct harness_row *row)
+{
+    static char text[TRACE_MAX_COLUMNS * 21 + 2];
+
+    if (row->line) {
+        return row->line;
+    }
+    int len = 0;
+    for (int i = 0; i < row->columns && i < TRACE_MAX_COLUMNS; i++) {
+        len += snprintf(text + len, sizeof(text) - len, i ? ",%llu" : "%llu", row->v[i]);
+    }
+    snprintf(text + len, sizeof(text) - len, "\n");
+    return text;
+}
+
+/*
+ * Build the .npy header of a trace with the given record count. The header always
+ * has the same length so that it can be rewritten in place once the count is known.
+ */
+static char *harness_npy_header(const struct harness_ops *ops, unsigned long long count, size_t *length)
+{
+    // Records are written in the byte order of the host
+    uint16_t probe = 1;
+    const char *type = *(const unsigned char *)&probe == 1 ? "<i8" : ">i8";
+
+    size_t size = 128;
+    for (int i = 0; i < ops->field_count; i++) {
+        size += strlen(ops->fields[i].name) + 32;
+    }
+    char *header = malloc(size + 64);
+    if (!header) {
+        return NULL;
+    }
+
+    // Preamble: magic, version 1.0, little-endian u16 length of the header text
+    memcpy(header, "\x93NUMPY\x01\x00", 8);
+    size_t len = 10;
+    len += snprintf(header + len, size - len, "{'descr': [");
+    for (int i = 0; i < ops->field_count; i++) {
+        const struct harness_field *field = &ops->fields[i];
+        len += snprintf(header + len, size - len, field->count == 1 ? "%s('%s', '%s')" : "%s('%s', '%s', (%d,))",
+                        i ? ", " : "", field->name, type, field->count);
+    }
+    len += snprintf(header + len, size - len, "], 'fortran_order': False, 'shape': (%llu,), }", count);
+
+    // Pad with spaces up to a 64-byte boundary that leaves room for a 20-digit count
+    size_t count_digits = snprintf(NULL, 0, "%llu", count);
+    size_t total = (len - count_digits + 20 + 1 + 63) / 64 * 64;
+    memset(header + len, ' ', total - len - 1);
+    header[total - 1] = '\n';
+    header[8] = (total - 10) & 0xff;
+    header[9] = (total - 10) >> 8;
+    *length = total;
+    return header;
+}
+
+/* Start the columnar output of a trace on the current stdout */
+static int harness_records_begin(const struct harness_ops *ops)
+{
+    harness_record_len = 0;
+    harness_record_invalid = 0;
+    harness_record_count = 0;
+
+    fflush(stdout);
+    harness_record_start = lseek(STDOUT_FILENO, 0, SEEK_CUR);
+    int flags = fcntl(STDOUT_FILENO, F_GETFL);
+    if (harness_record_start < 0 || flags < 0 || (flags & O_APPEND)) {
+        harness_record_start = -1;
+        if (harness_format == HARNESS_FORMAT_NPY) {
+            // A pipe or a terminal: keep the records until the count is known
+            harness_record_out = open_memstream(&harness_record_buffer, &harness_record_buffer_size);
+            return harness_record_out ? 0 : -1;
+        }
+        // stream: the header keeps a count of 0 and the reader reads the records up to the end
+    }
+
+    size_t length;
+    char *header = harness_npy_header(ops, 0, &length);
+    if (!header) {
+        return -1;
+    }
+    harness_record_out = stdout;
+    fwrite(header, 1, length, stdout);
+    free(header);
+    return 0;
+}
+
+/* Complete the columnar output of a trace with its record count */
+static int harness_records_finish(const struct harness_ops *ops)
+{
+    size_t length;
+    char *header = harness_npy_header(ops, harness_record_count, &length);
+    int rc = header ? 0 : -1;
+
+    if (harness_record_out != stdout) {
+        fclose(harness_record_out);
+        if (header) {
+            fwrite(header, 1, length, stdout);
+            fwrite(harness_record_buffer, 1, harness_record_buffer_size, stdout);
+        }
+        free(harness_record_buffer);
+        harness_record_buffer = NULL;
+    } else if (fflush(stdout) != 0) {
+        rc = -1;
+    } else if (harness_record_start >= 0) {
+        if (header && pwrite(STDOUT_FILENO, header, length, harness_record_start) != (ssize_t)length) {
+            rc = -1;
+        }
+    }
+    free(header);
+    harness_record_out = NULL;
+
+    if (rc != 0) {
+        snprintf(harness_error, sizeof(harness_error), "failed to write the records: %s", strerror(errno));
+    } else if (harness_record_invalid) {
+        snprintf(harness_error, sizeof(harness_error), "records do not match the field schema");
+        rc = -1;
+    }
+    return rc;
+}
+
+/* Allocate the record of a row from the field schema */
+static int harness_alloc_record(const struct harness_ops *ops)
+{
+    if (harness_record) {
+        return 0;
+    }
+    harness_record_width = 0;
+    for (int i = 0; i < ops->field_count; i++) {
+        harness_record_width += ops->fields[i].count;
+    }
+    harness_record = calloc(harness_record_width ? harness_record_width : 1, sizeof(long long));
+    if (!harness_record) {
+        perror("Failed to allocate the record");
+        return -1;
+    }
+    return 0;
+}
+
+/* Offset of a field in the record, or -1 if the schema has no such field */
+static int harness_field_offset(const struct harness_ops *ops, const char *name)
+{
+    int offset = 0;
+    for (int i = 0; i < ops->field_count; i++) {
+        if (strcmp(ops->fields[i].name, name) == 0) {
+            return offset;
+        }
+        offset += ops->fields[i].count;
+    }
+    return -1;
+}
+
+/*
+ * Offset of the field marking the exit from slow start: ssthresh, or else the first exit
+ * flag of the schema (exit_slow_start, hystart_found, full_bw_reached); -1 if none.
+ * *ssthresh tells whether it is ssthresh, set once it leaves HARNESS_INFINITE_SSTHRESH,
+ * rather than a flag raised at the exit.
+ */
+static int harness_exit_field(const struct harness_ops *ops, int *ssthresh)
+{
+    const char *flags[] = {"ssthresh", "exit_slow_start", "hystart_found", "full_bw_reached"};
+    for (size_t i = 0; i < sizeof(flags) / sizeof(flags[0]); i++) {
+        int offset = harness_field_offset(ops, flags[i]);
+        if (offset >= 0) {
+            *ssthresh = i == 0;
+            return offset;
+        }
+    }
+    return -1;
+}
+
+/*
+ * Add a stop condition (-S):
+ *   exit       Stop at the first exit from slow start: the first row whose ssthresh
+ *              is set, or else whose exit flag (exit_slow_start, hystart_found,
+ *              full_bw_reached) is raised.
+ *   exit+N     Stop N rows past that exit.
+ *   loss       Stop at the first row whose loss flag is raised.
+ *   now_us=US  Stop before the first row with now_us above US.
+ * The trace stops at the first condition reached.
+ */
+static int harness_add_stop(const char *spec, const struct harness_ops *ops)
+{
+    char *end;
+    if (strncmp(spec, "now_us=", 7) == 0) {
+        errno = 0;
+        harness_stop_until_us = strtoull(spec + 7, &end, 10);
+        if (end == spec + 7 || *end || errno) {
+            fprintf(stderr, "Invalid stop condition: %s\n", spec);
+            return -1;
+        }
+        harness_stop_until = 1;
+        return 0;
+    }
+
+    if (strcmp(spec, "loss") == 0) {
+        harness_stop_loss = harness_field_offset(ops, "loss");
+        if (harness_stop_loss < 0) {
+            fprintf(stderr, "Stop condition %s needs a loss field in trace_fields\n", spec);
+            return -1;
+        }
+    } else if (strncmp(spec, "exit", 4) == 0) {
+        long long rows = 0;
+        if (spec[4] == '+') {
+            rows = strtoll(spec + 5, &end, 10);
+            if (end == spec + 5 || *end || rows < 0) {
+                fprintf(stderr, "Invalid stop condition: %s\n", spec);
+                return -1;
+            }
+        } else if (spec[4]) {
+            fprintf(stderr, "Invalid stop condition: %s\n", spec);
+            return -1;
+        }
+
+        int first = harness_stop_exit < 0;
+        harness_stop_exit = harness_exit_field(ops, &harness_stop_exit_ssthresh);
+        if (harness_stop_exit < 0) {
+            fprintf(stderr, "Stop condition %s needs a ssthresh or exit flag field in trace_fields\n", spec);
+            return -1;
+        }
+        // With several exit conditions, the earliest one applies
+        if (first || rows < harness_stop_exit_rows) {
+            harness_stop_exit_rows = rows;
+        }
+    } else {
+        fprintf(stderr, "Unknown stop condition: %s (expected exit, exit+N, loss or now_us=US)\n", spec);
+        return -1;
+    }
+
+    harness_stop_active = 1;
+    return harness_alloc_record(ops);
+}
+
+/* Check the stop conditions on the record of the row just replayed; returns the reason to stop or NULL */
+static const char *harness_stop_reached(void)
+{
+    if (harness_stop_loss >= 0 && harness_record[harness_stop_loss] != 0) {
+        return "loss";
+    }
+    if (harness_stop_exit >= 0) {
+        if (harness_rows_past_exit >= 0) {
+            harness_rows_past_exit++;
+        } else if (harness_stop_exit_ssthresh ? harness_record[harness_stop_exit] != HARNESS_INFINITE_SSTHRESH
+                                              : harness_record[harness_stop_exit] != 0) {
+            harness_rows_past_exit = 0;
+        }
+        if (harness_rows_past_exit >= harness_stop_exit_rows) {
+            return "exit";
+        }
+    }
+    return NULL;
+}
+
+/* Enable the summary line of the text output (-s) */
+static int harness_enable_summary(const struct harness_ops *ops)
+{
+    harness_summary = 1;
+    harness_summary_now = harness_field_offset(ops, "now_us");
+    harness_summary_cwnd = harness_field_offset(ops, "cwnd");
+    if (harness_summary_cwnd < 0) {
+        harness_summary_cwnd = harness_field_offset(ops, "snd_cwnd");
+    }
+    harness_summary_exit = harness_exit_field(ops, &harness_summary_exit_ssthresh);
+    harness_summary_loss = harness_field_offset(ops, "loss");
+    return harness_alloc_record(ops);
+}
+
+/*
+ * Fold the record of the row just replayed into the summary: the exit is the first row
+ * whose ssthresh is set (or exit flag raised), the first loss the first row whose loss
+ * flag is raised, as read by the exit and loss reducers of bin/ss_reduce.py.
+ */
+static void harness_summary_update(void)
+{
+    long long now_us = harness_summary_now >= 0 ? harness_record[harness_summary_now] : -1;
+    if (harness_summary_exit >= 0 && harness_summary_exit_us < 0 &&
+        (harness_summary_exit_ssthresh ? harness_record[harness_summary_exit] != HARNESS_INFINITE_SSTHRESH
+                                       : harness_record[harness_summary_exit] != 0)) {
+        harness_summary_exit_us = now_us;
+        harness_summary_exit_cwnd = harness_summary_cwnd >= 0 ? harness_record[harness_summary_cwnd] : -1;
+    }
+    if (harness_summary_loss >= 0 && harness_summary_loss_us < 0 && harness_record[harness_summary_loss] != 0) {
+        harness_summary_loss_us = now_us;
+    }
+}
+
+/* Print a value of the summary line, "none" when unknown */
+static void harness_summary_value(const char *name, long long value)
+{
+    if (value < 0) {
+        trace_printf(" %s=none", name);
+    } else {
+        trace_printf(" %s=%lld", name, value);
+    }
+}
+
+/* Run one trace through the callbacks; output goes to the current stdout */
+static int harness_run_trace(const struct harness_ops *ops, const char *input_file)
+{
+    // Open the CSV file or the binary trace
+    struct harness_reader reader;
+    if (harness_reader_open(&reader, input_file) != 0) {
+        snprintf(harness_error, sizeof(harness_error), "failed to open file: %s", strerror(errno));
+        perror("Failed to open file");
+        return 1;
+    }
+    if (ops->columns && harness_reader_bind(&reader, ops->columns, ops->column_count) != 0) {
+        harness_reader_close(&reader);
+        return 1;
+    }
+
+    // Slot of now_us in the rows, for the now_us= stop condition
+    int now_slot = ops->columns ? -1 : TRACE_NOW_US;
+    for (int i = 0; ops->columns && i < ops->column_count && now_slot < 0; i++) {
+        if (strcmp(ops->columns[i], "now_us") == 0) {
+            now_slot = i;
+        }
+    }
+    if (harness_stop_until && now_slot < 0) {
+        snprintf(harness_error, sizeof(harness_error), "the now_us stop condition needs a now_us column");
+        fprintf(stderr, "%s: %s\n", input_file, harness_error);
+        harness_reader_close(&reader);
+        return 1;
+    }
+
+    void *state = calloc(1, ops->state_size);
+    if (!state || ops->open(state) != 0) {
+        snprintf(harness_error, sizeof(harness_error), "failed to initialize the test state");
+        free(state);
+        harness_reader_close(&reader);
+        return 1;
+    }
+
+    if (harness_format != HARNESS_FORMAT_TEXT && harness_records_begin(ops) != 0) {
+        snprintf(harness_error, sizeof(harness_error), "failed to start the records: %s", strerror(errno));
+        perror("Failed to start the records");
+        ops->close(state);
+        free(state);
+        harness_reader_close(&reader);
+        return 1;
+    }
+
+    struct harness_row row;
+
+    trace_printf("Processing CSV input: %s\n\n", input_file);
+
+    harness_record_len = 0;
+    harness_rows_past_exit = -1;
+    harness_summary_exit_us = harness_summary_exit_cwnd = harness_summary_loss_us = -1;
+    while (harness_reader_next(&reader, &row)) {
+        if (harness_stop_until && row.v[now_slot] > harness_stop_until_us) {
+            trace_printf("Stopped before line %d: now_us is past %llu\n", row.line_number, harness_stop_until_us);
+            break;
+        }
+
+        unsigned long long records = harness_record_count;
+        int rc = ops->row(state, &row);
+
+        // Only a row that completed its record is checked, invalid lines are not
+        int recorded = harness_record_count != records;
+        if (harness_summary && recorded) {
+            harness_summary_update();
+        }
+        if (rc == HARNESS_STOP) {
+            break;
+        }
+        const char *reason = harness_stop_active && recorded ? harness_stop_reached() : NULL;
+        if (reason) {
+            trace_printf("Stopped at line %d: %s\n", row.line_number, reason);
+            break;
+        }
+    }
+
+    ops->close(state);
+    free(state);
+    harness_reader_close(&reader);
+
+    if (harness_summary) {
+        trace_printf("Summary:");
+        harness_summary_value("exit_us", harness_summary_exit_us);
+        harness_summary_value("exit_cwnd", harness_summary_exit_cwnd);
+        harness_summary_value("first_loss_us", harness_summary_loss_us);
+        trace_printf("\n");
+    }
+    trace_printf("Finished processing.\n");
+    if (harness_format != HARNESS_FORMAT_TEXT && harness_records_finish(ops) != 0) {
+        return 1;
+    }
+    return reader.error;
+}
+
+/* Run one trace of a batch with stdout redirected to its output file */
+static int harness_run_batch_entry(const struct harness_ops *ops, const char *input_file,
+                                   const char *output_file, FILE *status)
+{
+    int rc = 1;
+
+    fflush(stdout);
+    int fd = open(output_file, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0) {
+        snprintf(harness_error, sizeof(harness_error), "failed to open output %s: %s",
+                 output_file, strerror(errno));
+    } else {
+        dup2(fd, STDOUT_FILENO);
+        close(fd);
+        rc = harness_run_trace(ops, input_file);
+        fflush(stdout);
+    }
+
+    if (rc == 0) {
+        fprintf(status, "ok\t%s\n", input_file);
+    } else {
+        fprintf(status, "fail\t%s\t%s\n", input_file, harness_error);
+    }
+    fflush(status);
+    return rc;
+}
+
+/* Build <dir>/<basename without extension>.txt (or .npy) for the -o batch mode */
+static void harness_output_name(char *out, size_t size, const char *dir, const char *input_file)
+{
+    const char *base = strrchr(input_file, '/');
+    base = base ? base + 1 : input_file;
+    const char *dot = strrchr(base, '.');
+    int stem_len = dot ? (int)(dot - base) : (int)strlen(base);
+    snprintf(out, size, "%s/%.*s.%s", dir, stem_len, base, harness_format != HARNESS_FORMAT_TEXT ? "npy" : "txt");
+}
+
+/* Select the output format and allocate the record of a row */
+static int harness_set_format(const char *name, const struct harness_ops *ops)
+{
+    if (strcmp(name, "text") == 0) {
+        harness_format = HARNESS_FORMAT_TEXT;
+        return 0;
+    }
+    if (strcmp(name, "npy") == 0) {
+        harness_format = HARNESS_FORMAT_NPY;
+    } else if (strcmp(name, "stream") == 0) {
+        harness_format = HARNESS_FORMAT_STREAM;
+    } else {
+        fprintf(stderr, "Unknown output format: %s (expected text, npy or stream)\n", name);
+        return -1;
+    }
+
+    if (harness_alloc_record(ops) != 0) {
+        return -1;
+    }
+
+    // Records are small; write them through a large stdio buffer
+    static char buffer[1 << 20];
+    setvbuf(stdout, buffer, _IOFBF, sizeof(buffer));
+    return 0;
+}
+
+/* Command line of the test binary; unused in the shared library */
+__attribute__((unused))
+static int harness_main(int argc, char *argv[], const struct harness_ops *ops)
+{
+    const char *program = argv[0];
+    for (;;) {
+        if (argc >= 2 && strcmp(argv[1], "-s") == 0) {
+            if (harness_enable_summary(ops) != 0) {
+                return 1;
+            }
+            argc--;
+            argv++;
+        } else if (argc >= 3 && (strcmp(argv[1], "-F") == 0 || strcmp(argv[1], "-S") == 0)) {
+            if ((argv[1][1] == 'F' ? harness_set_format(argv[2], ops) : harness_add_stop(argv[2], ops)) != 0) {
+                return 1;
+            }
+            argc -= 2;
+            argv += 2;
+        } else {
+            break;
+        }
+    }
+
+    if (argc == 2 && (argv[1][0] != '-' || strcmp(argv[1], "-") == 0)) {
+        return harness_run_trace(ops, argv[1]);
+    }
+
+    int batch_dir = argc >= 4 && strcmp(argv[1], "-o") == 0;
+    int batch_manifest = argc == 3 && strcmp(argv[1], "-m") == 0;
+    if (!batch_dir && !batch_manifest) {
+        fprintf(stderr, "Usage: %s [-F text|npy|stream] [-S stop ...] [-s] <input.csv | ->\n", program);
+        fprintf(stderr, "       %s [-F text|npy|stream] [-S stop ...] [-s] -o <output_dir> <input.csv> [input.csv ...]\n", program);
+        fprintf(stderr, "       %s [-F text|npy|stream] [-S stop ...] [-s] -m <manifest | ->\n", program);
+        return 1;
+    }
+
+    // Keep the original stdout for the status lines before it gets redirected
+    FILE *status = fdopen(dup(STDOUT_FILENO), "w");
+    if (!status) {
+        perror("Failed to open the status stream");
+        return 1;
+    }
+
+    int failures = 0;
+
+    if (batch_dir) {
+        char output_file[4096];
+        for (int i = 3; i < argc; i++) {
+            harness_output_name(output_file, sizeof(output_file), argv[2], argv[i]);
+            failures += harness_run_batch_entry(ops, argv[i], output_file, status);
+        }
+    } else {
+        FILE *manifest = strcmp(argv[2], "-") == 0 ? stdin : fopen(argv[2], "r");
+        if (!manifest) {
+            perror("Failed to open manifest");
+            fclose(status);
+            return 1;
+        }
+
+        char *entry = NULL;
+        size_t entry_size = 0;
+        ssize_t len;
+        while ((len = getline(&entry, &entry_size, manifest)) != -1) {
+            // Each manifest line is "<input>\t<output>"
+            while (len > 0 && (entry[len - 1] == '\n' || entry[len - 1] == '\r')) {
+                entry[--len] = '\0';
+            }
+            char *tab = strchr(entry, '\t');
+            if (len == 0 || entry[0] == '#') {
+                continue;
+            }
+            if (!tab) {
+                fprintf(status, "fail\t%s\tmissing output path in manifest line\n", entry);
+                failures++;
+                continue;
+            }
+            *tab = '\0';
+            failures += harness_run_batch_entry(ops, entry, tab + 1, status);
+        }
+        free(entry);
+        if (manifest != stdin) {
+            fclose(manifest);
+        }
+    }
+
+    fclose(status);
+    return failures ? 1 : 0;
+}
+
+#ifdef HARNESS_LIBRARY
+
+#define HARNESS_API_VERSION 1
+#define HARNESS_EXPORT __attribute__((visibility("default")))
+
+/* State of the library behind the handle of cc_open() */
+struct harness_handle {
+    const struct harness_ops *ops;
+    void *state;
+    long long *last;        // Record of the last row that wrote one
+    int has_last;
+    int next_line;          // Line number of the next row when the caller gives none
+    int stopped;            // Set once the row callback returned HARNESS_STOP
+    int column_of[TRACE_MAX_COLUMNS];   // Input column of each bound column (HARNESS_MAIN_COLUMNS)
+};
+
+static void *harness_library_open(const struct harness_ops *ops)
+{
+    harness_format = HARNESS_FORMAT_LIBRARY;
+    if (harness_alloc_record(ops) != 0) {
+        return NULL;
+    }
+
+    struct harness_handle *h = calloc(1, sizeof(*h));
+    if (!h) {
+        return NULL;
+    }
+    h->ops = ops;
+
+    // The column arrays follow the CSV schema, where the bound columns are found
+    for (int i = 0; i < ops->column_count; i++) {
+        h->column_of[i] = harness_schema_index(ops->columns[i]);
+        if (h->column_of[i] < 0) {
+            fprintf(stderr, "No column %s in the CSV schema\n", ops->columns[i]);
+            free(h);
+            return NULL;
+        }
+    }
+    h->state = calloc(1, ops->state_size);
+    h->last = calloc(harness_record_width ? harness_record_width : 1, sizeof(long long));
+    if (!h->state || !h->last || ops->open(h->state) != 0) {
+        free(h->state);
+        free(h->last);
+        free(h);
+        return NULL;
+    }
+    h->next_line = 2;   // The first data row of a CSV file, after the header
+    return h;
+}
+
+static int harness_library_reset(struct harness_handle *h)
+{
+    if (!h) {
+        return -1;
+    }
+    h->ops->close(h->state);
+    memset(h->state, 0, h->ops->state_size);
+    h->has_last = 0;
+    h->next_line = 2;
+    h->stopped = 0;
+    return h->ops->open(h->state) == 0 ? 0 : -1;
+}
+
+static long long harness_library_step(struct harness_handle *h, const unsigned long long *const *columns,
+                                      int column_count, long long rows, const unsigned int *lines,
+                                      long long *records, long long *written)
+{
+    if (!h || !columns || column_count < 0 || column_count > TRACE_MAX_COLUMNS || rows < 0) {
+        return -1;
+    }
+
+    struct harness_row row;
+    long long done = 0;
+    unsigned long long first_record = harness_record_count;
+    harness_record_sink = records;
+
+    while (done < rows && !h->stopped) {
+        memset(row.v, 0, sizeof(row.v));
+        if (h->ops->columns) {
+            row.columns = 0;
+            for (int i = 0; i < h->ops->column_count; i++) {
+                if (h->column_of[i] < column_count) {
+                    row.v[i] = columns[h->column_of[i]][done];
+                    row.columns++;
+                }
+            }
+        } else {
+            for (int c = 0; c < column_count; c++) {
+                row.v[c] = columns[c][done];
+            }
+            row.columns = column_count;
+        }
+        row.line_number = lines ? (int)lines[done] : h->next_line;
+        row.line = NULL;
+        h->next_line = row.line_number + 1;
+
+        unsigned long long before = harness_record_count;
+        harness_record_len = 0;
+        if (h->ops->row(h->state, &row) == HARNESS_STOP) {
+            h->stopped = 1;
+        }
+        if (harness_record_count != before) {
+            memcpy(h->last, harness_record, harness_record_width * sizeof(long long));
+            h->has_last = 1;
+        }
+        done++;
+    }
+
+    harness_record_sink = NULL;
+    if (written) {
+        *written = (long long)(harness_record_count - first_record);
+    }
+    return done;
+}
+
+static int harness_library_state(struct harness_handle *h, long long *record)
+{
+    if (!h || !record || !h->has_last) {
+        return -1;
+    }
+    memcpy(record, h->last, harness_record_width * sizeof(long long));
+    return 0;
+}
+
+static void harness_library_close(struct harness_handle *h)
+{
+    if (h) {
+        h->ops->close(h->state);
+        free(h->state);
+        free(h->last);
+        free(h);
+    }
+}
+
+/* The exported entry points of the shared library, see the top of this file */
+#define HARNESS_ENTRY_POINTS(ops)                                                              \
+    HARNESS_EXPORT int cc_api_version(void) { return HARNESS_API_VERSION; }                    \
+    HARNESS_EXPORT int cc_field_count(void) { return (ops).field_count; }                      \
+    HARNESS_EXPORT const char *cc_field_name(int i)                                            \
+    {                                                                                          \
+        return i >= 0 && i < (ops).field_count ? (ops).fields[i].name : NULL;                  \
+    }                                                                                          \
+    HARNESS_EXPORT int cc_field_size(int i)                                                    \
+    {                                                                                          \
+        return i >= 0 && i < (ops).field_count ? (ops).fields[i].count : 0;                    \
+    }                                                                                          \
+    HARNESS_EXPORT void *cc_open(void) { return harness_library_open(&(ops)); }                \
+    HARNESS_EXPORT int cc_reset(void *h) { return harness_library_reset(h); }                  \
+    HARNESS_EXPORT long long cc_step(void *h, const unsigned long long *const *columns,        \
+                                     int column_count, long long rows,                         \
+                                     const unsigned int *lines, long long *records,            \
+                                     long long *written)                                       \
+    {                                                                                          \
+        return harness_library_step(h, columns, column_count, rows, lines, records, written); \
+    }                                                                                          \
+    HARNESS_EXPORT int cc_state(void *h, long long *record) { return harness_library_state(h, record); } \
+    HARNESS_EXPORT void cc_close(void *h) { harness_library_close(h); }
+
+#else
+
+#define HARNESS_ENTRY_POINTS(ops)                                                  \
+    int main(int argc, char *argv[])                                               \
+    {                                                                              \
+        return harness_main(argc, argv, &(ops));                                   \
+    }
+
+#endif /* HARNESS_LIBRARY */
+
+/*
+ * Define main() for a test file from its state type, its three callbacks and its record
+ * fields, or the entry points of the shared library when built with -DHARNESS_LIBRARY
+ */
+#define HARNESS_MAIN(state_type, open_fn, row_fn, close_fn, fields)                \
+    HARNESS_DEFINE(state_type, open_fn, row_fn, close_fn, fields, NULL, 0)
+
+/*
+ * The same for a test file that reads its columns by header name: row->v[i] holds the
+ * column named columns[i] (an array of strings), wherever it is in the CSV header
+ */
+#define HARNESS_MAIN_COLUMNS(state_type, open_fn, row_fn, close_fn, fields, columns) \
+    HARNESS_DEFINE(state_type, open_fn, row_fn, close_fn, fields, columns,         \
+                   (int)(sizeof(columns) / sizeof(columns[0])))
+
+#define HARNESS_DEFINE(state_type, open_fn, row_fn, close_fn, fields, columns, column_count) \
+    static int harness_open_cb(void *state)                                        \
+    {                                                                              \
+        return open_fn((state_type *)state);                                       \
+    }                                                                              \
+    static int harness_row_cb(void *state, const struct harness_row *row)          \
+    {                                                                              \
+        return row_fn((state_type *)state, row);                                   \
+    }                                                                              \
+    static void harness_close_cb(void *state)                                      \
+    {                                                                              \
+        close_fn((state_type *)state);                                             \
+    }                                                                              \
+    static const struct harness_ops harness_test_ops = {                           \
+        sizeof(state_type), harness_open_cb, harness_row_cb, harness_close_cb,     \
+        fields, (int)(sizeof(fields) / sizeof(fields[0])), columns, column_count  \
+    };                                                                             \
+    HARNESS_ENTRY_POINTS(harness_test_ops)
+
+#endif /* TEST_HARNESS_H */
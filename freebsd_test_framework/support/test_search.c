@@ -23,31 +23,58 @@
 #include "cc_newreno_search.h"
 #include "cc_helper_function.h"
 
-uint64_t mock_now_us = 0;  // Global definition for use in all modules
-
-int main(int argc, char *argv[]) {
-    if (argc < 2) {
-        fprintf(stderr, "Usage: %s <input.csv>\n", argv[0]);
-        return 1;
-    }
+#include "test_harness.h"
 
-    // Open the CSV file
-    FILE *file = fopen(argv[1], "r");
-    if (!file) {
-        perror("Failed to open file");
-        return 1;
-    }
+uint64_t mock_now_us = 0;  // Global definition for use in all modules
 
+// State of one trace; it is rebuilt by trace_open() before every trace
+struct trace_state {
+    struct newreno *nreno;
+    struct tcpcb *tp;
+    struct cc_var ccv;
+    int EXIT_FLAG;
+    int LOSS_FLAG;
+    int64_t pre_byte_ack;
+};
+
+// Fields of the record written for each row in the columnar output format (-F npy)
+static const struct harness_field trace_fields[] = {
+    {"line", 1},
+    {"now_us", 1},
+    {"bytes_acked", 1},
+    {"mss", 1},
+    {"rtt_us", 1},
+    {"scaled_srtt_us", 1},
+    {"cwnd", 1},
+    {"ssthresh", 1},
+    {"loss", 1},
+    {"exit_slow_start", 1},
+    {"curr_idx", 1},
+    {"bin_duration_us", 1},
+    {"bin_end_us", 1},
+    {"scale_factor", 1},
+    {"bin", SEARCH_TOTAL_BINS},
+};
+
+static int trace_open(struct trace_state *st) {
     // Allocate memory
     struct newreno *nreno = calloc(1, sizeof(struct newreno));
     struct tcpcb *tp = calloc(1, sizeof(struct tcpcb));
-    struct cc_var ccv = {0};
+    if (!nreno || !tp) {
+        fprintf(stderr, "Failed to allocate memory for newreno.\n");
+        free(nreno);
+        free(tp);
+        return 1;
+    }
+    st->nreno = nreno;
+    st->tp = tp;
+    memset(&st->ccv, 0, sizeof(st->ccv));
 
     // Initialize
-    ccv.cc_data = nreno;
-    ccv.ccvc.tcp = tp;
-    int EXIT_FLAG = 0;
-    int LOSS_FLAG = 0;
+    st->ccv.cc_data = nreno;
+    st->ccv.ccvc.tcp = tp;
+    st->EXIT_FLAG = 0;
+    st->LOSS_FLAG = 0;
 
     // -----------------------------------------------------------------------------
     // ⚠ USER NOTE: Add your reset function below, if applicable.
@@ -58,95 +85,115 @@ int main(int argc, char *argv[]) {
     tp->snd_ssthresh = TCP_INFINITE_SSTHRESH;
     tp->snd_cwnd = V_tcp_initcwnd_segments;
 
-    char line[512];
-    int line_number = 0;
+    st->pre_byte_ack = 0;
+    mock_now_us = 0;
 
-    int64_t pre_byte_ack = 0;
+    return 0;
+}
 
-    printf("Processing CSV input: %s\n\n", argv[1]);
+static int trace_row(struct trace_state *st, const struct harness_row *row) {
+    int line_number = row->line_number;
+    struct newreno *nreno = st->nreno;
+    struct tcpcb *tp = st->tp;
 
-    while (fgets(line, sizeof(line), file)) {
-        line_number++;
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Define the variables based on your protocol's input,
+    // parse the CSV value, and set parsed values to the mock structure.
+    // -----------------------------------------------------------------------------
+    // Check that the row holds every column used below
+    if (row->columns < 12) {
+        fprintf(stderr, "Invalid line format at line %d: %s", line_number, trace_row_text(row));
+        return HARNESS_CONTINUE;
+    }
 
-        // Skip the header line or lines that start with '#'
-        if (line_number == 1 || line[0] == '#') {
-            continue;
-        }
+    // Variables to store parsed values
+    int32_t now_us = row->v[TRACE_NOW_US];
+    int64_t bytes_acked = row->v[TRACE_BYTES_ACKED];
+    int32_t mss = row->v[TRACE_MSS];
+    int32_t rtt_us = row->v[TRACE_RTT_US];
+    int32_t lost = row->v[TRACE_LOST];
 
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Define the variables based on your protocol's input,
-        // parse the CSV value, and set parsed values to the mock structure.
-        // -----------------------------------------------------------------------------
-        // Variables to store parsed values
-        int32_t now_us, mss, rtt_us, tp_rate_interval_us, app_limited, tp_delivered_rate, tp_delivered, lost, retrans, snd_nxt, sk_pacing_rate;
-        int64_t bytes_acked;
-
-        // Parse the CSV line
-        if (sscanf(line, "%u,%llu,%u,%u,%u,%u,%u,%u,%u,%u, %u, %u", &now_us, &bytes_acked, &mss, &rtt_us, &tp_delivered_rate, 
-                &tp_rate_interval_us, &tp_delivered, &lost, &retrans, &app_limited, &snd_nxt, &sk_pacing_rate) != 12) {
-            fprintf(stderr, "Invalid line format at line %d: %s", line_number, line);
-            continue;
-        }
+    // Set parsed values to the mock structure
+    mock_now_us = now_us;
+    tp->t_srtt = (rtt_us << TCP_RTT_SHIFT) / tick;
+    tp->t_maxseg = mss;
+    st->ccv.bytes_this_ack = bytes_acked - st->pre_byte_ack;
+    st->pre_byte_ack = bytes_acked;
 
-        // Set parsed values to the mock structure
-        mock_now_us = now_us;
-        tp->t_srtt = (rtt_us << TCP_RTT_SHIFT) / tick;
-        tp->t_maxseg = mss;
-        ccv.bytes_this_ack = bytes_acked - pre_byte_ack;
-        pre_byte_ack = bytes_acked;
-
-        if (LOSS_FLAG == 0 && lost > 0)
-            LOSS_FLAG = 1;
-
-        // Call protocol-specific update functions
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Call the function(s) to start running your protocol.
-        // -----------------------------------------------------------------------------     
-        search_update(&ccv);
-
-        // -----------------------------------------------------------------------------
-        // ⚠ USER NOTE: Print results and info based on your requirements.
-        // -----------------------------------------------------------------------------
-
-        if ((tp->snd_ssthresh == tp->snd_cwnd) && (EXIT_FLAG == 0)) {
-            printf("Exit Slow Start at %u\n", now_us);
-            EXIT_FLAG = 1;
-        }
+    if (st->LOSS_FLAG == 0 && lost > 0)
+        st->LOSS_FLAG = 1;
 
+    // Call protocol-specific update functions
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Call the function(s) to start running your protocol.
+    // -----------------------------------------------------------------------------     
+    search_update(&st->ccv);
 
-        // Print details
-        printf("Line %d:\n", line_number);
-        printf("  now_us: %u\n", now_us);
-        printf("  bytes_acked: %llu\n", bytes_acked);
-        printf("  mss: %u\n", mss);
-        printf("  rtt_us: %u\n", rtt_us);
-        printf("  scaled_srtt_us: %u\n", tp->t_srtt);
-        printf("  loss happen: %u\n", LOSS_FLAG);
-        printf("  Current bin index: %d\n", nreno->search_curr_idx);
-        printf("  Bin duration: %d\n", nreno->search_bin_duration_us);
-        printf("  Bin end time: %d\n", nreno->search_bin_end_us);
-        printf("  Scale factor: %d\n", nreno->search_scale_factor);
-        // printf("  tp_delivered_rate: %d\n", tp_delivered_rate);
-        // printf("  tp_interval_us: %d\n", tp_rate_interval_us);
+    // -----------------------------------------------------------------------------
+    // ⚠ USER NOTE: Print results and info based on your requirements.
+    // -----------------------------------------------------------------------------
+
+    if ((tp->snd_ssthresh == tp->snd_cwnd) && (st->EXIT_FLAG == 0)) {
+        trace_printf("Exit Slow Start at %u\n", now_us);
+        st->EXIT_FLAG = 1;
+    }
 
-        printf("  Bin values:\n");
 
+    // Print details
+    trace_printf("Line %d:\n", line_number);
+    trace_printf("  now_us: %u\n", now_us);
+    trace_printf("  bytes_acked: %llu\n", bytes_acked);
+    trace_printf("  mss: %u\n", mss);
+    trace_printf("  rtt_us: %u\n", rtt_us);
+    trace_printf("  scaled_srtt_us: %u\n", tp->t_srtt);
+    trace_printf("  loss happen: %u\n", st->LOSS_FLAG);
+    trace_printf("  Current bin index: %d\n", nreno->search_curr_idx);
+    trace_printf("  Bin duration: %d\n", nreno->search_bin_duration_us);
+    trace_printf("  Bin end time: %d\n", nreno->search_bin_end_us);
+    trace_printf("  Scale factor: %d\n", nreno->search_scale_factor);
+    // trace_printf("  tp_delivered_rate: %d\n", tp_delivered_rate);
+    // trace_printf("  tp_interval_us: %d\n", tp_rate_interval_us);
+
+    trace_printf("  Bin values:\n");
+
+    for (int i = 0; i < SEARCH_TOTAL_BINS; i++) {
+        trace_printf("    Bin[%2d]: %u\n", i, nreno->search_bin[i]);
+    }
+    trace_printf("\n");
+
+    if (trace_records()) {
+        trace_record(line_number);
+        trace_record(now_us);
+        trace_record(bytes_acked);
+        trace_record(mss);
+        trace_record(rtt_us);
+        trace_record(tp->t_srtt);
+        trace_record(tp->snd_cwnd);
+        trace_record(tp->snd_ssthresh);
+        trace_record(st->LOSS_FLAG);
+        trace_record(st->EXIT_FLAG);
+        trace_record(nreno->search_curr_idx);
+        trace_record(nreno->search_bin_duration_us);
+        trace_record(nreno->search_bin_end_us);
+        trace_record(nreno->search_scale_factor);
         for (int i = 0; i < SEARCH_TOTAL_BINS; i++) {
-            printf("    Bin[%2d]: %u\n", i, nreno->search_bin[i]);
+            trace_record(nreno->search_bin[i]);
         }
-        printf("\n");
-
-        // if (LOSS_FLAG == 1) {
-        //     printf("Loss detected at line %d, stopping test.\n", line_number);
-        //     break;  // Exit the loop immediately when loss happens!
-        // }
+        trace_record_end();
     }
 
+    // if (st->LOSS_FLAG == 1) {
+    //     trace_printf("Loss detected at line %d, stopping test.\n", line_number);
+    //     return HARNESS_STOP;  // Exit the loop immediately when loss happens!
+    // }
+
+    return HARNESS_CONTINUE;
+}
+
+static void trace_close(struct trace_state *st) {
     // Cleanup
-    free(tp);
-    free(nreno);
-    fclose(file);
-    
-    printf("Finished processing.\n");
-    return 0;
+    free(st->tp);
+    free(st->nreno);
 }
+
+HARNESS_MAIN(struct trace_state, trace_open, trace_row, trace_close, trace_fields)